@@ -2,7 +2,23 @@ from camera_supervisor_helper import *
 from camera_supervisor_components import *
 from camera_supervisor_constants import *
 
+def run_headless():
+    camera_data = load_data_from_yaml(CAMERA_CONFIG_PATH)
+    if not camera_data or not camera_data.get("camera_details"):
+        print("Failed to load camera data from YAML file or no 'camera_details' found.")
+        return
+    from camera_supervisor_engine import SupervisorEngine
+    SupervisorEngine(camera_data).run_forever()
+
 def main():
+    if "--headless" in sys.argv:
+        return run_headless()
+    if len(sys.argv) > 1:
+        # Subcommands (ping, snapshot, record, ...) run non-interactively over camera_details
+        from camera_supervisor_fleet import FLEET_COMMANDS, run_cli
+        if sys.argv[1] in FLEET_COMMANDS + ("-h", "--help"):
+            sys.exit(run_cli(sys.argv[1:]))
+
     print("==========================================")
     print("   Camera Supervisor - Simple Tester      ")
     print("==========================================")
@@ -44,6 +60,7 @@ def main():
     camera_p = get_input("Camera Port", d_port)
     
     tester = CameraSupervisor(ip, user, pwd, camera_port=int(camera_p), onvif_port=int(onvif_p), stream_path=stream)
+    tester.warm_up_onvif()  # connect ONVIF in the background while the menu is shown
     
     # 2. Interactive Menu
     while True:
@@ -61,6 +78,8 @@ def main():
             print("10. [ONVIF] Move Down")
             print("11. [ONVIF] Reboot Camera")
         print("12. Start Person Detection & Recording")
+        print("13. Start Continuous Recording (segmented)")
+        print("14. Stop Continuous Recording")
         print("0. Exit")
         print("--------------------------------------")
         
@@ -89,12 +108,19 @@ def main():
         elif choice == '0':
             if tester.process:
                 tester.stop_video_recording()
+            tester.close()
             print("Exiting...")
             break
             
         elif choice == '12':
             tester.start_person_detection_recording()
 
+        elif choice == '13':
+            tester.start_continuous_recording()
+
+        elif choice == '14':
+            tester.stop_continuous_recording()
+
         # ONVIF Controls
         elif ONVIF_AVAILABLE:
             if choice == '7': tester.move_ptz(-0.5, 0) # Left
@@ -0,0 +1,572 @@
+import os,sys,time,json,shutil,asyncio,platform,resource,tempfile,threading,contextlib,subprocess
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from camera_supervisor_motion import MotionDetector
+from camera_supervisor_grabber import FrameGrabber
+from camera_supervisor_constants import *
+
+# Offline benchmarks run against recorded clips, no camera needed:
+#   python camera_supervisor_benchmark.py motion videos/sample.mp4 [--frames 500] [--output motion.json]
+#   python camera_supervisor_benchmark.py startup [--module camera_supervisor] [--import-budget 1.0] [--rss-budget 150]
+#   python camera_supervisor_benchmark.py replay videos/sample.mp4 --workloads detect,motion --cameras 1,4,8 [--source rtsp]
+#                                            [--duration 30] [--output run.json] [--baseline previous.json]
+#   python camera_supervisor_benchmark.py outage videos/sample.mp4 [--outage 15]    (exit code 1 when a check fails)
+
+
+def load_frames(clip_path, max_frames):
+    """Decodes up to max_frames frames into memory so decode cost is not part of the measurement."""
+    cap = cv2.VideoCapture(clip_path)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    if len(frames) < 2:
+        raise ValueError(f"Could not read at least 2 frames from '{clip_path}'")
+    return frames
+
+
+def legacy_motion(frame1, frame2):
+    # The original CameraSupervisor.detect_motion loop body: full resolution, fresh arrays every step,
+    # RETR_TREE and a Python loop over every contour
+    diff = cv2.absdiff(frame1, frame2)
+    gray = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
+    blur = cv2.GaussianBlur(gray, (5, 5), 0)
+    _, thresh = cv2.threshold(blur, 20, 255, cv2.THRESH_BINARY)
+    dilated = cv2.dilate(thresh, None, iterations=3)
+    contours, _ = cv2.findContours(dilated, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    motion_detected = False
+    for contour in contours:
+        if cv2.contourArea(contour) < 900:
+            continue
+        motion_detected = True
+    return motion_detected
+
+
+def bench_motion(frames, repeat=3):
+    """frames/sec of the legacy frame-pair pipeline vs MotionDetector (both background models) on the same frames."""
+    def timed(step):
+        best, motion_frames = float("inf"), 0
+        for _ in range(repeat):
+            started = time.perf_counter()
+            motion_frames = step()
+            best = min(best, time.perf_counter() - started)
+        return {"fps": (len(frames) - 1) / best, "motion_frames": motion_frames}
+
+    def run_legacy():
+        return sum(legacy_motion(frames[i - 1], frames[i]) for i in range(1, len(frames)))
+
+    def run_detector(model):
+        detector = MotionDetector(model=model)
+        detector.update(frames[0])
+        return sum(bool(detector.update(frame).regions) for frame in frames[1:])
+
+    h, w = frames[0].shape[:2]
+    results = {"frames": len(frames), "resolution": f"{w}x{h}", "legacy": timed(run_legacy)}
+    for model in ("running_average", "mog2"):
+        results[model] = timed(lambda: run_detector(model))
+        results[model]["speedup"] = results[model]["fps"] / results["legacy"]["fps"]
+    return results
+
+
+# Must not be imported just to show the menu: each is loaded by the feature that needs it
+HEAVY_MODULES = ("ultralytics", "torch", "onvif", "zeep", "yaml")
+
+
+def parse_importtime(stderr):
+    """Top-level (cumulative_us, module) entries of `python -X importtime` output."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):    # nested imports are indented under their parent
+            entries.append((int(cumulative), name.strip()))
+    return entries
+
+
+def bench_startup(module="camera_supervisor", import_budget=STARTUP_IMPORT_BUDGET, rss_budget=STARTUP_RSS_BUDGET, repeat=3):
+    """Imports `module` in a fresh interpreter with -X importtime (best of repeat) and checks total import time
+    (seconds) and peak RSS (MB) against the budget. Also lists heavy dependencies that were loaded eagerly."""
+    # ru_maxrss is KB on Linux
+    probe = (f"import sys,json,resource;import {module};"
+             "print(json.dumps({'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, 'modules': sorted(sys.modules)}))")
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", probe], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing '{module}' failed:\n{result.stderr[-2000:]}")
+        entries = parse_importtime(result.stderr)
+        run = {"entries": entries, "total_us": sum(us for us, _ in entries), **json.loads(result.stdout.strip().splitlines()[-1])}
+        if best is None or run["total_us"] < best["total_us"]:
+            best = run
+
+    import_s = best["total_us"] / 1e6
+    rss_mb = best["rss"] / 1e6
+    heavy = sorted({name.split(".")[0] for name in best["modules"]} & set(HEAVY_MODULES))
+    return {
+        "module": module,
+        "import_s": import_s,
+        "rss_mb": rss_mb,
+        "slowest": [{"module": name, "ms": us / 1000} for us, name in sorted(best["entries"], reverse=True)[:10]],
+        "heavy_loaded": heavy,
+        "budget": {"import_s": import_budget, "rss_mb": rss_budget},
+        "within_budget": import_s <= import_budget and rss_mb <= rss_budget and not heavy,
+    }
+
+
+class PacedCapture:
+    """cv2.VideoCapture over a recorded clip that behaves like a live camera: frames come at the clip's own rate
+    (times speed) and the clip loops at the end instead of ending the stream."""
+
+    def __init__(self, path, speed=1.0):
+        self.cap = cv2.VideoCapture(path)
+        fps = self.cap.get(cv2.CAP_PROP_FPS) or 0.0
+        self.fps = fps if 0 < fps <= 60 else 20.0
+        self.interval = 1.0 / (self.fps * speed)
+        self.next_time = time.perf_counter()
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def get(self, prop):
+        return self.fps if prop == cv2.CAP_PROP_FPS else self.cap.get(prop)
+
+    def grab(self):
+        delay = self.next_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        # A slow reader falls behind the schedule like a real stream would, it does not get a burst to catch up
+        self.next_time = max(self.next_time, time.perf_counter() - self.interval) + self.interval
+        if self.cap.grab():
+            return True
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        return self.cap.grab()
+
+    def retrieve(self):
+        return self.cap.retrieve()
+
+    def release(self):
+        self.cap.release()
+
+
+class ReplayGrabber(FrameGrabber):
+    """FrameGrabber reading a PacedCapture, so everything downstream runs exactly as on a camera stream."""
+
+    def __init__(self, clip_path, speed=1.0, **kwargs):
+        super().__init__(clip_path, **kwargs)
+        self.speed = speed
+
+    def open_capture(self):
+        cap = PacedCapture(self.rtsp_url, self.speed)
+        if not cap.isOpened():
+            cap.release()
+            return None
+        self.fps = cap.fps
+        return cap
+
+
+def wait_until(probe, what, timeout=BENCH_READY_TIMEOUT):
+    """Retries the async probe() until it succeeds; RuntimeError after timeout seconds."""
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return asyncio.run(probe())
+        except (OSError, ValueError, IndexError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            if time.time() > deadline:
+                raise RuntimeError(f"{what} did not come up within {timeout}s")
+            time.sleep(0.2)
+
+
+def start_publisher(clip_path, port, path, timeout=BENCH_READY_TIMEOUT):
+    """One simulated camera: `ffmpeg -re` looping the clip into rtsp://127.0.0.1:<port>/<path>. Returns once the path answers DESCRIBE."""
+    from camera_supervisor_health import probe_rtsp
+    process = subprocess.Popen(["ffmpeg", "-re", "-stream_loop", "-1", "-i", clip_path, "-an", "-c", "copy", "-f", "rtsp",
+                                "-rtsp_transport", "tcp", f"rtsp://127.0.0.1:{port}/{path}"],
+                               stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until(lambda: probe_rtsp("127.0.0.1", port, path, "", ""), f"Stream '{path}'", timeout)
+    except RuntimeError:
+        stop_processes([process])
+        raise
+    return process
+
+
+def start_rtsp_server(clip_path, count, port=BENCH_RTSP_PORT, server=BENCH_RTSP_SERVER, timeout=BENCH_READY_TIMEOUT):
+    """Local stand-in for `count` cameras: an RTSP server plus one publisher per path (cam0, cam1, ...). The clip
+    must be in a codec RTSP can carry as is (H.264/H.265). Returns (processes, paths); processes[i + 1] publishes
+    paths[i], so a camera outage is stop_processes([processes[i + 1]]) and start_publisher() again."""
+    from camera_supervisor_health import probe_tcp
+    processes = [subprocess.Popen(server.split(), env={**os.environ, "MTX_RTSPADDRESS": f":{port}"},
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)]
+    paths = [f"cam{i}" for i in range(count)]
+    try:
+        wait_until(lambda: probe_tcp("127.0.0.1", port), f"RTSP server '{server}'", timeout)
+        for path in paths:
+            processes.append(start_publisher(clip_path, port, path, timeout))
+    except RuntimeError:
+        stop_processes(processes)
+        raise
+    return processes, paths
+
+
+def stop_processes(processes):
+    for process in reversed(processes):
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def rss_mb():
+    """Current RSS of this process in MB (Linux), peak RSS where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3     # KB on Linux
+
+
+class ResourceSampler:
+    """CPU time of this process (all threads) and its reaped children (ffmpeg) plus sampled RSS between start() and stop()."""
+
+    def __init__(self, interval=BENCH_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.rss_peak = 0.0
+        self.thread = None
+
+    def sample(self):
+        while True:
+            self.rss_peak = max(self.rss_peak, rss_mb())
+            if self.stop_event.wait(self.interval):
+                return
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.usage = (resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN))
+        self.rss_start = rss_mb()
+        self.thread = threading.Thread(target=self.sample, name="bench-sampler", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        wall = time.perf_counter() - self.started
+        cpu = lambda before, after: (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+        own = cpu(self.usage[0], resource.getrusage(resource.RUSAGE_SELF))
+        children = cpu(self.usage[1], resource.getrusage(resource.RUSAGE_CHILDREN))
+        return {"wall_s": wall, "cpu_s": own, "cpu_pct": own / wall * 100, "children_cpu_s": children,
+                "rss_mb_start": self.rss_start, "rss_mb_peak": max(self.rss_peak, rss_mb())}
+
+
+def percentiles(latencies):
+    """p50/p95/p99 in ms of latencies in seconds."""
+    values = sorted(latencies)
+    pick = lambda q: values[min(int(len(values) * q), len(values) - 1)] * 1000 if values else None
+    return {"latency_p50_ms": pick(0.5), "latency_p95_ms": pick(0.95), "latency_p99_ms": pick(0.99)}
+
+
+# Workloads: run(camera, duration, args) on one camera for duration seconds, in its own thread.
+# Each returns {"ops": frames or operations done, "latencies": [seconds], ...}.
+def workload_detect(camera, duration, args):
+    from camera_supervisor_person_detection import send_detect_events
+    from camera_supervisor_engine import PipelineStats
+
+    class RunStats(PipelineStats):
+        # PipelineStats only keeps the last PIPELINE_LATENCY_SAMPLES latencies, the benchmark needs every frame
+        def __init__(self):
+            super().__init__()
+            self.latencies = []
+
+        def record_frame(self, latency, *args, **kwargs):
+            self.latencies.append(latency)
+            super().record_frame(latency, *args, **kwargs)
+    stats = RunStats()
+    stop_event = threading.Event()
+    timer = threading.Timer(duration, stop_event.set)
+    timer.start()
+    try:
+        send_detect_events("bench", "", camera.ip, camera.camera_port, stop_event=stop_event, display=False, stats=stats, tag=camera.name,
+                           output_dir=os.path.join(camera.video_dir, camera.name), grabber=camera.get_grabber(), cascade=args.cascade,
+                           recording_mode=args.recording_mode if args.source == "rtsp" else "frames")
+    finally:
+        timer.cancel()
+    snapshot = stats.snapshot()
+    # Capture-to-decision latency of every frame processed during the run
+    return {"ops": snapshot["frames"], "inferences": snapshot["inferences"], "dropped": snapshot["dropped"], "latencies": stats.latencies}
+
+
+def workload_motion(camera, duration, args):
+    latencies = []
+    summary = camera.detect_motion(duration, on_frame=lambda frame_time, result: latencies.append(time.time() - frame_time))
+    return {"ops": summary["frames"], "motion_frames": summary["motion_frames"], "latencies": latencies}
+
+
+def workload_snapshot(camera, duration, args):
+    # Back to back into one file per camera, so the run does not fill the disk
+    path = os.path.join(camera.image_dir, f"{camera.name}.jpg")
+    latencies, failed = [], 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        started = time.perf_counter()
+        if camera.capture_image(path):
+            latencies.append(time.perf_counter() - started)
+        else:
+            failed += 1
+    return {"ops": len(latencies), "failed": failed, "latencies": latencies}
+
+
+def workload_record(camera, duration, args):
+    # The ffmpeg stream-copy path; its CPU shows up under children_cpu_s
+    path = os.path.join(camera.video_dir, f"{camera.name}.mp4")
+    started = time.perf_counter()
+    if not camera.start_video_recording(filename=path, duration=duration):
+        return {"ops": 0, "latencies": []}
+    process = camera.process
+    try:
+        process.wait(timeout=duration + FLEET_RECORD_GRACE)
+    except subprocess.TimeoutExpired:
+        pass
+    camera.stop_video_recording()
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    return {"ops": int(size > 0), "bytes": size, "latencies": [time.perf_counter() - started]}
+
+
+WORKLOADS = {"detect": workload_detect, "motion": workload_motion, "snapshot": workload_snapshot, "record": workload_record}
+
+
+def bench_replay_step(clip_path, workload, count, source, duration, args, output_dir):
+    """Runs `workload` on `count` simulated cameras at once and returns throughput, latency, CPU and RSS."""
+    from camera_supervisor_components import CameraSupervisor
+    if workload == "record" and source != "rtsp":
+        raise ValueError("the record workload records an RTSP stream, use --source rtsp")
+    processes, cameras = [], []
+    try:
+        if source == "rtsp":
+            processes, paths = start_rtsp_server(clip_path, count, args.rtsp_port, args.rtsp_server)
+        for i in range(count):
+            if source == "rtsp":
+                camera = CameraSupervisor("127.0.0.1", "bench", "bench", args.rtsp_port, 0, paths[i], name=f"cam{i}")
+            else:
+                camera = CameraSupervisor("127.0.0.1", "bench", "bench", 0, 0, clip_path, name=f"cam{i}")
+                camera.grabber = ReplayGrabber(clip_path, args.speed, name=f"REPLAY cam{i}", label=camera.name)
+            camera.image_dir = camera.video_dir = output_dir
+            cameras.append(camera)
+        # Streams up and a first frame decoded before the clock starts
+        for camera in cameras:
+            if camera.get_grabber().latest(timeout=BENCH_READY_TIMEOUT) is None:
+                raise RuntimeError(f"No frames from {camera.name}")
+        if workload == "detect":
+            from camera_supervisor_inference import get_inference_service
+            get_inference_service()     # model loaded before measuring
+
+        sampler = ResourceSampler().start()
+        with ThreadPoolExecutor(max_workers=count) as pool:
+            results = list(pool.map(lambda camera: WORKLOADS[workload](camera, duration, args), cameras))
+        usage = sampler.stop()
+    finally:
+        for camera in cameras:
+            camera.close()
+        stop_processes(processes)
+
+    latencies = [latency for result in results for latency in result.pop("latencies")]
+    ops = sum(result["ops"] for result in results)
+    return {
+        "workload": workload,
+        "source": source,
+        "cameras": count,
+        "ops": ops,
+        "throughput_per_s": ops / usage["wall_s"],
+        "per_camera_per_s": ops / usage["wall_s"] / count,
+        **percentiles(latencies),
+        **usage,
+        "per_camera": {camera.name: result for camera, result in zip(cameras, results)},
+    }
+
+
+def bench_replay(clip_path, workloads, counts, source="file", duration=BENCH_DURATION, args=None):
+    """Every workload at every camera count, each on fresh streams. Returns the JSON-ready report."""
+    output_dir = tempfile.mkdtemp(prefix="camera_bench_")
+    cap = cv2.VideoCapture(clip_path)
+    clip = {"path": clip_path, "fps": cap.get(cv2.CAP_PROP_FPS), "resolution": f"{int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}"}
+    cap.release()
+    try:
+        runs = []
+        for workload in workloads:
+            for count in counts:
+                print(f"[BENCH] {workload} x{count} ({source}) for {duration}s...", file=sys.stderr)
+                runs.append(bench_replay_step(clip_path, workload, count, source, duration, args, output_dir))
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return {
+        "clip": clip,
+        "duration_s": duration,
+        "host": {"python": platform.python_version(), "opencv": cv2.__version__, "cpus": os.cpu_count(), "machine": platform.machine()},
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "runs": runs,
+    }
+
+
+def compare_reports(baseline, report):
+    """Throughput and p95 latency change (%) of every run in report against the same workload/source/cameras in baseline."""
+    key = lambda run: (run["workload"], run["source"], run["cameras"])
+    previous = {key(run): run for run in baseline.get("runs", [])}
+    change = lambda old, new: (new - old) / old * 100 if old and new is not None else None
+    return [{"workload": run["workload"], "source": run["source"], "cameras": run["cameras"],
+             "throughput_change_pct": change(previous[key(run)]["throughput_per_s"], run["throughput_per_s"]),
+             "latency_p95_change_pct": change(previous[key(run)]["latency_p95_ms"], run["latency_p95_ms"]),
+             "cpu_change_pct": change(previous[key(run)]["cpu_pct"], run["cpu_pct"])}
+            for run in report["runs"] if key(run) in previous]
+
+
+class PersonEverywhere:
+    """Detection stand-in for the outage check: reports a person filling every frame, so a clip is always open
+    when the stream goes away. The check is about the stream path, not the model."""
+
+    def detect(self, frame, camera=None, timeout=None):
+        return [(0, 0, frame.shape[1], frame.shape[0], 1.0)]
+
+    def detect_many(self, frames, camera=None, timeout=None):
+        return [self.detect(frame) for frame in frames]
+
+
+def bench_outage(clip_path, before=10.0, outage=15.0, after=15.0, port=BENCH_RTSP_PORT, server=BENCH_RTSP_SERVER):
+    """Kills one simulated camera's stream mid-recording and restarts it after `outage` seconds, with detection
+    running as the engine runs it. Passes when the grabber reconnected and counted the downtime, the open clip was
+    closed during the outage, and detection resumed in the same send_detect_events call (no worker restart)."""
+    from camera_supervisor_components import CameraSupervisor
+    from camera_supervisor_person_detection import send_detect_events
+    from camera_supervisor_engine import PipelineStats
+    from camera_supervisor_events import EventBus, CallbackSink
+    processes, (path,) = start_rtsp_server(clip_path, 1, port, server)
+    output_dir = tempfile.mkdtemp(prefix="camera_outage_")
+    clips = []      # (time saved, path)
+
+    def on_event(event):
+        if event["type"] == "clip":
+            clips.append((event["timestamp"], event["clip"]))
+    events = EventBus([CallbackSink(on_event)], max_wait=0).start()
+    camera = CameraSupervisor("127.0.0.1", "bench", "bench", port, 0, path, name="cam0")
+    camera.image_dir = camera.video_dir = output_dir
+    stats = PipelineStats()
+    stop_event = threading.Event()
+    worker = threading.Thread(target=send_detect_events, name="outage-detect", daemon=True, kwargs=dict(
+        camera_id="bench", password="", ip_address=camera.ip, port=port, stop_event=stop_event, display=False, stats=stats,
+        tag=camera.name, output_dir=output_dir, grabber=camera.get_grabber(), inference=PersonEverywhere(), recording_mode="frames",
+        pre_roll=0, events=events))
+    try:
+        worker.start()
+        time.sleep(before)
+        grabber = camera.grabber
+        frames_before, capture_before = stats.frames, grabber.counters()
+        print(f"[BENCH] Killing stream '{path}' for {outage}s...", file=sys.stderr)
+        killed = time.time()
+        stop_processes([processes.pop()])
+        time.sleep(outage)
+        restarted = time.time()
+        processes.append(start_publisher(clip_path, port, path))
+        frames_restarted = stats.frames
+        time.sleep(after)
+        frames_after, capture_after = stats.frames, grabber.counters()
+        loop_alive = worker.is_alive()
+    finally:
+        stop_event.set()
+        worker.join(SUPERVISOR_SHUTDOWN_TIMEOUT)
+        events.stop()
+        camera.close()
+        stop_processes(processes)
+    closed = [(t, p) for t, p in clips if killed <= t < restarted and p and os.path.exists(p) and os.path.getsize(p) > 0]
+    checks = {
+        "reconnected": capture_after["reconnects"] > capture_before["reconnects"],
+        "downtime_counted": capture_after["downtime_s"] > capture_before["downtime_s"],
+        "clip_closed_during_outage": bool(closed),
+        "detection_resumed": loop_alive and frames_after > frames_restarted,
+    }
+    shutil.rmtree(output_dir, ignore_errors=True)
+    return {
+        "outage_s": outage,
+        "frames": {"before_outage": frames_before, "at_restart": frames_restarted, "end": frames_after},
+        "capture_before": capture_before,
+        "capture_after": capture_after,
+        "clip_closed_after_s": closed[0][0] - killed if closed else None,
+        "checks": checks,
+        "ok": all(checks.values()),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Offline camera supervisor benchmarks on recorded clips.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    motion = commands.add_parser("motion", help="Legacy vs rewritten motion detector frames/sec")
+    motion.add_argument("clip")
+    motion.add_argument("--frames", type=int, default=300)
+    motion.add_argument("--repeat", type=int, default=3)
+    motion.add_argument("--output", help="Write the JSON results here")
+    startup = commands.add_parser("startup", help="Import time and RSS of the CLI against a budget (exit code 1 when over)")
+    startup.add_argument("--module", default="camera_supervisor")
+    startup.add_argument("--import-budget", type=float, default=STARTUP_IMPORT_BUDGET, help="seconds")
+    startup.add_argument("--rss-budget", type=float, default=STARTUP_RSS_BUDGET, help="MB")
+    startup.add_argument("--repeat", type=int, default=3)
+    startup.add_argument("--output", help="Write the JSON results here")
+    replay = commands.add_parser("replay", help="Throughput, latency, CPU and RSS of the capture paths on 1..N replayed cameras")
+    replay.add_argument("clip")
+    replay.add_argument("--workloads", default="detect", help=f"Comma-separated: {', '.join(WORKLOADS)}")
+    replay.add_argument("--cameras", default="1", help="Comma-separated simulated camera counts, e.g. 1,2,4,8")
+    replay.add_argument("--source", choices=("file", "rtsp"), default="file",
+                        help="file: decode the clip in-process at its own rate; rtsp: serve it through a local RTSP server")
+    replay.add_argument("--duration", type=float, default=BENCH_DURATION, help="Seconds per workload and camera count")
+    replay.add_argument("--speed", type=float, default=1.0, help="file source: playback rate multiplier")
+    replay.add_argument("--cascade", action="store_true", help="detect: motion-gated inference")
+    replay.add_argument("--recording-mode", choices=("packet", "frames"), default=RECORDING_MODE, help="detect: event clip recorder (rtsp source)")
+    replay.add_argument("--rtsp-server", default=BENCH_RTSP_SERVER, help="Command starting the local RTSP server")
+    replay.add_argument("--rtsp-port", type=int, default=BENCH_RTSP_PORT)
+    replay.add_argument("--baseline", help="Earlier replay JSON to compare against")
+    replay.add_argument("--output", help="Write the JSON results here")
+    outage = commands.add_parser("outage", help="Kill and restart a local RTSP stream under detection, check it heals (exit code 1 when not)")
+    outage.add_argument("clip")
+    outage.add_argument("--before", type=float, default=10.0, help="Seconds of detection before the kill")
+    outage.add_argument("--outage", type=float, default=15.0, help=f"Seconds the stream stays down (over {GRABBER_STALL_TIMEOUT}s to trigger the stall)")
+    outage.add_argument("--after", type=float, default=15.0, help="Seconds of detection after the restart")
+    outage.add_argument("--rtsp-server", default=BENCH_RTSP_SERVER, help="Command starting the local RTSP server")
+    outage.add_argument("--rtsp-port", type=int, default=BENCH_RTSP_PORT)
+    outage.add_argument("--output", help="Write the JSON results here")
+    args = parser.parse_args()
+
+    cv2.setNumThreads(1)    # per-camera conditions, the engine runs with one OpenCV thread
+    if args.command == "motion":
+        report = bench_motion(load_frames(args.clip, args.frames), args.repeat)
+    elif args.command == "startup":
+        report = bench_startup(args.module, args.import_budget, args.rss_budget, args.repeat)
+    elif args.command == "replay":
+        workloads = [w.strip() for w in args.workloads.split(",") if w.strip()]
+        unknown = [w for w in workloads if w not in WORKLOADS]
+        if unknown:
+            parser.error(f"unknown workload(s): {', '.join(unknown)}")
+        # Pipeline logs go to stderr, stdout is kept for the JSON report
+        with contextlib.redirect_stdout(sys.stderr):
+            report = bench_replay(args.clip, workloads, [int(n) for n in args.cameras.split(",")], args.source, args.duration, args)
+        if args.baseline:
+            with open(args.baseline) as f:
+                report["vs_baseline"] = compare_reports(json.load(f), report)
+    elif args.command == "outage":
+        with contextlib.redirect_stdout(sys.stderr):
+            report = bench_outage(args.clip, args.before, args.outage, args.after, args.rtsp_port, args.rtsp_server)
+    else:
+        sys.exit(1)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.command == "startup" and not report["within_budget"]:
+        sys.exit(1)
+    if args.command == "outage" and not report["ok"]:
+        sys.exit(1)
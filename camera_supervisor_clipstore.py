@@ -0,0 +1,203 @@
+import os,struct,bisect,threading
+from camera_supervisor_constants import *
+from camera_supervisor_recording import Segment, SegmentRecorder, concat_segments
+from camera_supervisor_retention import record_file
+
+# index.bin: one fixed-size record per segment, appended in time order:
+#   start (float64, epoch s) | end (float64) | size (uint64 bytes) | segment file name (48 bytes, utf-8, NUL padded)
+INDEX_RECORD = struct.Struct("<ddQ48s")
+INDEX_NAME = "index.bin"
+
+
+def iter_boxes(f, start, end):
+    """(type, payload offset, box end) for each ISO-BMFF box in f between byte offsets start and end."""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size, header = struct.unpack(">Q", f.read(8))[0], 16
+        elif size == 0:         # box runs to the end of its parent
+            size = end - offset
+        if size < header:
+            return
+        yield kind, offset + header, min(offset + size, end)
+        offset += size
+
+
+def read_box(f, start, end, *path):
+    """Payload of the first box along path (e.g. b"mdia", b"mdhd") below [start, end), or None."""
+    for kind in path:
+        for box, body, box_end in iter_boxes(f, start, end):
+            if box == kind:
+                start, end = body, box_end
+                break
+        else:
+            return None
+    f.seek(start)
+    return f.read(end - start)
+
+
+def fragment_offsets(path):
+    """[(seconds since the first fragment, byte offset of its moof box)] for the video track of a fragmented MP4,
+    or [] when the file has no fragments. Segments are written with one fragment per keyframe, so every offset
+    is a point a player can start decoding from."""
+    fragments = []
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        video, timescale = None, None
+        for kind, body, end in iter_boxes(f, 0, size):
+            if kind == b"moov":
+                for box, trak, trak_end in iter_boxes(f, body, end):
+                    if box != b"trak" or read_box(f, trak, trak_end, b"mdia", b"hdlr")[8:12] != b"vide":
+                        continue
+                    tkhd = read_box(f, trak, trak_end, b"tkhd")
+                    mdhd = read_box(f, trak, trak_end, b"mdia", b"mdhd")
+                    video = struct.unpack_from(">I", tkhd, 20 if tkhd[0] == 1 else 12)[0]
+                    timescale = struct.unpack_from(">I", mdhd, 20 if mdhd[0] == 1 else 12)[0]
+                    break
+            elif kind == b"moof" and video is not None:
+                for box, traf, traf_end in iter_boxes(f, body, end):
+                    if box != b"traf" or struct.unpack_from(">I", read_box(f, traf, traf_end, b"tfhd"), 4)[0] != video:
+                        continue
+                    tfdt = read_box(f, traf, traf_end, b"tfdt")
+                    if tfdt is not None:
+                        decode_time = struct.unpack_from(">Q" if tfdt[0] == 1 else ">I", tfdt, 4)[0]
+                        fragments.append((decode_time / timescale, body - 8))
+    if fragments:
+        first = fragments[0][0]
+        fragments = [(t - first, offset) for t, offset in fragments]
+    return fragments
+
+
+class ClipStore:
+    """Time-indexed store of continuous-recording segments for one camera directory. The compact on-disk index
+    is read once when the store opens and appended to as segments complete, so range queries are a bisect
+    over memory and never scan the filesystem."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_NAME)
+        self.lock = threading.Lock()
+        self.starts = []        # segment start times, sorted, parallel to self.entries
+        self.entries = []       # (Segment, size)
+        self.fragments = {}     # segment path -> fragment_offsets(), filled in by locate()
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        usable = len(data) - len(data) % INDEX_RECORD.size    # ignore a torn last record
+        for start, end, size, name in INDEX_RECORD.iter_unpack(data[:usable]):
+            self.insert(Segment(os.path.join(self.directory, name.rstrip(b"\0").decode()), start, end), size)
+
+    def insert(self, segment, size):
+        i = bisect.bisect_right(self.starts, segment.start)
+        self.starts.insert(i, segment.start)
+        self.entries.insert(i, (segment, size))
+
+    def add(self, segment):
+        """Registers a completed segment (SegmentRecorder.on_segment callback)."""
+        try:
+            size = os.path.getsize(segment.path)
+        except OSError:
+            return
+        name = os.path.basename(segment.path).encode()
+        if len(name) > 48:
+            raise ValueError(f"Segment name too long for the index: {name!r}")
+        with self.lock:
+            with open(self.index_path, "ab") as f:
+                f.write(INDEX_RECORD.pack(segment.start, segment.end, size, name))
+            self.insert(segment, size)
+        record_file(segment.path, size)
+
+    def remove(self, paths):
+        """Drops deleted segments from the index (RetentionManager.on_delete callback). Paths outside this store
+        are ignored; the index file is rewritten atomically only when something was removed."""
+        paths = {os.path.abspath(p) for p in paths}
+        with self.lock:
+            keep = [i for i, (segment, _) in enumerate(self.entries) if os.path.abspath(segment.path) not in paths]
+            if len(keep) == len(self.entries):
+                return 0
+            removed = len(self.entries) - len(keep)
+            self.entries = [self.entries[i] for i in keep]
+            for path in paths:
+                self.fragments.pop(path, None)
+            self.starts = [segment.start for segment, _ in self.entries]
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                for segment, size in self.entries:
+                    f.write(INDEX_RECORD.pack(segment.start, segment.end, size, os.path.basename(segment.path).encode()))
+            os.replace(tmp_path, self.index_path)
+            return removed
+
+    def query(self, start, end):
+        """Segments overlapping [start, end), oldest first."""
+        with self.lock:
+            # The segment that starts before `start` may still cover it
+            i = max(bisect.bisect_right(self.starts, start) - 1, 0)
+            result = []
+            while i < len(self.entries) and self.entries[i][0].start < end:
+                segment = self.entries[i][0]
+                if segment.end > start:
+                    result.append(segment)
+                i += 1
+            return result
+
+    def locate(self, timestamp):
+        """(segment, byte offset) for a moment in time, or (None, 0). The offset is that of the keyframe fragment
+        holding the timestamp, read from the segment's moof boxes on first use; 0 for unfragmented segments."""
+        with self.lock:
+            i = bisect.bisect_right(self.starts, timestamp) - 1
+            if i < 0:
+                return None, 0
+            segment = self.entries[i][0]
+            if timestamp >= segment.end:
+                return None, 0
+            key = os.path.abspath(segment.path)
+            fragments = self.fragments.get(key)
+        if fragments is None:
+            try:
+                fragments = fragment_offsets(segment.path)
+            except (OSError, struct.error, TypeError):     # missing file or malformed boxes
+                return segment, 0
+            with self.lock:
+                self.fragments[key] = fragments
+        j = bisect.bisect_right(fragments, (timestamp - segment.start, float("inf"))) - 1
+        return segment, fragments[j][1] if j >= 0 else 0
+
+    def for_event(self, timestamp, pre_roll, post_roll):
+        """Segments around a detection event."""
+        return self.query(timestamp - pre_roll, timestamp + post_roll)
+
+    def export(self, start, end, output_path, tag="CLIPSTORE"):
+        """Joins the segments covering [start, end) into one MP4 without re-encoding. Returns the path or None."""
+        segments = self.query(start, end)
+        if not segments:
+            return None
+        return output_path if concat_segments(segments, output_path, tag) else None
+
+    def span(self):
+        """(first start, last end) of the indexed footage, or (None, None)."""
+        with self.lock:
+            if not self.entries:
+                return None, None
+            return self.entries[0][0].start, self.entries[-1][0].end
+
+    def total_bytes(self):
+        with self.lock:
+            return sum(size for _, size in self.entries)
+
+
+def create_continuous_recorder(rtsp_url, directory, segment_time=CONTINUOUS_SEGMENT_TIME, tag="DETECT"):
+    """A SegmentRecorder that keeps every segment in `directory` and indexes it in a ClipStore.
+    Returns (segmenter, store); call segmenter.start() / segmenter.stop()."""
+    store = ClipStore(directory)
+    segmenter = SegmentRecorder(rtsp_url, directory, segment_time, tag, keep=CONTINUOUS_MEMORY_WINDOW, delete_pruned=False)
+    segmenter.on_segment.append(store.add)
+    return segmenter, store
@@ -4,3 +4,134 @@
 CAMERA_CONFIG_PATH = "data/test_camera_config.yml"
 
 # Server Details
+
+# Headless Supervisor Engine (overridable from the `supervisor` section of the camera YAML)
+SUPERVISOR_MAX_FPS = 10             # Max frames/sec each camera worker processes (bounds CPU per camera)
+SUPERVISOR_OPENCV_THREADS = 1       # cv2.setNumThreads() for the whole process, keeps N cameras from oversubscribing cores
+SUPERVISOR_STATS_INTERVAL = 30      # Seconds between aggregate stats log lines
+SUPERVISOR_RESTART_DELAY = 5        # Seconds before a crashed/finished camera worker is restarted
+SUPERVISOR_SHUTDOWN_TIMEOUT = 10    # Seconds to wait for each worker to stop on shutdown
+PIPELINE_LATENCY_SAMPLES = 1000     # Recent capture-to-decision latencies kept per camera for p50/p95
+
+# Shared Frame Grabber
+GRABBER_RECONNECT_DELAY = 2         # Base seconds before reconnecting when the RTSP session drops (doubles per failed attempt, jittered)
+GRABBER_READ_TIMEOUT = 10           # Seconds a consumer waits for a frame (covers the initial RTSP handshake)
+GRABBER_STALE_AFTER = 2             # A held frame older than this is not treated as "live"
+GRABBER_DROP_POLICY = "latest"      # "latest": decode only frames a consumer asks for | "all": decode every frame
+GRABBER_STALL_TIMEOUT = 5           # Seconds without a packet before the session counts as stalled and is reopened
+GRABBER_MAX_BACKOFF = 60            # Longest wait between reconnect attempts
+
+# Shared Inference Service (overridable from the `inference` section of the camera YAML)
+INFERENCE_MODEL = "yolov8n.pt"
+INFERENCE_CONF = 0.5                # Minimum person confidence
+INFERENCE_MAX_BATCH = 8             # Max frames per batched forward pass
+INFERENCE_MAX_WAIT = 0.02           # Seconds to wait for more frames after the first one arrives
+INFERENCE_QUEUE_SIZE = 64           # Pending frames across all cameras before new ones are dropped
+INFERENCE_TIMEOUT = 10              # Seconds a camera waits for its result
+
+# Detection Backends (see camera_supervisor_detectors.py)
+DETECTOR_BACKEND = "ultralytics"    # "ultralytics" | "onnxruntime" | "opencv", per camera via `detection_backend`
+DETECTOR_INPUT_SIZE = 640           # ONNX export / letterbox size
+DETECTOR_NMS_IOU = 0.45
+DETECTOR_THREADS = 0                # onnxruntime intra-op threads, 0 lets onnxruntime decide
+
+# Adaptive Frame Scheduler (overridable from the `scheduler` section of the camera YAML, or per camera)
+SCHEDULER_IDLE_INTERVAL = 1.0       # Seconds between inferences while nothing is happening
+SCHEDULER_ACTIVE_INTERVAL = 0.0     # Seconds between inferences while a person/motion is present (0 = every frame)
+SCHEDULER_ACTIVE_HOLD = 5.0         # Seconds to stay active after the last person/motion
+SCHEDULER_INFERENCE_BUDGET = 0.5    # Max seconds of inference per second per camera
+SCHEDULER_LOAD_THRESHOLD = 0.9      # 1-min load average per core that counts as CPU pressure
+SCHEDULER_MAX_BACKOFF = 8           # Max multiplier applied to the interval under CPU pressure
+SCHEDULER_PRESSURE_CHECK = 5        # Seconds between load average checks
+SCHEDULER_LOG_INTERVAL = 60         # Seconds between per-camera inference rate log lines (0 disables)
+
+# Motion Stage / Motion-Gated Cascade
+MOTION_WIDTH = 320                  # Motion runs on a copy downscaled to this width
+MOTION_THRESHOLD = 20               # Pixel difference that counts as changed
+MOTION_MIN_AREA_RATIO = 0.001       # Smallest moving area, as a fraction of the frame (~900px at 1280x720)
+MOTION_MODEL = "running_average"    # Background model: "running_average" | "mog2"
+MOTION_LEARNING_RATE = 0.05         # How fast the background absorbs changes (per frame)
+CASCADE_CROP_MARGIN = 0.25          # Padding added around motion regions before cropping, fraction of region size
+CASCADE_MIN_CROP = 160              # Smallest crop side in pixels
+CASCADE_MAX_CROPS = 2               # More regions than this and the full frame is sent instead (each crop is a full forward pass)
+CASCADE_MAX_CROP_RATIO = 0.5        # Crops covering more than this fraction of the frame fall back to the full frame
+
+# Event Recording
+RECORDING_PRE_ROLL = 5              # Seconds of footage before the first detection included in each clip
+RECORDING_POST_ROLL = 5             # Seconds to keep recording after the last detection
+RECORDING_BUFFER_BYTES = 8 * 1024 * 1024    # Hard cap on the pre-roll buffer per camera
+RECORDING_BUFFER_QUALITY = 80       # JPEG quality of buffered pre-roll frames
+RECORDING_MODE = "packet"           # "packet": stream copy via a persistent ffmpeg segmenter | "frames": re-encode processed frames
+RECORDING_SEGMENT_TIME = 2          # Seconds per segment of the packet recorder (cuts land on the next keyframe)
+RECORDING_SEGMENT_LIST_SIZE = 30    # Entries ffmpeg keeps in a segmenter's segments.csv (rewritten each segment, never grows)
+
+# Continuous Recording / Clip Store
+CONTINUOUS_SEGMENT_TIME = 10        # Seconds per continuous-recording segment (also the event clip granularity when shared)
+CONTINUOUS_MEMORY_WINDOW = 600      # Seconds of recent segments the segmenter tracks in memory for event clips
+
+# Storage Retention
+RETENTION_GLOBAL_QUOTA = 0          # Bytes for images/ + videos/ together (0 = no limit)
+RETENTION_CAMERA_QUOTA = 0          # Bytes per camera (0 = no limit)
+RETENTION_MAX_AGE = {               # Seconds each kind of file is kept (None = until a quota needs the space)
+    "event": 30 * 86400,            # person detection clips
+    "continuous": 3 * 86400,        # continuous-recording segments
+    "image": 14 * 86400,            # snapshots
+    "manual": None,                 # recordings started from the menu
+}
+RETENTION_INTERVAL = 60             # Seconds between prune passes
+RETENTION_BATCH = 20                # Files deleted per batch
+RETENTION_BATCH_PAUSE = 0.5         # Seconds between delete batches
+
+# ONVIF Control Plane
+ONVIF_WORKERS = 4                   # Threads running ONVIF calls for all cameras
+ONVIF_TIMEOUT = 10                  # Seconds per SOAP request
+
+# Startup Budget (camera_supervisor_benchmark.py startup)
+STARTUP_IMPORT_BUDGET = 1.0         # Seconds to import the CLI, before the menu appears
+STARTUP_RSS_BUDGET = 150            # MB peak RSS after importing the CLI
+
+# Replay Benchmark (camera_supervisor_benchmark.py replay)
+BENCH_DURATION = 30                 # Seconds measured per workload and camera count
+BENCH_RTSP_SERVER = "mediamtx"      # Local RTSP server command standing in for the cameras
+BENCH_RTSP_PORT = 8554
+BENCH_READY_TIMEOUT = 20            # Seconds for the stand-in streams (and first frames) to come up
+BENCH_SAMPLE_INTERVAL = 0.5         # Seconds between RSS samples
+
+# Fleet CLI
+FLEET_PARALLEL = 16                 # Cameras handled at once by batch commands
+FLEET_RECORD_GRACE = 15             # Extra seconds a timed recording may take to connect and finalize
+
+# Health Monitor
+HEALTH_INTERVAL = 30                # Seconds between checks of an online camera
+HEALTH_TCP_TIMEOUT = 2              # Seconds for the TCP connect tier
+HEALTH_RTSP_TIMEOUT = 4             # Seconds for the RTSP OPTIONS/DESCRIBE tier
+HEALTH_DECODE_TIMEOUT = 10          # Seconds for the frame decode tier
+HEALTH_DECODE_INTERVAL = 600        # Seconds between decode checks of cameras without a running grabber
+HEALTH_MAX_BACKOFF = 600            # Longest wait between checks of an offline camera
+HEALTH_CONCURRENCY = 32             # Checks in flight at once
+HEALTH_HISTORY = 120                # Check results kept per camera
+HEALTH_TICK = 0.5                   # Scheduler resolution of the monitor loop
+
+# Event Bus
+EVENTS_QUEUE_SIZE = 1000            # Events held in memory before drop_policy applies
+EVENTS_BATCH_SIZE = 50              # Max events handed to the sinks at once
+EVENTS_MAX_WAIT = 0.2               # Seconds a batch waits to fill up after its first event
+EVENTS_COALESCE = 1.0               # Seconds within which repeated person/motion events of a camera merge into one
+EVENTS_DROP_POLICY = "drop_oldest"  # Queue full: "drop_oldest" | "drop_newest" | "spill" (to EVENTS_SPILL_PATH, replayed later)
+EVENTS_SPILL_PATH = "events_spill.jsonl"
+EVENTS_MQTT_TOPIC = "camera_supervisor"    # Events go to <topic>/<camera>/<type>
+
+# Viewer (mosaic window / MJPEG)
+VIEWER_MAX_FPS = 5                  # Mosaic refreshes per second, independent of the detection rate
+VIEWER_CELL_WIDTH = 480             # Width of each camera's cell in the mosaic (16:9)
+VIEWER_WINDOW_WIDTH = 640           # Single-camera detection window
+VIEWER_JPEG_QUALITY = 70
+VIEWER_STALE_AFTER = 5              # Seconds without a new frame before a cell is labelled "no signal"
+VIEWER_SNAPSHOT_WAIT = 0.5          # /snapshot.jpg attaches, waits this long for frames, then renders
+VIEWER_HOST = "127.0.0.1"           # MJPEG server binds to localhost only
+VIEWER_MJPEG_PORT = 8090
+
+# Metrics (per-stage timing, Prometheus endpoint)
+METRICS_HOST = "127.0.0.1"          # /metrics binds to localhost only
+METRICS_PORT = 9108
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)    # Stage histogram bounds, seconds
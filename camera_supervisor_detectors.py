@@ -0,0 +1,292 @@
+import os,sys,time,json
+import cv2
+import numpy as np
+from camera_supervisor_constants import *
+
+# Person detectors used by the InferenceService. Every backend takes a list of BGR frames and returns, per
+# frame, a list of person boxes [(x1, y1, x2, y2, conf), ...] in that frame's pixel coordinates.
+#
+#   ultralytics - the PyTorch YOLO model, no export needed
+#   onnxruntime - ONNX export run by onnxruntime's CPU provider (optionally the INT8-quantized export)
+#   opencv      - ONNX export run by cv2.dnn, no extra dependency beyond OpenCV
+
+
+class PersonDetector:
+    name = "base"
+
+    def detect_batch(self, frames):
+        raise NotImplementedError
+
+
+class UltralyticsDetector(PersonDetector):
+    name = "ultralytics"
+
+    def __init__(self, model_path=INFERENCE_MODEL, conf=INFERENCE_CONF):
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+        self.model.verbose = False
+        self.conf = conf
+
+    def detect_batch(self, frames):
+        # classes=[0]: only 'person' (COCO class 0) boxes come back
+        results = self.model(frames, conf=self.conf, classes=[0], verbose=False)
+        return [[(*map(float, box), float(conf)) for box, conf in zip(r.boxes.xyxy.tolist(), r.boxes.conf.tolist())] for r in results]
+
+
+def letterbox(frame, size):
+    """Resizes keeping aspect ratio and pads to size x size like ultralytics does. Returns (image, scale, pad_x, pad_y)."""
+    h, w = frame.shape[:2]
+    scale = min(size / h, size / w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+    image = np.full((size, size, 3), 114, dtype=np.uint8)
+    image[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    return image, scale, pad_x, pad_y
+
+
+class OnnxDetector(PersonDetector):
+    """Shared pre/post-processing for YOLOv8 ONNX exports (output shape N x 84 x anchors)."""
+
+    def __init__(self, onnx_path, conf=INFERENCE_CONF, input_size=DETECTOR_INPUT_SIZE, iou=DETECTOR_NMS_IOU):
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(f"ONNX model '{onnx_path}' not found, create it with: python camera_supervisor_detectors.py export")
+        self.onnx_path = onnx_path
+        self.conf = conf
+        self.input_size = input_size
+        self.iou = iou
+
+    def preprocess(self, frames):
+        boxes = [letterbox(frame, self.input_size) for frame in frames]
+        blob = cv2.dnn.blobFromImages([b[0] for b in boxes], scalefactor=1 / 255.0, swapRB=True)
+        return blob, [b[1:] for b in boxes]
+
+    def postprocess(self, output, transforms):
+        detections = []
+        for preds, (scale, pad_x, pad_y) in zip(output, transforms):
+            preds = preds.T     # anchors x (4 box + 80 class scores)
+            scores = preds[:, 4]
+            # Same rule as ultralytics with classes=[0]: the best class must be person and clear conf
+            keep = (scores >= self.conf) & (preds[:, 4:].argmax(axis=1) == 0)
+            if not keep.any():
+                detections.append([])
+                continue
+            cx, cy, w, h = preds[keep, :4].T
+            scores = scores[keep]
+            xywh = np.stack([(cx - w / 2 - pad_x) / scale, (cy - h / 2 - pad_y) / scale, w / scale, h / scale], axis=1)
+            persons = []
+            for i in np.array(cv2.dnn.NMSBoxes(xywh.tolist(), scores.tolist(), self.conf, self.iou)).flatten():
+                x, y, bw, bh = xywh[i]
+                persons.append((float(x), float(y), float(x + bw), float(y + bh), float(scores[i])))
+            detections.append(persons)
+        return detections
+
+    def forward(self, blob):
+        raise NotImplementedError
+
+    def detect_batch(self, frames):
+        blob, transforms = self.preprocess(frames)
+        return self.postprocess(self.forward(blob), transforms)
+
+
+class OnnxRuntimeDetector(OnnxDetector):
+    name = "onnxruntime"
+
+    def __init__(self, onnx_path, conf=INFERENCE_CONF, input_size=DETECTOR_INPUT_SIZE, iou=DETECTOR_NMS_IOU, threads=DETECTOR_THREADS):
+        super().__init__(onnx_path, conf, input_size, iou)
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("'onnxruntime' library not found. To enable, run: pip install onnxruntime")
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        # Static-batch exports only take one frame at a time
+        self.batchable = not isinstance(self.session.get_inputs()[0].shape[0], int)
+
+    def forward(self, blob):
+        if self.batchable:
+            return self.session.run(None, {self.input_name: blob})[0]
+        return np.concatenate([self.session.run(None, {self.input_name: blob[i:i + 1]})[0] for i in range(len(blob))])
+
+
+class OpenCVDnnDetector(OnnxDetector):
+    name = "opencv"
+
+    def __init__(self, onnx_path, conf=INFERENCE_CONF, input_size=DETECTOR_INPUT_SIZE, iou=DETECTOR_NMS_IOU):
+        super().__init__(onnx_path, conf, input_size, iou)
+        self.net = cv2.dnn.readNetFromONNX(onnx_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+    def forward(self, blob):
+        # cv2.dnn does not reliably honour dynamic batch axes, run frame by frame
+        outputs = []
+        for i in range(len(blob)):
+            self.net.setInput(blob[i:i + 1])
+            outputs.append(self.net.forward())
+        return np.concatenate(outputs)
+
+
+DETECTOR_BACKENDS = {
+    "ultralytics": UltralyticsDetector,
+    "onnxruntime": OnnxRuntimeDetector,
+    "opencv": OpenCVDnnDetector,
+}
+
+
+def onnx_path_for(model_path, int8=False):
+    base = os.path.splitext(model_path)[0]
+    return f"{base}.int8.onnx" if int8 else f"{base}.onnx"
+
+
+def create_detector(backend=DETECTOR_BACKEND, model_path=INFERENCE_MODEL, conf=INFERENCE_CONF, int8=False):
+    """Builds a PersonDetector. ONNX backends load the export next to model_path (yolov8n.pt -> yolov8n.onnx)."""
+    if backend not in DETECTOR_BACKENDS:
+        raise ValueError(f"Unknown detection backend '{backend}', expected one of {list(DETECTOR_BACKENDS)}")
+    if backend == "ultralytics":
+        return UltralyticsDetector(model_path, conf)
+    if int8 and backend != "onnxruntime":
+        raise ValueError("The INT8 model uses ONNX integer ops that only the 'onnxruntime' backend runs")
+    path = model_path if model_path.endswith(".onnx") else onnx_path_for(model_path, int8)
+    return DETECTOR_BACKENDS[backend](path, conf)
+
+
+def export_person_model(model_path=INFERENCE_MODEL, int8=False, input_size=DETECTOR_INPUT_SIZE):
+    """Exports the YOLO model to ONNX (dynamic batch) and optionally an INT8 dynamically-quantized copy. Returns the path."""
+    onnx_path = onnx_path_for(model_path)
+    if not os.path.exists(onnx_path):
+        from ultralytics import YOLO
+        print(f"[EXPORT] Exporting {model_path} -> {onnx_path}")
+        exported = YOLO(model_path).export(format="onnx", imgsz=input_size, dynamic=True, simplify=True)
+        if os.path.abspath(exported) != os.path.abspath(onnx_path):
+            os.replace(exported, onnx_path)
+    if not int8:
+        return onnx_path
+
+    int8_path = onnx_path_for(model_path, int8=True)
+    try:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+    except ImportError:
+        raise ImportError("'onnxruntime' library not found. To enable, run: pip install onnxruntime")
+    print(f"[EXPORT] Quantizing {onnx_path} -> {int8_path} (INT8 weights)")
+    quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QUInt8)
+    return int8_path
+
+
+def box_iou(a, b):
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def match_boxes(reference, candidate, iou=0.5):
+    """Greedy IoU matching. Returns (matched, reference count, candidate count)."""
+    matched, used = 0, set()
+    for ref in reference:
+        best, best_iou = None, iou
+        for i, box in enumerate(candidate):
+            if i not in used and (overlap := box_iou(ref, box)) >= best_iou:
+                best, best_iou = i, overlap
+        if best is not None:
+            used.add(best)
+            matched += 1
+    return matched, len(reference), len(candidate)
+
+
+def read_clip(clip_path, max_frames, step=1):
+    cap = cv2.VideoCapture(clip_path)
+    frames, index = [], 0
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if index % step == 0:
+            frames.append(frame)
+        index += 1
+    cap.release()
+    return frames
+
+
+def compare_backends(clip_path, backends=("ultralytics", "onnxruntime", "opencv"), model_path=INFERENCE_MODEL, int8=False,
+                     max_frames=200, step=5, batch_size=1):
+    """Runs every backend on the same frames of a recorded clip. Reports per-backend latency and how well each
+    agrees with the first backend (the reference): person-present agreement and box precision/recall at IoU 0.5."""
+    frames = read_clip(clip_path, max_frames, step)
+    if not frames:
+        raise ValueError(f"Could not read any frames from '{clip_path}'")
+    print(f"[COMPARE] {len(frames)} frames from {clip_path}")
+
+    report, reference = {"clip": clip_path, "frames": len(frames), "batch_size": batch_size, "backends": {}}, None
+    for backend in backends:
+        use_int8 = int8 and backend == "onnxruntime"
+        label = f"{backend}-int8" if use_int8 else backend
+        try:
+            detector = create_detector(backend, model_path, int8=use_int8)
+        except Exception as e:
+            print(f"[COMPARE] {label}: skipped ({e})")
+            report["backends"][label] = {"error": str(e)}
+            continue
+
+        detector.detect_batch(frames[:batch_size])     # warm-up
+        detections, latencies = [], []
+        for i in range(0, len(frames), batch_size):
+            batch = frames[i:i + batch_size]
+            started = time.perf_counter()
+            detections.extend(detector.detect_batch(batch))
+            latencies.append((time.perf_counter() - started) / len(batch))
+        latencies.sort()
+        result = {
+            "latency_mean_ms": sum(latencies) / len(latencies) * 1000,
+            "latency_p50_ms": latencies[len(latencies) // 2] * 1000,
+            "latency_p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+            "frames_with_person": sum(1 for d in detections if d),
+        }
+        if reference is None:
+            reference = (label, detections)
+        else:
+            matched = ref_total = cand_total = 0
+            for ref, cand in zip(reference[1], detections):
+                m, r, c = match_boxes(ref, cand)
+                matched, ref_total, cand_total = matched + m, ref_total + r, cand_total + c
+            result["reference"] = reference[0]
+            result["presence_agreement"] = sum(1 for ref, cand in zip(reference[1], detections) if bool(ref) == bool(cand)) / len(frames)
+            result["box_recall"] = matched / ref_total if ref_total else 1.0
+            result["box_precision"] = matched / cand_total if cand_total else 1.0
+        report["backends"][label] = result
+        print(f"[COMPARE] {label}: " + " ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in result.items()))
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Export the person model and compare detection backends.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Export the YOLO model to ONNX (and optionally INT8)")
+    export.add_argument("--model", default=INFERENCE_MODEL)
+    export.add_argument("--int8", action="store_true")
+    compare = commands.add_parser("compare", help="Compare backend latency and agreement on a recorded clip")
+    compare.add_argument("clip")
+    compare.add_argument("--model", default=INFERENCE_MODEL)
+    compare.add_argument("--backends", nargs="+", default=list(DETECTOR_BACKENDS), choices=list(DETECTOR_BACKENDS))
+    compare.add_argument("--int8", action="store_true", help="Use the INT8 model for the onnxruntime backend")
+    compare.add_argument("--max-frames", type=int, default=200)
+    compare.add_argument("--step", type=int, default=5, help="Use every Nth frame of the clip")
+    compare.add_argument("--batch-size", type=int, default=1)
+    compare.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(export_person_model(args.model, int8=args.int8))
+        sys.exit(0)
+
+    report = compare_backends(args.clip, args.backends, args.model, int8=args.int8, max_frames=args.max_frames,
+                              step=args.step, batch_size=args.batch_size)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[COMPARE] Report written to {args.output}")
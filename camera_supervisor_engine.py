@@ -0,0 +1,386 @@
+import os,time,signal,threading
+from collections import deque
+import cv2
+from camera_supervisor_components import CameraSupervisor
+from camera_supervisor_inference import InferenceService
+from camera_supervisor_scheduler import AdaptiveFrameScheduler
+from camera_supervisor_clipstore import create_continuous_recorder
+from camera_supervisor_retention import RetentionManager, set_retention_manager
+from camera_supervisor_health import HealthMonitor
+from camera_supervisor_events import create_event_bus
+from camera_supervisor_viewer import MjpegServer, frame_board
+from camera_supervisor_metrics import STAGES, MetricsServer, metrics
+from camera_supervisor_constants import *
+
+
+class PipelineStats:
+    """Thread-safe per-camera counters, read by the engine for the aggregate stats line."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.frames = 0
+        self.inferences = 0
+        self.dropped = 0
+        self.gated = 0
+        self.recording = False
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.restarts = 0
+        # Window counters, reset by snapshot() so fps reflects the last interval only
+        self.window_start = self.started
+        self.window_frames = 0
+        self.window_inferences = 0
+        self.window_latencies = deque(maxlen=PIPELINE_LATENCY_SAMPLES)
+
+    def record_frame(self, latency, inferred=False, recording=False, dropped=0, gated=False):
+        """latency: seconds from the frame being grabbed off the stream to the detection/recording decision."""
+        with self.lock:
+            self.frames += 1
+            self.dropped += dropped
+            self.gated += gated
+            self.window_latencies.append(latency)
+            self.window_frames += 1
+            if inferred:
+                self.inferences += 1
+                self.window_inferences += 1
+            self.recording = recording
+            self.latency_total += latency
+            if latency > self.latency_max:
+                self.latency_max = latency
+
+    def snapshot(self, reset_window=True):
+        with self.lock:
+            now = time.time()
+            elapsed = max(now - self.window_start, 1e-6)
+            latencies = sorted(self.window_latencies)
+            data = {
+                "frames": self.frames,
+                "inferences": self.inferences,
+                "dropped": self.dropped,
+                "gated": self.gated,
+                "fps": self.window_frames / elapsed,
+                "inference_fps": self.window_inferences / elapsed,
+                "latency_avg_ms": (self.latency_total / self.frames * 1000) if self.frames else 0.0,
+                "latency_max_ms": self.latency_max * 1000,
+                "latency_p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+                "latency_p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+                "recording": self.recording,
+                "restarts": self.restarts,
+                "uptime_s": now - self.started,
+            }
+            if reset_window:
+                self.window_start = now
+                self.window_frames = 0
+                self.window_inferences = 0
+                self.window_latencies.clear()
+            return data
+
+
+class CameraWorker:
+    """One supervised detection/recording loop for a single camera, restarted if it exits unexpectedly."""
+
+    def __init__(self, name, supervisor, inference, max_fps=SUPERVISOR_MAX_FPS, restart_delay=SUPERVISOR_RESTART_DELAY, scheduler_settings=None,
+                 cascade=False, pre_roll=RECORDING_PRE_ROLL, post_roll=RECORDING_POST_ROLL, recording_mode=RECORDING_MODE,
+                 continuous=False, segment_time=CONTINUOUS_SEGMENT_TIME, events=None, board=None):
+        self.name = name
+        self.supervisor = supervisor
+        self.inference = inference
+        self.cascade = cascade
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.recording_mode = recording_mode
+        self.events = events
+        self.board = board
+        # Continuous recording runs for the worker's whole life; packet-mode event clips are cut from the same segments
+        self.segmenter, self.clip_store = (None, None)
+        if continuous:
+            self.segmenter, self.clip_store = create_continuous_recorder(supervisor.rtsp_url, os.path.join(supervisor.video_dir, name, "continuous"),
+                                                                         segment_time, tag=name)
+        # Kept across restarts so the idle/active state and inference rate history survive a stream drop
+        self.scheduler = AdaptiveFrameScheduler(name, **(scheduler_settings or {}))
+        self.max_fps = max_fps
+        self.restart_delay = restart_delay
+        self.stats = PipelineStats()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.segmenter:
+            self.segmenter.start()
+        self.thread = threading.Thread(target=self.run, name=f"camera-{self.name}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def join(self, timeout=SUPERVISOR_SHUTDOWN_TIMEOUT):
+        stopped = True
+        if self.thread:
+            self.thread.join(timeout)
+            stopped = not self.thread.is_alive()
+        if self.segmenter:
+            self.segmenter.stop()
+        return stopped
+
+    def run(self):
+        from camera_supervisor_person_detection import send_detect_events
+        camera = self.supervisor
+        output_dir = os.path.join(camera.video_dir, self.name)
+        while not self.stop_event.is_set():
+            try:
+                send_detect_events(camera.username, camera.password, camera.ip, camera.camera_port, stream_path=camera.stream_path,
+                                   stop_event=self.stop_event, display=False, max_fps=self.max_fps,
+                                   stats=self.stats, tag=self.name, output_dir=output_dir, grabber=camera.get_grabber(),
+                                   inference=self.inference, scheduler=self.scheduler, cascade=self.cascade,
+                                   pre_roll=self.pre_roll, post_roll=self.post_roll, recording_mode=self.recording_mode,
+                                   segmenter=self.segmenter, events=self.events, board=self.board)
+            except Exception as e:
+                print(f"[{self.name}] Worker error: {e}")
+            if self.stop_event.is_set():
+                break
+            # Stream dropped or loop crashed, supervise it back up
+            with self.stats.lock:
+                self.stats.restarts += 1
+            print(f"[{self.name}] Worker exited, restarting in {self.restart_delay}s...")
+            self.stop_event.wait(self.restart_delay)
+
+
+class SupervisorEngine:
+    """Headless mode: runs one CameraWorker per entry in camera_details and reports aggregate stats."""
+
+    def __init__(self, camera_data):
+        settings = camera_data.get("supervisor") or {}
+        self.max_fps = settings.get("max_fps", SUPERVISOR_MAX_FPS)
+        self.opencv_threads = settings.get("opencv_threads", SUPERVISOR_OPENCV_THREADS)
+        self.stats_interval = settings.get("stats_interval", SUPERVISOR_STATS_INTERVAL)
+        self.restart_delay = settings.get("restart_delay", SUPERVISOR_RESTART_DELAY)
+        self.stop_event = threading.Event()
+        self.stopped = False
+        inference = camera_data.get("inference") or {}
+        recording = camera_data.get("recording") or {}
+        # Detection events go to one shared bus (MQTT / JSONL), only when an `events` section configures a sink
+        self.events = create_event_bus(camera_data.get("events") or {})
+        # One batched service per detection backend in use, cameras pick theirs with `detection_backend`
+        self.inference_services = {}
+        self.workers = {}
+        for cam_key, cam_conf in (camera_data.get("camera_details") or {}).items():
+            supervisor = CameraSupervisor(cam_conf.get("camera_ip"), cam_conf.get("camera_username"), cam_conf.get("camera_password"),
+                                          camera_port=int(cam_conf.get("camera_port", 554)), onvif_port=int(cam_conf.get("onvif_port", 2020)),
+                                          stream_path=cam_conf.get("stream_path", "stream1"),
+                                          drop_policy=cam_conf.get("drop_policy", settings.get("drop_policy", GRABBER_DROP_POLICY)), name=cam_key)
+            backend = (cam_conf.get("detection_backend", inference.get("backend", DETECTOR_BACKEND)),
+                       bool(cam_conf.get("detection_int8", inference.get("int8", False))))
+            if backend not in self.inference_services:
+                self.inference_services[backend] = InferenceService(model_path=inference.get("model", INFERENCE_MODEL), conf=inference.get("conf", INFERENCE_CONF),
+                                                                    max_batch=inference.get("max_batch", INFERENCE_MAX_BATCH),
+                                                                    max_wait=inference.get("max_wait_ms", INFERENCE_MAX_WAIT * 1000) / 1000,
+                                                                    backend=backend[0], int8=backend[1])
+            self.workers[cam_key] = CameraWorker(cam_key, supervisor, self.inference_services[backend], max_fps=cam_conf.get("max_fps", self.max_fps),
+                                                 restart_delay=self.restart_delay,
+                                                 scheduler_settings={**(camera_data.get("scheduler") or {}), **(cam_conf.get("scheduler") or {})},
+                                                 cascade=cam_conf.get("cascade", settings.get("cascade", False)),
+                                                 pre_roll=cam_conf.get("pre_roll", recording.get("pre_roll", RECORDING_PRE_ROLL)),
+                                                 post_roll=cam_conf.get("post_roll", recording.get("post_roll", RECORDING_POST_ROLL)),
+                                                 recording_mode=cam_conf.get("recording_mode", recording.get("mode", RECORDING_MODE)),
+                                                 continuous=cam_conf.get("continuous", recording.get("continuous", False)),
+                                                 segment_time=recording.get("segment_time", CONTINUOUS_SEGMENT_TIME),
+                                                 events=self.events, board=frame_board)
+        # Retention is opt-in: only with a `retention` section in the YAML
+        retention = camera_data.get("retention")
+        self.retention = None
+        if retention and retention.get("enabled", True):
+            gb = lambda value: int(value * 1e9) if value else 0
+            max_age = {kind: (days * 86400 if days is not None else None) for kind, days in (retention.get("max_age_days") or {}).items()}
+            self.retention = RetentionManager(global_quota=gb(retention.get("global_quota_gb")), camera_quota=gb(retention.get("camera_quota_gb")),
+                                              camera_quotas={cam_key: gb(cam_conf["retention_quota_gb"]) for cam_key, cam_conf in (camera_data.get("camera_details") or {}).items()
+                                                             if cam_conf.get("retention_quota_gb")},
+                                              max_age=max_age, interval=retention.get("interval", RETENTION_INTERVAL))
+            for worker in self.workers.values():
+                if worker.clip_store is not None:
+                    self.retention.on_delete.append(worker.clip_store.remove)
+                if worker.segmenter is not None:
+                    self.retention.protectors.append(worker.segmenter.pinned_paths)
+        # MJPEG mosaic on localhost: `viewer` section. Cameras only post frames while a browser is connected.
+        viewer = camera_data.get("viewer")
+        self.viewer = None
+        if viewer and viewer.get("enabled", True):
+            self.viewer = MjpegServer(frame_board, host=viewer.get("host", VIEWER_HOST), port=int(viewer.get("port", VIEWER_MJPEG_PORT)),
+                                      cell_width=viewer.get("cell_width", VIEWER_CELL_WIDTH), max_fps=viewer.get("max_fps", VIEWER_MAX_FPS))
+        # Health monitoring is opt-in as well: `health` section
+        health = camera_data.get("health")
+        self.health = None
+        if health and health.get("enabled", True):
+            self.health = HealthMonitor({name: worker.supervisor for name, worker in self.workers.items()},
+                                        interval=health.get("interval", HEALTH_INTERVAL),
+                                        decode_interval=health.get("decode_interval", HEALTH_DECODE_INTERVAL),
+                                        max_backoff=health.get("max_backoff", HEALTH_MAX_BACKOFF))
+        # Per-stage timing is opt-in too: `metrics` section. Disabled, the loops only call empty no-op methods.
+        metrics_settings = camera_data.get("metrics")
+        self.metrics_enabled = bool(metrics_settings and metrics_settings.get("enabled", True))
+        self.metrics_server = None
+        if self.metrics_enabled:
+            metrics.add_collector(self.collect_metrics)
+            if metrics_settings.get("port", METRICS_PORT):
+                self.metrics_server = MetricsServer(metrics, host=metrics_settings.get("host", METRICS_HOST), port=int(metrics_settings.get("port", METRICS_PORT)))
+
+    def start(self):
+        # Each worker runs its own cv2 pipeline, so OpenCV's internal thread pool would multiply per camera
+        cv2.setNumThreads(self.opencv_threads)
+        for service in self.inference_services.values():
+            service.start()
+        if self.retention:
+            set_retention_manager(self.retention.start())
+        if self.events:
+            self.events.start()
+        # Loops take their stage clock when they start, so this has to come before the workers
+        metrics.enable(self.metrics_enabled)
+        if self.metrics_server:
+            self.metrics_server.start()
+        for worker in self.workers.values():
+            worker.start()
+        if self.health:
+            self.health.start()
+        if self.viewer:
+            self.viewer.start()
+        print(f"[ENGINE] Started {len(self.workers)} camera worker(s).")
+
+    def stop(self):
+        if self.stopped:
+            return
+        self.stopped = True
+        print("\n[ENGINE] Shutting down...")
+        self.stop_event.set()
+        if self.health:
+            self.health.stop()
+        if self.viewer:
+            self.viewer.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        for worker in self.workers.values():
+            worker.stop()
+        for name, worker in self.workers.items():
+            if not worker.join():
+                print(f"[ENGINE] Worker '{name}' did not stop within {SUPERVISOR_SHUTDOWN_TIMEOUT}s.")
+            worker.supervisor.close()
+        for service in self.inference_services.values():
+            service.stop()
+        if self.events:
+            self.events.stop()
+        if self.retention:
+            self.retention.stop()
+            set_retention_manager(None)
+        print("[ENGINE] Stopped.")
+
+    def stats(self):
+        per_camera = {}
+        for name, worker in self.workers.items():
+            per_camera[name] = worker.stats.snapshot()
+            per_camera[name]["scheduler"] = worker.scheduler.counters()
+            if worker.supervisor.grabber:
+                per_camera[name]["capture"] = worker.supervisor.grabber.counters()
+            if self.health:
+                per_camera[name]["health"] = self.health.state(name)
+        cams = per_camera.values()
+        frames = sum(s["frames"] for s in cams)
+        # Fleet-wide inference savings against the old fixed every-3rd-frame schedule
+        scheduled_frames = sum(s["scheduler"]["frames"] for s in cams)
+        scheduled_inferences = sum(s["scheduler"]["inferences"] for s in cams)
+        return {
+            "cameras": len(per_camera),
+            "recording": sum(1 for s in cams if s["recording"]),
+            "fps": sum(s["fps"] for s in cams),
+            "inference_fps": sum(s["inference_fps"] for s in cams),
+            "dropped": sum(s["dropped"] for s in cams),
+            "gated": sum(s["gated"] for s in cams),
+            "latency_avg_ms": (sum(s["latency_avg_ms"] * s["frames"] for s in cams) / frames) if frames else 0.0,
+            "latency_max_ms": max((s["latency_max_ms"] for s in cams), default=0.0),
+            "inference_saved_vs_fixed_pct": (1 - scheduled_inferences / (scheduled_frames / 3)) * 100 if scheduled_frames else 0.0,
+            "inference": [service.counters() for service in self.inference_services.values()],
+            "storage": self.retention.counters() if self.retention else None,
+            "health": self.health.summary() if self.health else None,
+            "events": self.events.counters() if self.events else None,
+            "per_camera": per_camera,
+        }
+
+    def collect_metrics(self):
+        """Counters and gauges for the /metrics endpoint, read from the existing stats at scrape time."""
+        for name, worker in self.workers.items():
+            labels = {"camera": name}
+            s = worker.stats.snapshot(reset_window=False)
+            yield "camera_frames_total", "counter", labels, s["frames"]
+            yield "camera_inferences_total", "counter", labels, s["inferences"]
+            yield "camera_dropped_frames_total", "counter", labels, s["dropped"]
+            yield "camera_motion_gated_total", "counter", labels, s["gated"]
+            yield "camera_restarts_total", "counter", labels, s["restarts"]
+            yield "camera_fps", "gauge", labels, s["fps"]
+            yield "camera_inference_fps", "gauge", labels, s["inference_fps"]
+            yield "camera_recording", "gauge", labels, s["recording"]
+            if worker.supervisor.grabber:
+                c = worker.supervisor.grabber.counters()
+                yield "camera_grabbed_frames_total", "counter", labels, c["grabbed"]
+                yield "camera_decoded_frames_total", "counter", labels, c["retrieved"]
+                yield "camera_grabber_dropped_total", "counter", labels, c["dropped"]
+                yield "camera_connected", "gauge", labels, c["connected"]
+                yield "camera_reconnects_total", "counter", labels, c["reconnects"]
+                yield "camera_downtime_seconds_total", "counter", labels, c["downtime_s"]
+        for service in self.inference_services.values():
+            c = service.counters()
+            labels = {"backend": c["backend"]}
+            yield "inference_queue_depth", "gauge", labels, c["queue_depth"]
+            yield "inference_batches_total", "counter", labels, c["batches"]
+            yield "inference_frames_total", "counter", labels, c["frames"]
+            yield "inference_rejected_total", "counter", labels, c["rejected"]
+        if self.events:
+            c = self.events.counters()
+            yield "events_queue_depth", "gauge", {}, c["queue_depth"]
+            yield "events_published_total", "counter", {}, c["published"]
+            yield "events_dropped_total", "counter", {}, c["dropped"]
+
+    def find_recordings(self, name, start, end):
+        """Continuous-recording segments of camera `name` overlapping [start, end) (epoch seconds)."""
+        worker = self.workers.get(name)
+        if worker is None or worker.clip_store is None:
+            return []
+        return worker.clip_store.query(start, end)
+
+    def log_stats(self):
+        stats = self.stats()
+        print(f"[ENGINE] cameras={stats['cameras']} recording={stats['recording']} fps={stats['fps']:.1f} "
+              f"inference_fps={stats['inference_fps']:.1f} saved_vs_fixed={stats['inference_saved_vs_fixed_pct']:.0f}% motion_gated={stats['gated']} dropped={stats['dropped']} latency_avg={stats['latency_avg_ms']:.1f}ms latency_max={stats['latency_max_ms']:.1f}ms")
+        for inf in stats["inference"]:
+            print(f"[ENGINE]   inference[{inf['backend']}]: batches={inf['batches']} avg_batch={inf['avg_batch_size']:.1f} avg_batch_ms={inf['avg_batch_ms']:.1f} "
+                  f"queue_wait={inf['avg_queue_wait_ms']:.1f}ms queue_depth={inf['queue_depth']} rejected={inf['rejected']}")
+        if stats["events"]:
+            ev = stats["events"]
+            print(f"[ENGINE]   events: published={ev['published']} coalesced={ev['coalesced']} dropped={ev['dropped']} spilled={ev['spilled']} "
+                  f"queue_depth={ev['queue_depth']} latency_p50={ev['publish_latency_p50_ms']:.1f}ms p95={ev['publish_latency_p95_ms']:.1f}ms")
+        if stats["health"]:
+            print("[ENGINE]   health: " + " ".join(f"{status}={count}" for status, count in stats["health"].items() if count))
+        storage = stats["storage"]
+        if storage:
+            writes = " ".join(f"{cam}={rate / 1e6:.2f}MB/s" for cam, rate in storage["write_bytes_per_sec"].items())
+            print(f"[ENGINE]   storage: used={storage['total_bytes'] / 1e9:.2f}GB files={storage['files']} deleted={storage['deleted_files']} writes: {writes or 'none'}")
+        for name, s in stats["per_camera"].items():
+            print(f"[ENGINE]   {name}: fps={s['fps']:.1f} inf_fps={s['inference_fps']:.1f} mode={s['scheduler']['mode']} dropped={s['dropped']} "
+                  f"latency_p50={s['latency_p50_ms']:.1f}ms p95={s['latency_p95_ms']:.1f}ms restarts={s['restarts']}"
+                  + (f" reconnects={s['capture']['reconnects']} downtime={s['capture']['downtime_s']:.0f}s" if "capture" in s else ""))
+        if self.metrics_enabled:
+            # Stage p50/p95 over the last interval (bucket upper bounds), to see where each camera spends its time
+            ms = lambda seconds: "inf" if seconds == float("inf") else f"{seconds * 1000:g}"
+            for name, stages in metrics.summary().items():
+                timings = " ".join(f"{stage}={ms(p50)}/{ms(p95)}ms" for stage, (count, p50, p95) in sorted(stages.items(), key=lambda item: STAGES.index(item[0]))
+                                   if count)
+                print(f"[ENGINE]   {name} stages p50/p95: {timings or 'no frames'}")
+
+    def run_forever(self):
+        """Blocks until SIGINT/SIGTERM, logging aggregate stats every stats_interval seconds."""
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: self.stop_event.set())
+        self.start()
+        try:
+            while not self.stop_event.wait(self.stats_interval):
+                self.log_stats()
+        finally:
+            self.stop()
+            self.log_stats()
@@ -0,0 +1,267 @@
+import os,json,time,threading
+from collections import deque
+from camera_supervisor_constants import *
+
+# Event dicts published by the detection loop:
+#   {"type": "person" | "motion" | "clip", "camera", "timestamp", "boxes": [[x1, y1, x2, y2, conf], ...],
+#    "confidence", "frame_size": [w, h], "clip": path or None, "count": occurrences coalesced into this event}
+DROP_POLICIES = ("drop_oldest", "drop_newest", "spill")
+
+
+def make_event(kind, camera, timestamp=None, boxes=(), frame_size=None, clip=None):
+    boxes = [[int(x1), int(y1), int(x2), int(y2), round(float(conf), 3)] for x1, y1, x2, y2, conf in boxes]
+    return {"type": kind, "camera": camera, "timestamp": timestamp or time.time(), "boxes": boxes,
+            "confidence": max((box[4] for box in boxes), default=None), "frame_size": frame_size, "clip": clip, "count": 1}
+
+
+class CallbackSink:
+    """Calls callback(event) for every event, in the bus thread."""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def publish(self, batch):
+        for event in batch:
+            self.callback(event)
+
+    def close(self):
+        pass
+
+
+class JsonlSink:
+    """Appends events to a JSON-lines file, one write + flush per batch."""
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path, "a")
+
+    def publish(self, batch):
+        self.file.write("".join(json.dumps(event) + "\n" for event in batch))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class MqttSink:
+    """Publishes each event as JSON to <topic>/<camera>/<type>. paho-mqtt keeps the connection (and reconnects)
+    on its own network thread; client_factory() can return any object with the paho client interface, e.g. an
+    in-memory broker stub."""
+
+    def __init__(self, host="localhost", port=1883, topic=EVENTS_MQTT_TOPIC, qos=0, username=None, password=None, client_factory=None):
+        self.topic = topic
+        self.qos = qos
+        if client_factory is None:
+            import paho.mqtt.client as mqtt
+            try:
+                self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)    # paho-mqtt >= 2.0
+            except AttributeError:
+                self.client = mqtt.Client()
+        else:
+            self.client = client_factory()
+        if username:
+            self.client.username_pw_set(username, password)
+        self.client.connect_async(host, port)
+        self.client.loop_start()
+
+    def publish(self, batch):
+        for event in batch:
+            self.client.publish(f"{self.topic}/{event['camera']}/{event['type']}", json.dumps(event), qos=self.qos)
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+class EventBus:
+    """Takes events from the capture loops without blocking them and publishes them to the sinks on one
+    background thread, in batches of up to batch_size (or whatever arrived within max_wait).
+
+    A person/motion event for the same camera arriving within `coalesce` seconds of a queued, unsent one is
+    merged into it (latest boxes, highest confidence, `count` incremented) instead of queued again. The queue
+    holds at most queue_size events; beyond that drop_policy decides:
+        drop_oldest - evict the oldest queued event (default, newest state wins)
+        drop_newest - discard the incoming event
+        spill       - append it to spill_path and replay it once the queue has room again
+    """
+
+    def __init__(self, sinks, queue_size=EVENTS_QUEUE_SIZE, batch_size=EVENTS_BATCH_SIZE, max_wait=EVENTS_MAX_WAIT,
+                 coalesce=EVENTS_COALESCE, drop_policy=EVENTS_DROP_POLICY, spill_path=EVENTS_SPILL_PATH):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"drop_policy must be one of {DROP_POLICIES}, got '{drop_policy}'")
+        self.sinks = list(sinks)
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.coalesce = coalesce
+        self.drop_policy = drop_policy
+        self.spill_path = spill_path
+        self.cond = threading.Condition()
+        self.queue = deque()
+        self.open_events = {}       # (camera, type) -> queued event still accepting coalesced updates
+        self.spill_pending = 0      # events in the spill file not yet replayed
+        self.stop_event = threading.Event()
+        self.thread = None
+        # Counters
+        self.published = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=PIPELINE_LATENCY_SAMPLES)
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="event-bus", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        """Publishes whatever is still queued, then closes the sinks."""
+        self.stop_event.set()
+        with self.cond:
+            self.cond.notify_all()
+        if self.thread:
+            self.thread.join(timeout)
+            self.thread = None
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                print(f"[EVENTS] Closing {type(sink).__name__} failed: {e}")
+
+    def publish(self, event):
+        """Queues one event; never blocks the caller."""
+        event["queued_at"] = time.time()
+        with self.cond:
+            key = (event["camera"], event["type"])
+            queued = self.open_events.get(key)
+            if queued is not None and event["type"] != "clip" and event["timestamp"] - queued["timestamp"] <= self.coalesce:
+                # Keep the first timestamp (and queue position), take the newest boxes
+                queued["boxes"] = event["boxes"]
+                queued["confidence"] = max(filter(None, (queued["confidence"], event["confidence"])), default=None)
+                queued["last_timestamp"] = event["timestamp"]
+                queued["count"] += 1
+                self.coalesced += 1
+                return
+            if len(self.queue) >= self.queue_size:
+                if self.drop_policy == "drop_newest":
+                    self.dropped += 1
+                    return
+                if self.drop_policy == "spill":
+                    self.spill([event])
+                    return
+                evicted = self.queue.popleft()
+                self.forget(evicted)
+                self.dropped += 1
+            self.queue.append(event)
+            self.open_events[key] = event
+            self.cond.notify()
+
+    def forget(self, event):
+        key = (event["camera"], event["type"])
+        if self.open_events.get(key) is event:
+            del self.open_events[key]
+
+    def spill(self, events, count=True):
+        # Caller holds self.cond. count=False re-spills replayed events, which were counted when first spilled.
+        try:
+            with open(self.spill_path, "a") as f:
+                f.write("".join(json.dumps(event) + "\n" for event in events))
+            if count:
+                self.spilled += len(events)
+            self.spill_pending += len(events)
+        except OSError as e:
+            self.dropped += len(events)
+            print(f"[EVENTS] Spill to {self.spill_path} failed: {e}")
+
+    def replay_spill(self):
+        # Caller holds self.cond; the queue is empty. Spilled events go back in order, then the file is removed.
+        try:
+            with open(self.spill_path) as f:
+                events = [json.loads(line) for line in f if line.strip()]
+            os.remove(self.spill_path)
+        except (OSError, ValueError) as e:
+            print(f"[EVENTS] Replaying {self.spill_path} failed: {e}")
+            self.spill_pending = 0
+            return
+        self.spill_pending = 0
+        overflow = events[self.queue_size:]
+        self.queue.extend(events[:self.queue_size])
+        if overflow:
+            self.spill(overflow, count=False)
+
+    def next_batch(self):
+        with self.cond:
+            while not self.queue and not self.stop_event.is_set():
+                if self.spill_pending:
+                    self.replay_spill()
+                    continue
+                self.cond.wait(1.0)
+            if not self.queue:
+                return []
+            # Give a burst up to max_wait to fill the batch
+            deadline = self.queue[0]["queued_at"] + self.max_wait
+            while len(self.queue) < self.batch_size and not self.stop_event.is_set():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            batch = [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+            for event in batch:
+                self.forget(event)
+            return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            if not batch:
+                if self.stop_event.is_set():
+                    return
+                continue
+            for event in batch:
+                event.pop("queued_at", None)
+            queued = [event.get("last_timestamp", event["timestamp"]) for event in batch]
+            for sink in self.sinks:
+                try:
+                    sink.publish(batch)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"[EVENTS] {type(sink).__name__} publish failed: {e}")
+            now = time.time()
+            with self.cond:
+                self.published += len(batch)
+                # Event time (last occurrence for coalesced ones) -> handed to every sink
+                self.latencies.extend(now - t for t in queued)
+
+    def counters(self):
+        with self.cond:
+            latencies = sorted(self.latencies)
+            return {
+                "published": self.published,
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+                "spilled": self.spilled,
+                "errors": self.errors,
+                "queue_depth": len(self.queue),
+                "publish_latency_p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+                "publish_latency_p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+            }
+
+
+def create_event_bus(settings):
+    """EventBus from the `events` YAML section, or None when no sink is configured."""
+    sinks = []
+    mqtt = settings.get("mqtt")
+    if mqtt:
+        sinks.append(MqttSink(mqtt.get("host", "localhost"), int(mqtt.get("port", 1883)), mqtt.get("topic", EVENTS_MQTT_TOPIC),
+                              int(mqtt.get("qos", 0)), mqtt.get("username"), mqtt.get("password")))
+    if settings.get("jsonl"):
+        sinks.append(JsonlSink(settings["jsonl"]))
+    if not sinks:
+        return None
+    return EventBus(sinks, queue_size=settings.get("queue_size", EVENTS_QUEUE_SIZE), batch_size=settings.get("batch_size", EVENTS_BATCH_SIZE),
+                    max_wait=settings.get("max_wait_ms", EVENTS_MAX_WAIT * 1000) / 1000, coalesce=settings.get("coalesce", EVENTS_COALESCE),
+                    drop_policy=settings.get("drop_policy", EVENTS_DROP_POLICY), spill_path=settings.get("spill_path", EVENTS_SPILL_PATH))
@@ -0,0 +1,180 @@
+import os,sys,json,time,asyncio,threading,argparse,contextlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from camera_supervisor_helper import load_data_from_yaml
+from camera_supervisor_constants import *
+
+# Scriptable fleet operations over camera_details, e.g.
+#   python camera_supervisor.py snapshot --all --parallel 32
+#   python camera_supervisor.py ping --cameras cam1,cam2
+#   python camera_supervisor.py record --cameras cam1 --duration 30
+#   python camera_supervisor.py ptz --cameras cam1 --x 0.5 --y 0 --duration 1
+# Logs go to stderr, the JSON result to stdout (or --output).
+FLEET_COMMANDS = ("ping", "snapshot", "record", "detect", "ptz", "reboot")
+
+
+def camera_from_config(cam_conf):
+    from camera_supervisor_components import CameraSupervisor
+    return CameraSupervisor(cam_conf.get("camera_ip"), cam_conf.get("camera_username"), cam_conf.get("camera_password"),
+                            camera_port=int(cam_conf.get("camera_port", 554)), onvif_port=int(cam_conf.get("onvif_port", 2020)),
+                            stream_path=cam_conf.get("stream_path", "stream1"))
+
+
+def timestamp():
+    return datetime.now().strftime('%Y%m%d_%H%M%S')
+
+
+def op_ping(name, camera, args):
+    # Tiered probe (TCP, RTSP DESCRIBE, decode only with --decode) instead of opening a decode session
+    from camera_supervisor_health import check_camera
+    result = asyncio.run(check_camera(camera, decode=args.decode))
+    return {"ok": result["status"] == "online", **result}
+
+
+def op_snapshot(name, camera, args):
+    directory = os.path.join(camera.image_dir, name)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"capture_{timestamp()}.jpg")
+    ok = camera.capture_image(path)
+    return {"ok": ok, "path": path if ok else None}
+
+
+def op_record(name, camera, args):
+    directory = os.path.join(camera.video_dir, name)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"video_{timestamp()}.mp4")
+    if not camera.start_video_recording(filename=path, duration=args.duration):
+        return {"ok": False}
+    process = camera.process
+    try:
+        # ffmpeg stops by itself after -t duration; allow for connect time
+        process.wait(timeout=args.duration + FLEET_RECORD_GRACE)
+    except Exception:
+        pass
+    camera.stop_video_recording()
+    ok = process.returncode == 0 and os.path.exists(path)
+    return {"ok": ok, "path": path if ok else None, "bytes": os.path.getsize(path) if ok else 0}
+
+
+def op_detect(name, camera, args):
+    from camera_supervisor_person_detection import send_detect_events
+    from camera_supervisor_engine import PipelineStats
+    stats = PipelineStats()
+    stop_event = threading.Event()
+    timer = threading.Timer(args.duration, stop_event.set)
+    timer.start()
+    try:
+        send_detect_events(camera.username, camera.password, camera.ip, camera.camera_port, stream_path=camera.stream_path,
+                           stop_event=stop_event, display=False, stats=stats, tag=name,
+                           output_dir=os.path.join(camera.video_dir, name), grabber=camera.get_grabber())
+    finally:
+        timer.cancel()
+    snapshot = stats.snapshot()
+    return {"ok": snapshot["frames"] > 0, **snapshot}
+
+
+def op_ptz(name, camera, args):
+    from camera_supervisor_onvif import get_control_plane
+    future = camera.move_ptz(args.x, args.y, args.duration)
+    if future is None:
+        return {"ok": False, "error": "ONVIF not available"}
+    future.result(timeout=ONVIF_TIMEOUT * 2)
+    # The control plane stops the camera on a timer; a CLI process has to stay alive until that happens
+    plane = get_control_plane()
+    queue = plane.queues[camera.onvif_key()]
+    time.sleep(max(queue.stop_at - time.time(), 0))
+    plane.stop(camera.onvif_key()).result(timeout=ONVIF_TIMEOUT * 2)
+    return {"ok": True}
+
+
+def op_reboot(name, camera, args):
+    return {"ok": camera.reboot_camera()}
+
+
+OPERATIONS = {"ping": op_ping, "snapshot": op_snapshot, "record": op_record, "detect": op_detect, "ptz": op_ptz, "reboot": op_reboot}
+
+
+def run_one(command, name, cam_conf, args):
+    started = time.perf_counter()
+    camera = None
+    try:
+        camera = camera_from_config(cam_conf)
+        result = OPERATIONS[command](name, camera, args)
+    except Exception as e:
+        result = {"ok": False, "error": str(e)}
+    finally:
+        if camera is not None:
+            camera.close()
+    result["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def run_fleet(command, cameras, args, parallel=FLEET_PARALLEL):
+    """Runs one operation on every camera in `cameras` ({name: cam_conf}), at most `parallel` at a time.
+    Returns the JSON-ready report."""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(parallel, len(cameras)))) as pool:
+        futures = {name: pool.submit(run_one, command, name, cam_conf, args) for name, cam_conf in cameras.items()}
+        results = {name: future.result() for name, future in futures.items()}
+    ok = sum(1 for r in results.values() if r.get("ok"))
+    return {
+        "command": command,
+        "cameras": len(results),
+        "ok": ok,
+        "failed": len(results) - ok,
+        "elapsed_s": round(time.perf_counter() - started, 3),
+        "results": results,
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="camera_supervisor.py", description="Batch operations over the cameras in camera_details.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for command in FLEET_COMMANDS:
+        sub = commands.add_parser(command)
+        target = sub.add_mutually_exclusive_group(required=True)
+        target.add_argument("--cameras", help="Comma-separated camera_details keys")
+        target.add_argument("--all", action="store_true", help="Every camera in camera_details")
+        sub.add_argument("--parallel", type=int, default=FLEET_PARALLEL, help="Max cameras handled at once")
+        sub.add_argument("--config", default=CAMERA_CONFIG_PATH)
+        sub.add_argument("--output", help="Write the JSON results here instead of stdout")
+        if command == "ping":
+            sub.add_argument("--decode", action="store_true", help="Also decode a frame (slower)")
+        if command in ("record", "detect"):
+            sub.add_argument("--duration", type=int, default=10, help="Seconds")
+        if command == "ptz":
+            sub.add_argument("--x", type=float, default=0.0, help="Pan velocity -1..1")
+            sub.add_argument("--y", type=float, default=0.0, help="Tilt velocity -1..1")
+            sub.add_argument("--duration", type=float, default=1.0, help="Seconds to move")
+    return parser
+
+
+def run_cli(argv):
+    """Entry point for `camera_supervisor.py <command> ...`. Returns the exit code: 0 when every camera succeeded."""
+    args = build_parser().parse_args(argv)
+    # Keep stdout for the JSON result, from here on everything else goes to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        camera_data = load_data_from_yaml(args.config) or {}
+    details = camera_data.get("camera_details") or {}
+    if args.all:
+        cameras = details
+    else:
+        names = [name.strip() for name in args.cameras.split(",") if name.strip()]
+        unknown = [name for name in names if name not in details]
+        if unknown:
+            print(f"Unknown camera(s): {', '.join(unknown)}", file=sys.stderr)
+            return 2
+        cameras = {name: details[name] for name in names}
+    if not cameras:
+        print("No cameras selected.", file=sys.stderr)
+        return 2
+
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run_fleet(args.command, cameras, args, args.parallel)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0 if not report["failed"] else 1
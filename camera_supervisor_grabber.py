@@ -0,0 +1,227 @@
+import time,random,threading
+import cv2
+from camera_supervisor_constants import *
+from camera_supervisor_metrics import metrics
+
+
+DROP_POLICIES = ("latest", "all")
+
+
+class FrameGrabber:
+    """One long-lived RTSP session per camera. A background thread keeps the stream drained with grab()
+    and always holds the latest frame; any number of consumers read it through subscribe() without
+    opening extra sessions. Frames are shared between consumers, so copy before drawing on them.
+
+    drop_policy:
+        "latest" - retrieve() only when a consumer is waiting, every other grabbed frame is dropped
+                   undecoded. Consumers always get the newest frame no matter how slow they are.
+        "all"    - retrieve() every grabbed frame so the held frame is always current. Costs a colour
+                   conversion per frame; consumers that fall behind still skip to the newest one.
+    """
+
+    def __init__(self, rtsp_url, name="GRABBER", reconnect_delay=GRABBER_RECONNECT_DELAY, drop_policy=GRABBER_DROP_POLICY,
+                 stall_timeout=GRABBER_STALL_TIMEOUT, max_backoff=GRABBER_MAX_BACKOFF, label=None):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"drop_policy must be one of {DROP_POLICIES}, got '{drop_policy}'")
+        self.rtsp_url = rtsp_url
+        self.name = name
+        self.label = label or name      # camera label for the stage metrics
+        self.reconnect_delay = reconnect_delay
+        self.stall_timeout = stall_timeout      # no packet for this long counts as a stall and forces a reconnect
+        self.max_backoff = max_backoff
+        self.drop_policy = drop_policy
+        self.cond = threading.Condition()
+        self.frame = None
+        self.seq = 0                # grab() index of the held frame, so gaps between seqs are dropped frames
+        self.frame_time = 0.0       # time.time() when the held frame was grabbed off the stream
+        self.grab_time = 0.0        # time.time() of the last successful grab(), decoded or not
+        self.fps = 0.0              # stream fps reported by the backend
+        self.connected = False
+        self.sessions = 0           # successful connects; consumers compare it to notice a reconnect
+        self.waiters = 0            # consumers currently blocked in wait_frame()/latest()
+        # Counters
+        self.grabbed = 0
+        self.retrieved = 0
+        self.dropped = 0
+        self.reconnects = 0
+        self.stalls = 0
+        self.downtime = 0.0         # seconds spent disconnected after the first connect (closed outages)
+        self.down_since = None      # start of the current outage
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return self
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name=f"grabber-{self.name}", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self.stop_event.set()
+        with self.cond:
+            self.cond.notify_all()
+        if self.thread:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def frame_age(self):
+        """Seconds since the held frame was grabbed (inf if none yet)."""
+        return time.time() - self.frame_time if self.frame_time else float("inf")
+
+    def is_fresh(self, max_age=GRABBER_STALE_AFTER):
+        """True if the stream delivered a packet within max_age seconds (answers without decoding anything)."""
+        return self.connected and self.grab_time and time.time() - self.grab_time <= max_age
+
+    def counters(self):
+        down_since = self.down_since
+        return {"drop_policy": self.drop_policy, "grabbed": self.grabbed, "retrieved": self.retrieved, "dropped": self.dropped,
+                "connected": bool(self.connected), "reconnects": self.reconnects, "stalls": self.stalls,
+                "downtime_s": self.downtime + (time.time() - down_since if down_since else 0.0)}
+
+    def latest(self, timeout=GRABBER_READ_TIMEOUT, max_age=GRABBER_STALE_AFTER):
+        """Latest frame if it is at most max_age old, else waits up to timeout for a new one. Returns None on timeout."""
+        deadline = time.time() + timeout
+        with self.cond:
+            while not self.stop_event.is_set():
+                if self.frame is not None and self.frame_age() <= max_age:
+                    return self.frame
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._wait(remaining)
+        return None
+
+    def _wait(self, timeout):
+        # Caller holds self.cond. While waiters > 0 the "latest" policy retrieves the next grabbed frame.
+        self.waiters += 1
+        try:
+            self.cond.wait(timeout)
+        finally:
+            self.waiters -= 1
+
+    def wait_frame(self, after_seq, timeout=GRABBER_READ_TIMEOUT):
+        """Waits for a frame newer than after_seq. Returns (frame, seq, frame_time) or (None, after_seq, 0)."""
+        deadline = time.time() + timeout
+        with self.cond:
+            while not self.stop_event.is_set():
+                if self.seq > after_seq and self.frame is not None:
+                    return self.frame, self.seq, self.frame_time
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._wait(remaining)
+        return None, after_seq, 0.0
+
+    def subscribe(self):
+        return FrameSubscription(self.start())
+
+    def open_capture(self):
+        # With the FFmpeg backend a hung connect or read returns after stall_timeout instead of blocking forever
+        ms = int(self.stall_timeout * 1000)
+        try:
+            cap = cv2.VideoCapture(self.rtsp_url, cv2.CAP_FFMPEG, [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, ms, cv2.CAP_PROP_READ_TIMEOUT_MSEC, ms])
+        except (TypeError, AttributeError, cv2.error):
+            cap = cv2.VideoCapture(self.rtsp_url)   # OpenCV < 4.5.2 has no open params
+        if not cap.isOpened():
+            cap.release()
+            return None
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        self.fps = fps if 0 < fps <= 60 else 20.0
+        return cap
+
+    def backoff(self, attempt):
+        """Exponential reconnect delay with jitter, so cameras that dropped together do not reconnect in lockstep."""
+        return min(self.reconnect_delay * 2 ** attempt, self.max_backoff) * random.uniform(0.5, 1.0)
+
+    def disconnected(self, reason, attempt):
+        if self.connected:
+            self.down_since = time.time()
+        self.connected = False
+        delay = self.backoff(attempt)
+        print(f"[{self.name}] {reason}, reconnecting in {delay:.1f}s...")
+        self.stop_event.wait(delay)
+
+    def run(self):
+        cap = None
+        attempt = 0     # failed connects since the last good frame
+        clock = metrics.clock(self.label)
+        while not self.stop_event.is_set():
+            if cap is None:
+                cap = self.open_capture()
+                if cap is None:
+                    self.disconnected("Could not open stream", attempt)
+                    attempt += 1
+                    continue
+                if self.sessions:
+                    self.reconnects += 1
+                self.sessions += 1
+                self.connected = True
+                if self.down_since:
+                    outage = time.time() - self.down_since
+                    self.downtime += outage
+                    self.down_since = None
+                    print(f"[{self.name}] Stream reconnected after {outage:.1f}s (reconnect #{self.reconnects}).")
+                else:
+                    print(f"[{self.name}] Stream connected.")
+
+            clock.mark()
+            if not cap.grab():
+                # The backend gives up after stall_timeout without a packet, or the stream ended/errored
+                if time.time() - self.grab_time >= self.stall_timeout:
+                    self.stalls += 1
+                cap.release()
+                cap = None
+                self.disconnected("Read failed", attempt)
+                attempt += 1
+                continue
+            clock.lap("grab")
+            grab_time = self.grab_time = time.time()
+            self.grabbed += 1
+            attempt = 0
+
+            # Nobody is waiting: leave this frame undecoded, the next grab() replaces it
+            if self.drop_policy == "latest" and not self.waiters:
+                self.dropped += 1
+                continue
+
+            ret, frame = cap.retrieve()
+            clock.lap("retrieve")
+            if not ret or frame is None:
+                self.dropped += 1
+                continue
+            self.retrieved += 1
+
+            with self.cond:
+                self.frame = frame
+                self.seq = self.grabbed
+                self.frame_time = grab_time
+                self.cond.notify_all()
+
+        if cap is not None:
+            cap.release()
+        self.connected = False
+
+
+class FrameSubscription:
+    """A consumer cursor on a FrameGrabber: next() only returns frames this consumer has not seen yet."""
+
+    def __init__(self, grabber):
+        self.grabber = grabber
+        self.last_seq = grabber.seq
+        self.skipped = 0    # frames grabbed off the stream that this consumer never saw
+
+    def next(self, timeout=GRABBER_READ_TIMEOUT):
+        """Returns (frame, frame_time), or (None, 0) if no new frame arrived within timeout.
+        frame_time is when the frame was grabbed, so time.time() - frame_time is the capture-to-now latency."""
+        frame, seq, frame_time = self.grabber.wait_frame(self.last_seq, timeout)
+        if frame is None:
+            return None, 0.0
+        if self.last_seq:
+            self.skipped += seq - self.last_seq - 1
+        self.last_seq = seq
+        return frame, frame_time
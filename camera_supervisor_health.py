@@ -0,0 +1,256 @@
+import re,time,random,base64,hashlib,asyncio,threading
+from collections import deque
+from camera_supervisor_constants import *
+
+# Tiered health checks, cheapest first; a tier only runs when the one before it passed:
+#   tcp    - TCP connect to the RTSP port (and, informational only, the ONVIF port)
+#   rtsp   - RTSP OPTIONS + DESCRIBE (Basic/Digest auth), the camera must answer with an SDP that has a video track
+#   decode - one decoded frame; free when the camera has a running grabber, otherwise only every decode_interval
+HEALTH_STATUSES = ("unknown", "online", "degraded", "offline")
+
+
+def rtsp_authorization(method, uri, username, password, challenge):
+    """Authorization header answering a WWW-Authenticate challenge (Digest without qop, or Basic)."""
+    scheme, _, params = challenge.partition(" ")
+    if scheme.lower() == "basic":
+        return "Basic " + base64.b64encode(f"{username}:{password}".encode()).decode()
+    fields = dict(re.findall(r'(\w+)="?([^",]*)"?', params))
+    realm, nonce = fields.get("realm", ""), fields.get("nonce", "")
+    md5 = lambda text: hashlib.md5(text.encode()).hexdigest()
+    response = md5(f"{md5(f'{username}:{realm}:{password}')}:{nonce}:{md5(f'{method}:{uri}')}")
+    return f'Digest username="{username}", realm="{realm}", nonce="{nonce}", uri="{uri}", response="{response}"'
+
+
+async def rtsp_request(reader, writer, method, uri, cseq, headers=None):
+    """Sends one RTSP request, returns (status code, {header: [values]}, body)."""
+    lines = [f"{method} {uri} RTSP/1.0", f"CSeq: {cseq}", "User-Agent: camera-supervisor-health"]
+    lines += [f"{key}: {value}" for key, value in (headers or {}).items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode())
+    await writer.drain()
+    head = (await reader.readuntil(b"\r\n\r\n")).decode(errors="replace").split("\r\n")
+    status = int(head[0].split()[1])
+    response_headers = {}
+    for line in head[1:]:
+        if ":" in line:
+            key, _, value = line.partition(":")
+            response_headers.setdefault(key.strip().lower(), []).append(value.strip())
+    length = int(response_headers.get("content-length", ["0"])[0])
+    body = (await reader.readexactly(length)).decode(errors="replace") if length else ""
+    return status, response_headers, body
+
+
+async def probe_tcp(host, port, timeout=HEALTH_TCP_TIMEOUT):
+    """Connect latency in ms. Raises on failure/timeout."""
+    started = time.perf_counter()
+    _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    writer.close()
+    return (time.perf_counter() - started) * 1000
+
+
+async def probe_rtsp(host, port, path, username, password, timeout=HEALTH_RTSP_TIMEOUT):
+    """OPTIONS + DESCRIBE round trip in ms. Raises on failure, non-200 answers or an SDP without video."""
+    async def describe():
+        started = time.perf_counter()
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            uri = f"rtsp://{host}:{port}/{path}"
+            await rtsp_request(reader, writer, "OPTIONS", uri, 1)
+            status, headers, body = await rtsp_request(reader, writer, "DESCRIBE", uri, 2, {"Accept": "application/sdp"})
+            if status == 401 and headers.get("www-authenticate"):
+                challenges = headers["www-authenticate"]
+                challenge = next((c for c in challenges if c.lower().startswith("digest")), challenges[0])
+                status, headers, body = await rtsp_request(reader, writer, "DESCRIBE", uri, 3, {
+                    "Accept": "application/sdp", "Authorization": rtsp_authorization("DESCRIBE", uri, username, password, challenge)})
+            if status != 200:
+                raise ConnectionError(f"DESCRIBE answered {status}")
+            if "m=video" not in body:
+                raise ConnectionError("SDP has no video track")
+            return (time.perf_counter() - started) * 1000
+        finally:
+            writer.close()
+    return await asyncio.wait_for(describe(), timeout)
+
+
+def decode_one_frame(rtsp_url, timeout):
+    import cv2
+    ms = int(timeout * 1000)
+    cap = cv2.VideoCapture(rtsp_url, cv2.CAP_FFMPEG, [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, ms, cv2.CAP_PROP_READ_TIMEOUT_MSEC, ms])
+    try:
+        return cap.isOpened() and cap.read()[0]
+    finally:
+        cap.release()
+
+
+async def probe_decode(camera, timeout=HEALTH_DECODE_TIMEOUT):
+    """True when a frame can be decoded. A running grabber already decodes the stream, so that is just a freshness check."""
+    grabber = camera.grabber
+    if grabber is not None and grabber.is_running():
+        return grabber.is_fresh()
+    loop = asyncio.get_running_loop()
+    return await asyncio.wait_for(loop.run_in_executor(None, decode_one_frame, camera.rtsp_url, timeout), timeout + 1)
+
+
+async def check_camera(camera, decode=False, tcp_timeout=HEALTH_TCP_TIMEOUT, rtsp_timeout=HEALTH_RTSP_TIMEOUT, decode_timeout=HEALTH_DECODE_TIMEOUT):
+    """Runs the tiers against one CameraSupervisor. Returns {'status', 'tier' (the tier that failed, or None),
+    'tcp_ms', 'rtsp_ms', 'onvif', 'decoded', 'error'}."""
+    result = {"status": "offline", "tier": "tcp", "tcp_ms": None, "rtsp_ms": None, "onvif": None, "decoded": None, "error": None}
+
+    async def onvif_reachable():
+        try:
+            await probe_tcp(camera.ip, camera.onvif_port, tcp_timeout)
+            return True
+        except (OSError, asyncio.TimeoutError):
+            return False
+    onvif = asyncio.ensure_future(onvif_reachable())
+    try:
+        result["tcp_ms"] = await probe_tcp(camera.ip, camera.camera_port, tcp_timeout)
+        result["status"], result["tier"] = "degraded", "rtsp"
+        result["rtsp_ms"] = await probe_rtsp(camera.ip, camera.camera_port, camera.stream_path, camera.username, camera.password, rtsp_timeout)
+        if decode:
+            result["tier"] = "decode"
+            result["decoded"] = bool(await probe_decode(camera, decode_timeout))
+            if not result["decoded"]:
+                raise ConnectionError("no frame decoded")
+        result["status"], result["tier"] = "online", None
+    except asyncio.TimeoutError:
+        result["error"] = f"{result['tier']} timed out"
+    except (OSError, ValueError, IndexError, asyncio.IncompleteReadError) as e:
+        result["error"] = f"{result['tier']}: {e}"
+    result["onvif"] = await onvif
+    return result
+
+
+class CameraHealth:
+    """Latest state, uptime and probe history of one camera."""
+
+    def __init__(self, name):
+        self.name = name
+        self.status = "unknown"
+        self.result = None
+        self.failures = 0           # consecutive checks that were not online
+        self.last_check = None
+        self.last_online = None
+        self.next_check = 0.0
+        self.next_decode = 0.0
+        self.online_time = 0.0
+        self.observed_time = 0.0
+        self.history = deque(maxlen=HEALTH_HISTORY)     # (time, status, tcp_ms, rtsp_ms)
+
+    def update(self, result, now):
+        if self.last_check is not None:
+            # Time since the last check counts with the status seen at the last check
+            self.observed_time += now - self.last_check
+            if self.status == "online":
+                self.online_time += now - self.last_check
+        self.status = result["status"]
+        self.result = result
+        self.last_check = now
+        if self.status == "online":
+            self.failures = 0
+            self.last_online = now
+        else:
+            self.failures += 1
+        self.history.append((now, self.status, result["tcp_ms"], result["rtsp_ms"]))
+
+    def snapshot(self):
+        rtsp = sorted(ms for _, _, _, ms in self.history if ms is not None)
+        return {
+            "status": self.status,
+            "failed_tier": self.result["tier"] if self.result else None,
+            "error": self.result["error"] if self.result else None,
+            "onvif": self.result["onvif"] if self.result else None,
+            "last_check": self.last_check,
+            "last_online": self.last_online,
+            "consecutive_failures": self.failures,
+            "next_check": self.next_check,
+            "uptime_pct": self.online_time / self.observed_time * 100 if self.observed_time else None,
+            "rtsp_ms_p50": rtsp[len(rtsp) // 2] if rtsp else None,
+            "rtsp_ms_p95": rtsp[int(len(rtsp) * 0.95)] if rtsp else None,
+            "history": list(self.history),
+        }
+
+
+class HealthMonitor:
+    """Checks every camera periodically on its own asyncio loop (one background thread for the whole fleet).
+    Offline cameras are retried with jittered exponential backoff up to max_backoff. state() returns the
+    latest results from memory and never triggers a probe."""
+
+    def __init__(self, cameras, interval=HEALTH_INTERVAL, decode_interval=HEALTH_DECODE_INTERVAL, max_backoff=HEALTH_MAX_BACKOFF,
+                 concurrency=HEALTH_CONCURRENCY, tcp_timeout=HEALTH_TCP_TIMEOUT, rtsp_timeout=HEALTH_RTSP_TIMEOUT, decode_timeout=HEALTH_DECODE_TIMEOUT):
+        self.cameras = cameras      # name -> CameraSupervisor
+        self.interval = interval
+        self.decode_interval = decode_interval
+        self.max_backoff = max_backoff
+        self.concurrency = concurrency
+        self.timeouts = {"tcp_timeout": tcp_timeout, "rtsp_timeout": rtsp_timeout, "decode_timeout": decode_timeout}
+        self.lock = threading.Lock()
+        self.health = {name: CameraHealth(name) for name in cameras}
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        now = time.time()
+        for health in self.health.values():
+            health.next_check = now + random.uniform(0, min(self.interval, 5))    # spread the first round
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=lambda: asyncio.run(self.run()), name="health", daemon=True)
+        self.thread.start()
+        print(f"[HEALTH] Monitoring {len(self.cameras)} camera(s) every {self.interval}s.")
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(max(self.timeouts.values()) + 2)
+            self.thread = None
+
+    def backoff(self, failures):
+        if not failures:
+            return self.interval
+        return min(self.interval * 2 ** (failures - 1), self.max_backoff) * random.uniform(0.8, 1.2)
+
+    async def check(self, name, semaphore):
+        camera, health = self.cameras[name], self.health[name]
+        async with semaphore:
+            now = time.time()
+            # Decode only when the cheap tiers cannot tell: periodically, or to confirm a camera that failed decode
+            decode = now >= health.next_decode or (health.result is not None and health.result["tier"] == "decode")
+            result = await check_camera(camera, decode=decode, **self.timeouts)
+        now = time.time()
+        with self.lock:
+            previous = health.status
+            health.update(result, now)
+            if decode:
+                health.next_decode = now + self.decode_interval
+            health.next_check = now + self.backoff(health.failures)
+        if previous != health.status:
+            print(f"[HEALTH] {name}: {previous} -> {health.status}" + (f" ({result['error']})" if result["error"] else ""))
+
+    async def run(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        running = {}
+        while not self.stop_event.is_set():
+            now = time.time()
+            for name, health in self.health.items():
+                if name not in running and now >= health.next_check:
+                    running[name] = asyncio.ensure_future(self.check(name, semaphore))
+            for name in [n for n, task in running.items() if task.done()]:
+                task = running.pop(name)
+                if task.exception():
+                    print(f"[HEALTH] {name}: check failed: {task.exception()}")
+                    self.health[name].next_check = time.time() + self.interval
+            await asyncio.sleep(HEALTH_TICK)
+        for task in running.values():
+            task.cancel()
+
+    def state(self, name=None):
+        """Latest health of one camera, or {name: state} for all."""
+        with self.lock:
+            if name is not None:
+                return self.health[name].snapshot()
+            return {n: health.snapshot() for n, health in self.health.items()}
+
+    def summary(self):
+        with self.lock:
+            statuses = [health.status for health in self.health.values()]
+        return {status: statuses.count(status) for status in HEALTH_STATUSES}
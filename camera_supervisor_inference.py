@@ -0,0 +1,159 @@
+import time,queue,threading
+from camera_supervisor_constants import *
+from camera_supervisor_detectors import create_detector
+
+
+class InferenceRequest:
+    """A frame waiting for detection. wait() returns the person boxes [(x1, y1, x2, y2, conf), ...] or None on timeout."""
+
+    def __init__(self, frame, camera=None):
+        self.frame = frame
+        self.camera = camera
+        self.submitted = time.time()
+        self.done = threading.Event()
+        self.persons = None
+        self.error = None
+
+    def wait(self, timeout=INFERENCE_TIMEOUT):
+        if not self.done.wait(timeout):
+            return None
+        if self.error:
+            raise self.error
+        return self.persons
+
+
+class InferenceService:
+    """One person detector per host shared by every camera. Frames from all camera pipelines go through a
+    single queue and are grouped into dynamic batches (up to max_batch frames, or whatever arrived
+    within max_wait seconds of the first one) for one batched CPU forward pass."""
+
+    def __init__(self, model_path=INFERENCE_MODEL, max_batch=INFERENCE_MAX_BATCH, max_wait=INFERENCE_MAX_WAIT,
+                 conf=INFERENCE_CONF, queue_size=INFERENCE_QUEUE_SIZE, backend=DETECTOR_BACKEND, int8=False):
+        self.model_path = model_path
+        self.backend = backend
+        self.int8 = int8
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.conf = conf
+        self.requests = queue.Queue(maxsize=queue_size)
+        self.detector = None
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+        # Counters
+        self.batches = 0
+        self.frames = 0
+        self.rejected = 0
+        self.inference_time = 0.0
+        self.queue_wait_time = 0.0
+
+    def start(self):
+        """Loads the detector (raises if it cannot) and starts the batching thread."""
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return self
+            if self.detector is None:
+                self.detector = create_detector(self.backend, self.model_path, self.conf, int8=self.int8)
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run, name=f"inference-{self.backend}", daemon=True)
+            self.thread.start()
+            print(f"[INFERENCE] Service started: backend={self.backend}{' (int8)' if self.int8 else ''} model={self.model_path} "
+                  f"max_batch={self.max_batch} max_wait={self.max_wait * 1000:.0f}ms")
+            return self
+
+    def stop(self, timeout=5):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout)
+            self.thread = None
+        # Release anyone still waiting
+        while True:
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            request.done.set()
+
+    def submit(self, frame, camera=None):
+        """Queues a frame. Returns an InferenceRequest, or None if the queue is full (frame is dropped)."""
+        request = InferenceRequest(frame, camera)
+        try:
+            self.requests.put_nowait(request)
+        except queue.Full:
+            self.rejected += 1
+            return None
+        return request
+
+    def detect(self, frame, camera=None, timeout=INFERENCE_TIMEOUT):
+        """Blocking helper for a camera pipeline: person boxes for frame, or None if it was dropped / timed out."""
+        request = self.submit(frame, camera)
+        return request.wait(timeout) if request else None
+
+    def detect_many(self, frames, camera=None, timeout=INFERENCE_TIMEOUT):
+        """Submits several frames (e.g. motion crops) at once so they land in the same batch. Returns one
+        result per frame, None entries for frames that were dropped / timed out."""
+        requests = [self.submit(frame, camera) for frame in frames]
+        deadline = time.time() + timeout
+        return [request.wait(max(deadline - time.time(), 0)) if request else None for request in requests]
+
+    def next_batch(self):
+        try:
+            batch = [self.requests.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while not self.stop_event.is_set():
+            batch = self.next_batch()
+            if not batch:
+                continue
+            started = time.time()
+            try:
+                for request, persons in zip(batch, self.detector.detect_batch([request.frame for request in batch])):
+                    request.persons = persons
+            except Exception as e:
+                print(f"[INFERENCE] Batch of {len(batch)} failed: {e}")
+                for request in batch:
+                    request.error = e
+            finished = time.time()
+            self.batches += 1
+            self.frames += len(batch)
+            self.inference_time += finished - started
+            self.queue_wait_time += sum(started - request.submitted for request in batch)
+            for request in batch:
+                request.done.set()
+
+    def counters(self):
+        return {
+            "backend": f"{self.backend}-int8" if self.int8 else self.backend,
+            "batches": self.batches,
+            "frames": self.frames,
+            "rejected": self.rejected,
+            "queue_depth": self.requests.qsize(),
+            "avg_batch_size": self.frames / self.batches if self.batches else 0.0,
+            "avg_batch_ms": self.inference_time / self.batches * 1000 if self.batches else 0.0,
+            "avg_queue_wait_ms": self.queue_wait_time / self.frames * 1000 if self.frames else 0.0,
+        }
+
+
+inference_services = {}
+inference_services_lock = threading.Lock()
+
+
+def get_inference_service(backend=DETECTOR_BACKEND, int8=False, **settings):
+    """Process-wide shared InferenceService per backend, created and started on first use (settings only apply then)."""
+    key = (backend, int8)
+    with inference_services_lock:
+        if key not in inference_services:
+            inference_services[key] = InferenceService(backend=backend, int8=int8, **settings)
+    return inference_services[key].start()
@@ -0,0 +1,209 @@
+import time,bisect,threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+from camera_supervisor_constants import *
+
+# Stages timed per camera (seconds):
+#   grab      - grabber thread: cap.grab(), reads the next packet and decodes it (includes waiting on the network)
+#   retrieve  - grabber thread: cap.retrieve(), colour conversion of the decoded frame
+#   wait      - detection loop blocked on the grabber for a new frame
+#   resize, motion, inference, record, viewer - detection loop stages
+#   latency   - frame grabbed off the stream -> detection and recording done
+STAGES = ("grab", "retrieve", "wait", "resize", "motion", "inference", "record", "viewer", "latency")
+
+
+class Histogram:
+    """Fixed-bucket latency histogram. observe() is called from one thread per (camera, stage) and takes no lock;
+    readers may see a count one observation ahead of the sum, which is fine for monitoring."""
+    __slots__ = ("counts", "sum", "count", "last_counts")
+
+    def __init__(self):
+        self.counts = [0] * (len(METRICS_BUCKETS) + 1)     # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.last_counts = None    # counts at the previous window() call
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(METRICS_BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def window(self):
+        """Bucket counts since the previous call."""
+        counts = list(self.counts)
+        last, self.last_counts = self.last_counts, counts
+        return [n - m for n, m in zip(counts, last)] if last else counts
+
+
+def quantile(counts, q):
+    """Upper bound of the bucket holding the q-quantile of the bucket counts (inf when it is past the last bucket)."""
+    total = sum(counts)
+    if not total:
+        return None
+    seen = 0
+    for bound, n in zip(METRICS_BUCKETS + (float("inf"),), counts):
+        seen += n
+        if seen >= q * total:
+            return bound
+
+
+class StageClock:
+    """Lap timer for one camera's loop: lap(stage) records the time since the previous lap (or mark()) under stage."""
+    __slots__ = ("registry", "camera", "last")
+
+    def __init__(self, registry, camera):
+        self.registry = registry
+        self.camera = camera
+        self.last = time.perf_counter()
+
+    def mark(self):
+        self.last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.registry.histogram(self.camera, stage).observe(now - self.last)
+        self.last = now
+
+    def observe(self, stage, seconds):
+        self.registry.histogram(self.camera, stage).observe(seconds)
+
+
+class NullClock:
+    """What clock() hands out while metrics are disabled: every call is an empty method."""
+    __slots__ = ()
+
+    def mark(self):
+        pass
+
+    def lap(self, stage):
+        pass
+
+    def observe(self, stage, seconds):
+        pass
+
+
+NULL_CLOCK = NullClock()
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escape = lambda value: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class MetricsRegistry:
+    """Per-camera stage histograms plus collectors for counters that already live elsewhere (grabber, inference
+    queue, event bus). Collectors are only called when the metrics are read, never on the hot path.
+
+    A collector is a callable returning (name, type, {label: value}, value) tuples, type "counter" or "gauge".
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.histograms = {}        # (camera, stage) -> Histogram
+        self.collectors = []
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+        return self
+
+    def clock(self, camera):
+        """A StageClock for camera's loop, or the no-op NULL_CLOCK while disabled. Loops take their clock once at
+        start, so enable the registry before starting them."""
+        return StageClock(self, camera) if self.enabled else NULL_CLOCK
+
+    def histogram(self, camera, stage):
+        hist = self.histograms.get((camera, stage))
+        if hist is None:
+            with self.lock:
+                hist = self.histograms.setdefault((camera, stage), Histogram())
+        return hist
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def summary(self):
+        """{camera: {stage: (count, p50_s, p95_s)}} over the observations since the previous call, for the log line."""
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+        result = {}
+        for (camera, stage), hist in histograms:
+            counts = hist.window()
+            result.setdefault(camera, {})[stage] = (sum(counts), quantile(counts, 0.5), quantile(counts, 0.95))
+        return result
+
+    def exposition(self):
+        """All metrics in the Prometheus text format (0.0.4)."""
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+        lines = []
+        if histograms:
+            lines += ["# HELP camera_stage_seconds Time spent in each pipeline stage.", "# TYPE camera_stage_seconds histogram"]
+            for (camera, stage), hist in histograms:
+                counts, total = list(hist.counts), hist.sum
+                labels = {"camera": camera, "stage": stage}
+                cumulative = 0
+                for bound, n in zip(METRICS_BUCKETS + ("+Inf",), counts):
+                    cumulative += n
+                    lines.append(f"camera_stage_seconds_bucket{format_labels({**labels, 'le': bound})} {cumulative}")
+                lines.append(f"camera_stage_seconds_sum{format_labels(labels)} {total}")
+                lines.append(f"camera_stage_seconds_count{format_labels(labels)} {cumulative}")
+        samples = {}
+        for collector in self.collectors:
+            try:
+                for name, kind, labels, value in collector():
+                    samples.setdefault((name, kind), []).append((labels, value))
+            except Exception as e:
+                print(f"[METRICS] Collector failed: {e}")
+        for (name, kind), values in samples.items():
+            lines.append(f"# TYPE {name} {kind}")
+            lines += [f"{name}{format_labels(labels)} {float(value)}" for labels, value in values]
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry the grabbers and detection loops time themselves into; disabled until the engine enables it
+metrics = MetricsRegistry()
+
+
+class MetricsServer:
+    """Serves registry.exposition() at /metrics on a local HTTP port for Prometheus (or curl) to scrape."""
+
+    def __init__(self, registry, host=METRICS_HOST, port=METRICS_PORT):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if urlparse(self.path).path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.exposition().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True)
+        self.thread.start()
+        print(f"[METRICS] Serving http://{self.host}:{self.port}/metrics")
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,128 @@
+from collections import namedtuple
+import cv2
+import numpy as np
+from camera_supervisor_constants import *
+
+# score: fraction of the (downscaled) frame that changed, regions: [(x1, y1, x2, y2), ...] in input frame coordinates
+MotionResult = namedtuple("MotionResult", ["score", "regions"])
+NO_MOTION = MotionResult(0.0, [])
+
+MOTION_MODELS = ("running_average", "mog2")
+
+
+class MotionDetector:
+    """Motion engine run on a downscaled grayscale copy of every frame.
+
+    All intermediate images live in buffers allocated once for the stream's resolution and are written
+    with dst=, so steady-state update() allocates nothing per frame except the contour list. Motion is
+    measured against a background model instead of only the previous frame:
+        running_average - cv2.accumulateWeighted background, diffed against the current frame (cheapest)
+        mog2            - cv2.createBackgroundSubtractorMOG2, more robust to lighting/foliage, ~2x the cost
+    Contours are only extracted (RETR_EXTERNAL) when enough pixels changed to possibly pass the area test,
+    and the area test itself is one NumPy comparison.
+    """
+
+    def __init__(self, width=MOTION_WIDTH, threshold=MOTION_THRESHOLD, min_area_ratio=MOTION_MIN_AREA_RATIO,
+                 model=MOTION_MODEL, learning_rate=MOTION_LEARNING_RATE):
+        if model not in MOTION_MODELS:
+            raise ValueError(f"model must be one of {MOTION_MODELS}, got '{model}'")
+        self.width = width
+        self.threshold = threshold
+        self.min_area_ratio = min_area_ratio
+        self.model = model
+        self.learning_rate = learning_rate
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+        self.input_shape = None
+
+    def allocate(self, frame):
+        frame_h, frame_w = frame.shape[:2]
+        self.input_shape = frame.shape
+        self.scale = frame_w / self.width
+        h = max(int(frame_h / self.scale), 1)
+        self.size = (self.width, h)
+        self.small = np.empty((h, self.width, 3), dtype=np.uint8)
+        self.gray = np.empty((h, self.width), dtype=np.uint8)
+        self.blur = np.empty((h, self.width), dtype=np.uint8)
+        self.diff = np.empty((h, self.width), dtype=np.uint8)
+        self.mask = np.empty((h, self.width), dtype=np.uint8)
+        self.dilated = np.empty((h, self.width), dtype=np.uint8)
+        self.background = None
+        self.background_u8 = np.empty((h, self.width), dtype=np.uint8)
+        self.subtractor = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=16, detectShadows=False) if self.model == "mog2" else None
+        self.min_area = self.min_area_ratio * h * self.width
+
+    def reset(self):
+        """Forget the background (e.g. after a reconnect or a PTZ move)."""
+        self.input_shape = None
+
+    def update(self, frame):
+        """Feeds one BGR frame. Returns a MotionResult; regions only include areas bigger than min_area_ratio."""
+        if frame.shape != self.input_shape:
+            self.allocate(frame)
+
+        if frame.shape[1] == self.width:
+            cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        else:
+            cv2.resize(frame, self.size, dst=self.small, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        cv2.GaussianBlur(self.gray, (5, 5), 0, dst=self.blur)
+
+        if self.subtractor is not None:
+            self.subtractor.apply(self.blur, self.mask, self.learning_rate)
+        else:
+            if self.background is None:
+                self.background = self.blur.astype(np.float32)
+                return NO_MOTION
+            cv2.convertScaleAbs(self.background, dst=self.background_u8)
+            cv2.absdiff(self.blur, self.background_u8, dst=self.diff)
+            cv2.accumulateWeighted(self.blur, self.background, self.learning_rate)
+            cv2.threshold(self.diff, self.threshold, 255, cv2.THRESH_BINARY, dst=self.mask)
+
+        changed = cv2.countNonZero(self.mask)
+        score = changed / self.mask.size
+        # Not even the raw changed pixels add up to one minimum-size region: skip dilate/contours entirely
+        if changed < self.min_area / 4:
+            return MotionResult(score, [])
+
+        cv2.dilate(self.mask, self.kernel, dst=self.dilated, iterations=2)
+        contours, _ = cv2.findContours(self.dilated, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return MotionResult(score, [])
+        areas = np.fromiter((cv2.contourArea(c) for c in contours), dtype=np.float32, count=len(contours))
+        keep = np.flatnonzero(areas >= self.min_area)
+        if not len(keep):
+            return MotionResult(score, [])
+        rects = np.array([cv2.boundingRect(contours[i]) for i in keep], dtype=np.float32)
+        rects[:, 2:] += rects[:, :2]    # x, y, w, h -> x1, y1, x2, y2
+        return MotionResult(score, [tuple(r) for r in (rects * self.scale).astype(int).tolist()])
+
+
+def crop_regions(frame, regions, margin=CASCADE_CROP_MARGIN, min_size=CASCADE_MIN_CROP):
+    """Expands and merges motion regions into crops for the detector. Returns [(x_offset, y_offset, crop), ...]
+    or None when there are too many crops or they cover most of the frame (then the full frame is cheaper)."""
+    frame_h, frame_w = frame.shape[:2]
+    boxes = []
+    for x1, y1, x2, y2 in regions:
+        # Pad around the motion so the whole person is in the crop, and never below min_size
+        pad_x = max(int((x2 - x1) * margin), (min_size - (x2 - x1)) // 2, 0)
+        pad_y = max(int((y2 - y1) * margin), (min_size - (y2 - y1)) // 2, 0)
+        boxes.append([max(0, x1 - pad_x), max(0, y1 - pad_y), min(frame_w, x2 + pad_x), min(frame_h, y2 + pad_y)])
+
+    # Merge overlapping crops so one person is not split across two
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    boxes[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+
+    if len(boxes) > CASCADE_MAX_CROPS or sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in boxes) > CASCADE_MAX_CROP_RATIO * frame_w * frame_h:
+        return None
+    return [(x1, y1, frame[y1:y2, x1:x2]) for x1, y1, x2, y2 in boxes]
@@ -0,0 +1,232 @@
+import time,heapq,threading
+from collections import deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from camera_supervisor_constants import *
+
+# Connected ONVIF services of one camera, created once and reused by every command
+OnvifClient = namedtuple("OnvifClient", ["camera", "media", "ptz", "device", "profile_token"])
+
+shared_transport = None
+
+
+def get_shared_transport():
+    """One zeep transport (HTTP session) for every camera, so keep-alive connections are reused. onvif-zeep
+    reads its WSDLs from local files, which zeep does not cache, so each client still parses them once."""
+    global shared_transport
+    if shared_transport is None:
+        from zeep.transports import Transport
+        shared_transport = Transport(timeout=ONVIF_TIMEOUT, operation_timeout=ONVIF_TIMEOUT)
+    return shared_transport
+
+
+def default_client_factory(host, port, username, password):
+    """Builds an OnvifClient with onvif-zeep. The expensive part (WSDL parsing for the device, media and PTZ
+    services plus GetProfiles) happens here, once per camera, normally during warm_up()."""
+    from onvif import ONVIFCamera
+    camera = ONVIFCamera(host, port, username, password, transport=get_shared_transport())
+    media = camera.create_media_service()
+    try:
+        ptz = camera.create_ptz_service()
+    except Exception:
+        ptz = None      # fixed cameras have no PTZ service
+    profiles = media.GetProfiles()
+    return OnvifClient(camera, media, ptz, camera.devicemgmt, profiles[0].token if profiles else None)
+
+
+class CameraCommandQueue:
+    """Serializes the ONVIF commands of one camera on the control plane's pool. Commands queued while an
+    earlier one is on the wire are drained together, and a run of moves collapses into the newest one, so a
+    burst of key presses costs one ContinuousMove. Moves never sleep: the Stop is scheduled on the control
+    plane's timer and skipped if a later move extended the deadline."""
+
+    def __init__(self, plane, key):
+        self.plane = plane
+        self.key = key
+        self.lock = threading.Lock()
+        self.pending = deque()      # (command, args, future)
+        self.draining = False
+        self.velocity = None        # (x, y) while a ContinuousMove is active
+        self.stop_at = 0.0
+        self.sent = 0
+        self.merged = 0
+        self.failed = 0
+
+    def submit(self, command, *args):
+        future = Future()
+        with self.lock:
+            self.pending.append((command, args, future))
+            if not self.draining:
+                self.draining = True
+                self.plane.executor.submit(self.drain)
+        return future
+
+    def drain(self):
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.draining = False
+                    return
+                batch = list(self.pending)
+                self.pending.clear()
+            for command, args, futures in self.merge(batch):
+                try:
+                    result = self.execute(command, *args)
+                    self.sent += 1
+                    for future in futures:
+                        future.set_result(result)
+                except Exception as e:
+                    self.failed += 1
+                    self.plane.invalidate(self.key)    # reconnect on the next command
+                    print(f"[ONVIF] {self.key[0]}: {command} failed: {e}")
+                    for future in futures:
+                        future.set_exception(e)
+
+    def merge(self, batch):
+        merged = []
+        for command, args, future in batch:
+            if merged and command == "move" and merged[-1][0] == "move":
+                self.merged += 1
+                merged[-1] = (command, args, merged[-1][2] + [future])
+            else:
+                merged.append((command, args, [future]))
+        return merged
+
+    def execute(self, command, *args):
+        client = self.plane.client(self.key)
+        if command == "move":
+            x, y, duration = args
+            if client.ptz is None or client.profile_token is None:
+                raise RuntimeError("camera has no PTZ service or media profile")
+            if self.velocity != (x, y):
+                request = client.ptz.create_type('ContinuousMove')
+                request.ProfileToken = client.profile_token
+                request.Velocity = {'PanTilt': {'x': x, 'y': y}}
+                client.ptz.ContinuousMove(request)
+                self.velocity = (x, y)
+            self.stop_at = time.time() + duration
+            self.plane.schedule(self.stop_at, self)
+            return True
+        if command == "stop":
+            # A later move pushed the deadline out (or the camera is already stopped)
+            if self.velocity is None or time.time() < self.stop_at:
+                return False
+            client.ptz.Stop({'ProfileToken': client.profile_token, 'PanTilt': True, 'Zoom': True})
+            self.velocity = None
+            return True
+        if command == "reboot":
+            return client.device.SystemReboot()
+        if command == "profiles":
+            return client.media.GetProfiles()
+        raise ValueError(f"Unknown ONVIF command '{command}'")
+
+    def counters(self):
+        with self.lock:
+            return {"sent": self.sent, "merged": self.merged, "failed": self.failed, "pending": len(self.pending), "moving": self.velocity is not None}
+
+
+class OnvifControlPlane:
+    """ONVIF clients for every camera, built once (warm_up() does it ahead of the first command) and shared by
+    every caller, with commands run on a small thread pool instead of the caller's thread.
+
+    client_factory(host, port, username, password) -> OnvifClient can be replaced, e.g. to point the control
+    plane at a stub SOAP server or at plain fakes in tests."""
+
+    def __init__(self, client_factory=default_client_factory, max_workers=ONVIF_WORKERS):
+        self.client_factory = client_factory
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="onvif")
+        self.lock = threading.Lock()
+        self.clients = {}           # key -> OnvifClient
+        self.connect_locks = {}     # key -> Lock, one connection attempt per camera at a time
+        self.credentials = {}       # key -> password
+        self.queues = {}            # key -> CameraCommandQueue
+        self.timers = []            # heap of (when, seq, queue)
+        self.timer_seq = 0
+        self.timer_cond = threading.Condition()
+        self.closed = False
+        self.timer_thread = threading.Thread(target=self.run_timers, name="onvif-timer", daemon=True)
+        self.timer_thread.start()
+
+    def register(self, host, port, username, password):
+        key = (host, int(port), username)
+        with self.lock:
+            self.credentials[key] = password
+            self.connect_locks.setdefault(key, threading.Lock())
+            if key not in self.queues:
+                self.queues[key] = CameraCommandQueue(self, key)
+        return key
+
+    def client(self, key):
+        """The camera's OnvifClient, connecting on first use. Raises if the camera cannot be reached."""
+        client = self.clients.get(key)
+        if client is not None:
+            return client
+        with self.connect_locks[key]:
+            client = self.clients.get(key)
+            if client is None:
+                started = time.perf_counter()
+                client = self.client_factory(key[0], key[1], key[2], self.credentials[key])
+                self.clients[key] = client
+                print(f"[ONVIF] Connected to {key[0]}:{key[1]} in {time.perf_counter() - started:.1f}s.")
+        return client
+
+    def invalidate(self, key):
+        self.clients.pop(key, None)
+
+    def warm_up(self, key):
+        """Connects in the background; returns a Future with True/False."""
+        def connect():
+            try:
+                self.client(key)
+                return True
+            except Exception as e:
+                print(f"[ONVIF] Warm-up of {key[0]}:{key[1]} failed: {e}")
+                return False
+        return self.executor.submit(connect)
+
+    def move(self, key, x, y, duration=1.0):
+        return self.queues[key].submit("move", x, y, duration)
+
+    def stop(self, key):
+        return self.queues[key].submit("stop")
+
+    def reboot(self, key):
+        return self.queues[key].submit("reboot")
+
+    def profiles(self, key):
+        return self.queues[key].submit("profiles")
+
+    def schedule(self, when, queue):
+        with self.timer_cond:
+            self.timer_seq += 1
+            heapq.heappush(self.timers, (when, self.timer_seq, queue))
+            self.timer_cond.notify()
+
+    def run_timers(self):
+        while True:
+            with self.timer_cond:
+                while not self.closed and (not self.timers or self.timers[0][0] > time.time()):
+                    self.timer_cond.wait(self.timers[0][0] - time.time() if self.timers else None)
+                if self.closed:
+                    return
+                _, _, queue = heapq.heappop(self.timers)
+            queue.submit("stop")
+
+    def counters(self):
+        return {f"{key[0]}:{key[1]}": queue.counters() for key, queue in list(self.queues.items())}
+
+    def shutdown(self):
+        with self.timer_cond:
+            self.closed = True      # pending Stop timers are dropped with the pool
+            self.timer_cond.notify()
+        self.executor.shutdown(wait=False)
+
+
+control_plane = None
+
+
+def get_control_plane(client_factory=None):
+    """The process-wide OnvifControlPlane, created on first use."""
+    global control_plane
+    if control_plane is None:
+        control_plane = OnvifControlPlane(client_factory or default_client_factory)
+    return control_plane
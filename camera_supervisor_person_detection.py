@@ -1,114 +1,209 @@
 import time
-import datetime
 import sys
+import threading
 import os
 import cv2
-from ultralytics import YOLO
+from camera_supervisor_constants import *
+from camera_supervisor_grabber import FrameGrabber
+from camera_supervisor_inference import get_inference_service
+from camera_supervisor_scheduler import AdaptiveFrameScheduler
+from camera_supervisor_motion import MotionDetector, crop_regions
+from camera_supervisor_recording import create_event_recorder
+from camera_supervisor_events import make_event
+from camera_supervisor_metrics import metrics
 
-def send_detect_events(camera_id, password, ip_address, port, stream=1):
-    # Constants
-    FRAME_SKIP = 3  # Run detection every N frames to save CPU
-    
-    print(f"Starting detection on rtsp://{camera_id}:***@{ip_address}:{port}/stream{stream}")
+def send_detect_events(camera_id, password, ip_address, port, stream=1, stop_event=None, display=True, max_fps=None, stats=None, tag="DETECT", output_dir=None, grabber=None, inference=None, scheduler=None, cascade=False, pre_roll=RECORDING_PRE_ROLL, post_roll=RECORDING_POST_ROLL, recording_mode=RECORDING_MODE, segmenter=None, events=None, board=None, supervised=None, stream_path=None):
+    # stop_event: threading.Event used by the headless engine to end the loop cleanly
+    # display: show a window; it runs in the calling thread and detection moves to a worker thread, so the loop itself never draws or waits on the GUI
+    # max_fps: process at most this many frames/sec, extra frames are grabbed and discarded (bounds CPU per camera)
+    # stats: optional PipelineStats updated per processed frame
+    # output_dir: where clips are written (defaults to ./videos next to this file)
+    # grabber: shared FrameGrabber for this camera, a private one is opened (and closed) when omitted
+    # inference: InferenceService to batch with other cameras, defaults to the process-wide shared one
+    # scheduler: AdaptiveFrameScheduler deciding which frames get inference (idle/active/CPU budget)
+    # cascade: run the cheap motion stage on every frame and only send frames with motion (or their motion crops) to YOLO
+    # pre_roll / post_roll: seconds kept before the first and after the last detection in each clip
+    # recording_mode: "packet" cuts clips from the original stream without re-encoding, "frames" re-encodes the processed frames
+    # segmenter: running SegmentRecorder (continuous recording) that packet-mode clips are cut from instead of a private one
+    # events: EventBus that person/motion detections and saved clips are published to (asynchronously)
+    # board: FrameBoard that viewers (mosaic window, MJPEG server) read from; frames are only posted while a viewer is attached
+    # supervised: keep waiting for a stream that does not open yet instead of giving up; defaults to True when a stop_event is passed
+    # stream_path: the camera's RTSP path (e.g. "stream1", "h264/ch1/main/av_stream"), defaults to stream<stream>
+    if supervised is None:
+        supervised = stop_event is not None
+    stream_path = stream_path or f"stream{stream}"
+    if display:
+        kwargs = dict(locals(), display=False, stop_event=stop_event or threading.Event())
+        from camera_supervisor_viewer import FrameBoard, MosaicViewer
+        kwargs["board"] = FrameBoard()
+
+        def run():
+            try:
+                send_detect_events(**kwargs)
+            finally:
+                kwargs["stop_event"].set()
+        worker = threading.Thread(target=run, name=f"detect-{tag}", daemon=True)
+        worker.start()
+        print(f"[{tag}] Press 'q' in the window to stop.")
+        MosaicViewer(kwargs["board"], cell_width=VIEWER_WINDOW_WIDTH).show(kwargs["stop_event"], window="Person Detection")
+        kwargs["stop_event"].set()
+        worker.join()
+        return
+
+    print(f"[{tag}] Starting detection on rtsp://{camera_id}:***@{ip_address}:{port}/{stream_path}")
     
     try:
-        model = YOLO("yolov8n.pt")
-        model.verbose = False
+        if inference is None:
+            inference = get_inference_service()
     except Exception as e:
         print(f"Error loading YOLO model: {e}")
         return
 
-    url = f"rtsp://{camera_id}:{password}@{ip_address}:{port}/stream{stream}"
-    cap = cv2.VideoCapture(url)
-    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    own_grabber = grabber is None
+    if own_grabber:
+        url = f"rtsp://{camera_id}:{password}@{ip_address}:{port}/{stream_path}"
+        grabber = FrameGrabber(url, name=tag)
+    frames = grabber.subscribe()
     
-    if not cap.isOpened():
-        print(f"Error: Could not open video stream at {url}")
-        return
+    if grabber.latest() is None:
+        print(f"Error: Could not open video stream at rtsp://{camera_id}:***@{ip_address}:{port}/{stream_path}")
+        # Supervised loops keep waiting for the grabber to connect; interactive runs give up
+        if not supervised:
+            if own_grabber:
+                grabber.stop()
+            return
 
     # Output directory
-    output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "videos")
+    if output_dir is None:
+        output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "videos")
     os.makedirs(output_dir, exist_ok=True)
 
+    if scheduler is None:
+        scheduler = AdaptiveFrameScheduler(tag)
+    motion_detector = MotionDetector() if cascade else None
+
+    # Clips are written at the rate frames are actually processed, not the stream's rate
+    fps = grabber.fps or 20.0
+    if fps > 60: fps = 20.0
+    if max_fps: fps = min(fps, max_fps)
+    recorder = create_event_recorder(recording_mode, grabber.rtsp_url, output_dir, fps, tag=tag, pre_roll=pre_roll, post_roll=post_roll,
+                                     segmenter=segmenter)
+    if events:
+        recorder.on_clip.append(lambda path: events.publish(make_event("clip", tag, clip=path)))
+
     # State variables
-    video_writer = None
     is_recording = False
-    recording_start_time = None
     frame_count = 0
     person_found = False
+    persons = []
 
-    print("Detection loop started. Press 'q' to stop.")
+    print(f"[{tag}] Detection loop started.")
 
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            print("Stream ended or failed to read frame.")
-            break
+    min_interval = 1.0 / max_fps if max_fps else 0
+    last_processed = 0
+    last_skipped = 0
+    session = grabber.sessions
+    stalled = False
+    clock = metrics.clock(tag)    # no-op unless the metrics registry is enabled
+
+    while not (stop_event and stop_event.is_set()):
+        # Over the per-camera budget: wait it out, the grabber keeps draining the stream meanwhile
+        wait = min_interval - (time.time() - last_processed)
+        if wait > 0:
+            if stop_event:
+                stop_event.wait(wait)
+            else:
+                time.sleep(wait)
+            continue
+
+        clock.mark()
+        frame, frame_time = frames.next(GRABBER_STALL_TIMEOUT)
+        if frame is None:
+            if not grabber.is_running():
+                print(f"[{tag}] Stream closed.")
+                break
+            # Stalled: the grabber is reconnecting. Close the partial clip now instead of stretching it across
+            # the gap; the model, scheduler and recorder stay as they are for when frames come back.
+            if not stalled:
+                stalled = True
+                print(f"[{tag}] No frame for {GRABBER_STALL_TIMEOUT}s, waiting for the stream to reconnect...")
+                recorder.interrupt()
+                person_found = False
+                persons = []
+            continue
+        if stalled or grabber.sessions != session:
+            # Back after a stall or a reconnect: the old background does not match the new frames
+            stalled = False
+            session = grabber.sessions
+            if motion_detector:
+                motion_detector.reset()
+        last_processed = time.time()
+        clock.lap("wait")
 
         # Resize for consistent processing speed
         frame_h, frame_w = frame.shape[:2]
         new_h = int(frame_h * 640 / frame_w)
         frame = cv2.resize(frame, (640, new_h))
-        
-        # Run detection only every FRAME_SKIP frames
+        clock.lap("resize")
+
+        # Cascade: motion gate first. A static scene with nobody in it never reaches YOLO; a person already
+        # in view is still re-checked on the scheduler's interval even if they stand still.
         frame_count += 1
-        if frame_count % FRAME_SKIP == 0:
-            results = model(frame, conf=0.5, verbose=False)
-            
-            # Check for person class (Class ID 0 in COCO dataset)
-            person_found = False
-            for r in results:
-                for cls in r.boxes.cls:
-                    if int(cls) == 0:  # 0 is 'person'
-                        person_found = True
-                        break
-        
+        motion = motion_detector.update(frame) if motion_detector else None
+        motion_regions = motion.regions if motion else None
+        gated = motion_detector is not None and not motion_regions and not person_found
+        if motion_detector:
+            clock.lap("motion")
+        if motion_regions and events:
+            events.publish(make_event("motion", tag, frame_time, [(x1, y1, x2, y2, motion.score) for x1, y1, x2, y2 in motion_regions], (640, new_h)))
+
+        # Run detection only on the frames the scheduler picks (rarely when idle, every frame while active)
+        inferred = scheduler.should_infer(gated=gated)
+        if inferred:
+            # Batched with the other cameras, only person boxes (Class ID 0 in COCO dataset) come back
+            started = time.time()
+            last_persons = persons
+            crops = crop_regions(frame, motion_regions) if motion_regions else None
+            if crops:
+                results = inference.detect_many([crop for _, _, crop in crops], camera=tag)
+                persons = None if any(r is None for r in results) else [
+                    (x1 + dx, y1 + dy, x2 + dx, y2 + dy, conf) for (dx, dy, _), r in zip(crops, results) for x1, y1, x2, y2, conf in r]
+            else:
+                persons = inference.detect(frame, camera=tag)
+            if persons is None:
+                inferred = False    # queue full or timed out, keep the previous decision
+                persons = last_persons
+                scheduler.record(motion=bool(motion_regions))
+            else:
+                person_found = len(persons) > 0
+                scheduler.record(person=person_found, motion=bool(motion_regions), duration=time.time() - started)
+                if person_found and events:
+                    events.publish(make_event("person", tag, frame_time, persons, (640, new_h)))
+            clock.lap("inference")
+        else:
+            scheduler.record(motion=bool(motion_regions))
+            clock.mark()
+
         # --- Recording Logic ---
-        if person_found and not is_recording:
-            is_recording = True
-            recording_start_time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = os.path.join(output_dir, f"person_detect_{recording_start_time}_rec.avi")
-            
-            fps = cap.get(cv2.CAP_PROP_FPS) or 20.0
-            if fps > 60: fps = 20.0
-            
-            fourcc = cv2.VideoWriter_fourcc(*'XVID')
-            video_writer = cv2.VideoWriter(filename, fourcc, fps, (640, new_h))
-            print(f"[REC] Started: {filename}")
-        
-        elif not person_found and is_recording:
-            is_recording = False
-            if video_writer:
-                video_writer.release()
-                video_writer = None
-            
-            # Rename file to include end time
-            end_time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            old_path = os.path.join(output_dir, f"person_detect_{recording_start_time}_rec.avi")
-            new_path = os.path.join(output_dir, f"person_detect_{recording_start_time}_to_{end_time}.avi")
-            try:
-                os.rename(old_path, new_path)
-                print(f"[REC] Saved: {new_path}")
-            except OSError:
-                pass # safely ignore if rename fails, original file still exists
-
-        # Write frame if recording
-        if is_recording and video_writer:
-            video_writer.write(frame)
-            # Add visual indicator on the frame
-            cv2.circle(frame, (30, 30), 10, (0, 0, 255), -1) # Red dot
-            cv2.putText(frame, "REC", (50, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-
-        # Show frame
-        cv2.imshow("Person Detection", frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+        # Before an event the frame goes into the pre-roll buffer, during one into the clip
+        is_recording = recorder.update(frame, person_found, frame_time)
+        clock.lap("record")
+
+        # Viewers get the frame only while one is attached, and draw the REC marker and boxes themselves
+        if board is not None and board.active:
+            board.post(tag, frame, {"recording": is_recording, "persons": persons if person_found else []})
+            clock.lap("viewer")
+
+        # Capture-to-decision latency: grabbed off the stream -> detection and recording done
+        clock.observe("latency", time.time() - frame_time)
+        if stats:
+            stats.record_frame(time.time() - frame_time, inferred=inferred, recording=is_recording, dropped=frames.skipped - last_skipped, gated=gated)
+            last_skipped = frames.skipped
 
     # Cleanup
-    if video_writer:
-        video_writer.release()
-    cap.release()
-    cv2.destroyAllWindows()
+    recorder.close()
+    if own_grabber:
+        grabber.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,447 @@
+import os,time,datetime,threading,subprocess,shutil
+from collections import deque, namedtuple
+import cv2
+from camera_supervisor_constants import *
+from camera_supervisor_retention import record_file
+
+
+class FrameRingBuffer:
+    """Fixed-memory pre-roll buffer of recent frames. Frames are stored JPEG-compressed (roughly 20-40x smaller
+    than raw BGR) and evicted oldest-first once they are older than pre_roll seconds or the buffer would go
+    over max_bytes, so memory per camera stays bounded no matter the resolution or frame rate."""
+
+    def __init__(self, pre_roll=RECORDING_PRE_ROLL, max_bytes=RECORDING_BUFFER_BYTES, jpeg_quality=RECORDING_BUFFER_QUALITY):
+        self.pre_roll = pre_roll
+        self.max_bytes = max_bytes
+        self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self.packets = deque()      # (timestamp, jpeg bytes)
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.evicted = 0
+
+    def push(self, frame, timestamp=None):
+        timestamp = timestamp or time.time()
+        ok, packet = cv2.imencode(".jpg", frame, self.encode_params)
+        if not ok:
+            return
+        with self.lock:
+            self.packets.append((timestamp, packet))
+            self.bytes += packet.nbytes
+            while self.packets and (self.bytes > self.max_bytes or timestamp - self.packets[0][0] > self.pre_roll):
+                _, old = self.packets.popleft()
+                self.bytes -= old.nbytes
+                self.evicted += 1
+
+    def drain(self):
+        """Removes and yields (timestamp, frame) for everything buffered, oldest first."""
+        with self.lock:
+            packets, self.packets, self.bytes = self.packets, deque(), 0
+        for timestamp, packet in packets:
+            yield timestamp, cv2.imdecode(packet, cv2.IMREAD_COLOR)
+
+    def clear(self):
+        with self.lock:
+            self.packets.clear()
+            self.bytes = 0
+
+    def duration(self):
+        with self.lock:
+            return self.packets[-1][0] - self.packets[0][0] if len(self.packets) > 1 else 0.0
+
+
+class EventClipRecorder:
+    """Person-triggered clips with pre-roll and post-roll. Every frame goes through update(): while idle it is
+    kept in the ring buffer, when an event starts the buffer is flushed into the new clip first, and the clip
+    keeps recording until nobody has been seen for post_roll seconds.
+    Clips are person_detect_<start>_rec.avi while open and renamed to person_detect_<start>_to_<end>.avi."""
+
+    def __init__(self, output_dir, fps, tag="DETECT", pre_roll=RECORDING_PRE_ROLL, post_roll=RECORDING_POST_ROLL,
+                 max_bytes=RECORDING_BUFFER_BYTES):
+        self.output_dir = output_dir
+        self.fps = fps
+        self.tag = tag
+        self.post_roll = post_roll
+        self.buffer = FrameRingBuffer(pre_roll, max_bytes) if pre_roll else None
+        self.video_writer = None
+        self.recording_start_time = None
+        self.last_seen = 0.0
+        self.clips = 0
+        self.on_clip = []       # callbacks(path) for every saved clip
+        os.makedirs(output_dir, exist_ok=True)
+
+    @property
+    def is_recording(self):
+        return self.video_writer is not None
+
+    def update(self, frame, person_found, timestamp=None):
+        """Returns True while a clip is open (after this frame)."""
+        timestamp = timestamp or time.time()
+        if person_found:
+            self.last_seen = timestamp
+            if not self.is_recording:
+                self.start(frame)
+        elif self.is_recording and timestamp - self.last_seen > self.post_roll:
+            self.stop()
+
+        if self.is_recording:
+            self.video_writer.write(frame)
+        elif self.buffer:
+            self.buffer.push(frame, timestamp)
+        return self.is_recording
+
+    def start(self, frame):
+        self.recording_start_time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = os.path.join(self.output_dir, f"person_detect_{self.recording_start_time}_rec.avi")
+        frame_h, frame_w = frame.shape[:2]
+        fourcc = cv2.VideoWriter_fourcc(*'XVID')
+        self.video_writer = cv2.VideoWriter(filename, fourcc, self.fps, (frame_w, frame_h))
+        self.clips += 1
+        pre_roll = 0
+        if self.buffer:
+            for _, buffered in self.buffer.drain():
+                if buffered is not None and buffered.shape == frame.shape:
+                    self.video_writer.write(buffered)
+                    pre_roll += 1
+        print(f"[{self.tag}][REC] Started: {filename} (pre-roll {pre_roll} frames)")
+
+    def stop(self):
+        if not self.is_recording:
+            return
+        self.video_writer.release()
+        self.video_writer = None
+
+        # Rename file to include end time
+        end_time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        old_path = os.path.join(self.output_dir, f"person_detect_{self.recording_start_time}_rec.avi")
+        new_path = os.path.join(self.output_dir, f"person_detect_{self.recording_start_time}_to_{end_time}.avi")
+        try:
+            os.rename(old_path, new_path)
+            record_file(new_path)
+            print(f"[{self.tag}][REC] Saved: {new_path}")
+        except OSError:
+            new_path = old_path # safely ignore if rename fails, original file still exists
+        for callback in self.on_clip:
+            callback(new_path)
+
+    def interrupt(self):
+        """The stream dropped: closes the open clip at the last frame written and drops the pre-roll, which would
+        otherwise be spliced across the gap. The recorder stays usable for the next event."""
+        self.stop()
+        if self.buffer:
+            self.buffer.clear()
+
+    def close(self):
+        """Finalizes any open clip (shutdown / reconnect) and drops the pre-roll."""
+        self.interrupt()
+
+
+# A finished segment of the packet recorder, start/end in wall-clock seconds
+Segment = namedtuple("Segment", ["path", "start", "end"])
+
+# seg_<launch time>_<sequence>.mp4: ffmpeg numbers the segments of one launch, so names never collide
+# however short the segments are, and each launch (restart) gets a new millisecond launch stamp
+SEGMENT_LAUNCH_FORMAT = "%Y%m%d_%H%M%S_%f"
+
+
+class SegmentRecorder:
+    """Persistent ffmpeg segmenter for one camera. It copies the camera's compressed packets (-c:v copy, no
+    decode or re-encode) into short MP4 segments that always start on a keyframe, and reads the segment
+    muxer's CSV list to learn when each segment is complete. Completed segments are reported to on_segment
+    callbacks and pruned once they are older than `keep` seconds and not pinned by an event; pruning deletes
+    the file unless delete_pruned is False (continuous recording, where the ClipStore owns the footage)."""
+
+    def __init__(self, rtsp_url, segment_dir, segment_time=RECORDING_SEGMENT_TIME, tag="DETECT", keep=None, delete_pruned=True):
+        self.rtsp_url = rtsp_url
+        self.segment_dir = segment_dir
+        self.segment_time = segment_time
+        self.tag = tag
+        self.keep = keep                # seconds of completed segments tracked in memory, None = all
+        self.delete_pruned = delete_pruned
+        self.list_path = os.path.join(segment_dir, "segments.csv")
+        self.launch_id = None           # name prefix of the running ffmpeg's segments
+        self.last_sequence = -1         # newest segment number of this launch already collected
+        self.anchor = None              # wall time of the launch's timestamp 0, from the first completed segment
+        self.segments = deque()         # completed Segments, oldest first
+        self.pins = {}                  # token -> earliest wall time that must be kept
+        self.on_segment = []
+        self.lock = threading.Lock()
+        self.process = None
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.restarts = 0
+
+    def command(self):
+        pattern = os.path.join(self.segment_dir, f"seg_{self.launch_id}_%05d.mp4")
+        return ['ffmpeg', '-y', '-loglevel', 'error', '-rtsp_transport', 'tcp', '-i', self.rtsp_url,
+                '-map', '0:v:0', '-map', '0:a?', '-c:v', 'copy', '-c:a', 'aac',
+                '-f', 'segment', '-segment_time', str(self.segment_time), '-segment_format', 'mp4',
+                # fragment at every keyframe so ClipStore.locate() can map a time to a seekable byte offset
+                '-segment_format_options', 'movflags=+frag_keyframe+empty_moov', '-reset_timestamps', '1',
+                '-segment_list', self.list_path, '-segment_list_type', 'csv', '-segment_list_size', str(RECORDING_SEGMENT_LIST_SIZE), pattern]
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return self
+        os.makedirs(self.segment_dir, exist_ok=True)
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name=f"segmenter-{self.tag}", daemon=True)
+        self.thread.start()
+        return self
+
+    def launch(self):
+        # Until the new ffmpeg rewrites the segment list it still holds the last launch's entries, the prefix skips them
+        self.launch_id = datetime.datetime.now().strftime(SEGMENT_LAUNCH_FORMAT)[:-3]
+        self.last_sequence = -1
+        self.anchor = None
+        try:
+            self.process = subprocess.Popen(self.command(), stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            print(f"[{self.tag}][SEGMENT] Segmenter started (PID: {self.process.pid}).")
+        except FileNotFoundError:
+            print(f"[{self.tag}][SEGMENT] Error: 'ffmpeg' command not found. Please install ffmpeg.")
+            self.stop_event.set()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            if self.process is None or self.process.poll() is not None:
+                if self.process is not None:
+                    self.poll()     # collect what the dead process finished before its list is truncated
+                    self.restarts += 1
+                    print(f"[{self.tag}][SEGMENT] Segmenter exited ({self.process.returncode}), restarting in {GRABBER_RECONNECT_DELAY}s...")
+                    if self.stop_event.wait(GRABBER_RECONNECT_DELAY):
+                        break
+                self.launch()
+            self.poll()
+            self.stop_event.wait(0.5)
+
+    def stop(self):
+        """Stops ffmpeg gracefully ('q' lets it finalize the open segment) and collects the last segments."""
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(5)
+            self.thread = None
+        if self.process and self.process.poll() is None:
+            try:
+                self.process.communicate(b'q', timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.terminate()
+                try:
+                    self.process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    self.process.kill()
+            except (BrokenPipeError, OSError):
+                pass
+        self.process = None
+        self.poll()
+
+    def poll(self):
+        """Reads newly completed segments from the CSV list. ffmpeg keeps only the last RECORDING_SEGMENT_LIST_SIZE
+        entries in it, so it is reread whole and entries are matched by sequence number; the directory is never scanned."""
+        if self.launch_id is None:
+            return
+        try:
+            with open(self.list_path) as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        prefix = f"seg_{self.launch_id}_"
+        for line in data.split("\n")[:-1]:     # the last line may still be being written
+            parts = line.strip().split(",")
+            name = os.path.basename(parts[0])
+            if len(parts) < 3 or not name.startswith(prefix):
+                continue
+            try:
+                sequence = int(os.path.splitext(name)[0][len(prefix):])
+                start_time, end_time = float(parts[1]), float(parts[2])
+            except ValueError:
+                continue
+            if sequence <= self.last_sequence:
+                continue
+            self.last_sequence = sequence
+            path = os.path.join(self.segment_dir, name)
+            if self.anchor is None:
+                # The list has stream times; the first segment's file was finished when its end time was reached
+                try:
+                    self.anchor = os.path.getmtime(path) - end_time
+                except OSError:
+                    self.anchor = time.time() - end_time
+            segment = Segment(path, self.anchor + start_time, self.anchor + end_time)
+            with self.lock:
+                self.segments.append(segment)
+            for callback in self.on_segment:
+                try:
+                    callback(segment)
+                except Exception as e:
+                    print(f"[{self.tag}][SEGMENT] on_segment callback failed: {e}")
+        self.prune()
+
+    def prune(self):
+        if self.keep is None:
+            return
+        with self.lock:
+            horizon = time.time() - self.keep
+            if self.pins:
+                horizon = min(horizon, min(self.pins.values()))
+            while self.segments and self.segments[0].end < horizon:
+                segment = self.segments.popleft()
+                if not self.delete_pruned:
+                    continue
+                try:
+                    os.remove(segment.path)
+                except OSError:
+                    pass
+
+    def pin(self, token, since):
+        with self.lock:
+            self.pins[token] = since
+
+    def unpin(self, token):
+        with self.lock:
+            self.pins.pop(token, None)
+
+    def pinned_paths(self):
+        """Absolute paths of the completed segments a pinned event still needs (RetentionManager protector)."""
+        with self.lock:
+            if not self.pins:
+                return set()
+            since = min(self.pins.values())
+            return {os.path.abspath(segment.path) for segment in self.segments if segment.end > since}
+
+    def completed_until(self):
+        with self.lock:
+            return self.segments[-1].end if self.segments else 0.0
+
+    def segments_between(self, start, end):
+        with self.lock:
+            return [s for s in self.segments if s.end > start and s.start < end]
+
+
+def concat_segments(segments, output_path, tag="DETECT"):
+    """Joins keyframe-aligned segments into one MP4 with the concat demuxer, stream copy only."""
+    list_path = output_path + ".txt"
+    with open(list_path, "w") as f:
+        for segment in segments:
+            f.write(f"file '{os.path.abspath(segment.path)}'\n")
+    command = ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy', '-movflags', '+faststart', output_path]
+    try:
+        result = subprocess.run(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=60)
+        if result.returncode != 0:
+            print(f"[{tag}][REC] Concat failed: {result.stderr.decode(errors='replace').strip()}")
+            return False
+        return True
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"[{tag}][REC] Concat failed: {e}")
+        return False
+    finally:
+        try:
+            os.remove(list_path)
+        except OSError:
+            pass
+
+
+class PacketEventRecorder:
+    """Person-triggered clips cut from the camera's original compressed stream. Same update()/close() interface
+    as EventClipRecorder, but the frames passed in are only used for timing: the clip is assembled from the
+    SegmentRecorder's segments covering [first detection - pre_roll, last detection + post_roll], rounded out
+    to segment (keyframe) boundaries, at full resolution and without re-encoding."""
+
+    def __init__(self, rtsp_url, output_dir, tag="DETECT", pre_roll=RECORDING_PRE_ROLL, post_roll=RECORDING_POST_ROLL,
+                 segment_time=RECORDING_SEGMENT_TIME, segmenter=None):
+        self.output_dir = output_dir
+        self.tag = tag
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        os.makedirs(output_dir, exist_ok=True)
+        self.own_segmenter = segmenter is None
+        if self.own_segmenter:
+            segmenter = SegmentRecorder(rtsp_url, os.path.join(output_dir, ".segments"), segment_time, tag,
+                                        keep=pre_roll + 3 * segment_time)
+        self.segmenter = segmenter.start()
+        self.event = None       # [token, start, last_seen] of the open event
+        self.events = 0         # token source for segment pins
+        self.pending = []       # ended events (token, start, end) waiting for their last segment to complete
+        self.exports = []
+        self.clips = 0
+        self.on_clip = []       # callbacks(path) for every saved clip, called from the export thread
+
+    @property
+    def is_recording(self):
+        return self.event is not None
+
+    def update(self, frame, person_found, timestamp=None):
+        timestamp = timestamp or time.time()
+        if person_found:
+            if self.event is None:
+                self.events += 1
+                self.event = [self.events, timestamp - self.pre_roll, timestamp]
+                self.segmenter.pin(self.events, self.event[1])
+                print(f"[{self.tag}][REC] Event started at {datetime.datetime.fromtimestamp(timestamp):%Y%m%d_%H%M%S} (pre-roll {self.pre_roll}s)")
+            self.event[2] = timestamp
+        elif self.event is not None and timestamp - self.event[2] > self.post_roll:
+            self.end_event()
+        self.flush()
+        return self.is_recording
+
+    def end_event(self):
+        token, start, last_seen = self.event
+        self.pending.append((token, start, last_seen + self.post_roll))
+        self.event = None
+
+    def flush(self, force=False):
+        """Exports every ended event whose last segment is complete (all of them if force)."""
+        completed = self.segmenter.completed_until()
+        ready = [event for event in self.pending if force or completed >= event[2]]
+        for event in ready:
+            self.pending.remove(event)
+            thread = threading.Thread(target=self.export, args=event, name=f"export-{self.tag}", daemon=True)
+            thread.start()
+            self.exports.append(thread)
+        self.exports = [t for t in self.exports if t.is_alive()]
+
+    def export(self, token, start, end):
+        try:
+            segments = self.segmenter.segments_between(start, end)
+            if not segments:
+                print(f"[{self.tag}][REC] No segments recorded for event {datetime.datetime.fromtimestamp(start):%Y%m%d_%H%M%S}, clip skipped.")
+                return
+            start_name = datetime.datetime.fromtimestamp(segments[0].start).strftime("%Y%m%d_%H%M%S")
+            end_name = datetime.datetime.fromtimestamp(segments[-1].end).strftime("%Y%m%d_%H%M%S")
+            path = os.path.join(self.output_dir, f"person_detect_{start_name}_to_{end_name}.mp4")
+            if concat_segments(segments, path, self.tag):
+                self.clips += 1
+                record_file(path)
+                print(f"[{self.tag}][REC] Saved: {path} ({len(segments)} segments, {segments[-1].end - segments[0].start:.1f}s)")
+                for callback in self.on_clip:
+                    callback(path)
+        finally:
+            self.segmenter.unpin(token)
+
+    def interrupt(self):
+        """The stream dropped: ends any open event now. Its clip is exported once the segmenter (which restarts
+        ffmpeg by itself) has completed the covering segments, or at close()."""
+        if self.event is not None:
+            self.event[2] = min(self.event[2], time.time() - self.post_roll)
+            self.end_event()
+        self.flush()
+
+    def close(self):
+        """Ends any open event at the current time, lets ffmpeg finalize and exports every pending clip."""
+        if self.event is not None:
+            self.event[2] = min(self.event[2], time.time() - self.post_roll)
+            self.end_event()
+        if self.own_segmenter:
+            self.segmenter.stop()
+        self.flush(force=True)
+        for thread in self.exports:
+            thread.join(60)
+        self.exports = []
+
+
+def create_event_recorder(mode, rtsp_url, output_dir, fps, tag="DETECT", pre_roll=RECORDING_PRE_ROLL, post_roll=RECORDING_POST_ROLL,
+                          segmenter=None):
+    """'packet' (stream copy via ffmpeg) when ffmpeg is installed, otherwise the re-encoding 'frames' recorder.
+    segmenter: an already running SegmentRecorder (e.g. continuous recording) to cut event clips from."""
+    if mode == "packet":
+        if shutil.which("ffmpeg"):
+            return PacketEventRecorder(rtsp_url, output_dir, tag=tag, pre_roll=pre_roll, post_roll=post_roll, segmenter=segmenter)
+        print(f"[{tag}][REC] 'ffmpeg' not found, falling back to re-encoded (frames) event recording.")
+    return EventClipRecorder(output_dir, fps, tag=tag, pre_roll=pre_roll, post_roll=post_roll)
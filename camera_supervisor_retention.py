@@ -0,0 +1,256 @@
+import os,time,heapq,threading
+from collections import defaultdict
+from camera_supervisor_constants import *
+
+# Kinds of files the supervisor writes, in the order they are given up when a quota is exceeded:
+# continuous footage goes first, person event clips last.
+KIND_PRIORITY = {"continuous": 0, "image": 1, "manual": 2, "event": 3}
+MEDIA_EXTENSIONS = (".mp4", ".avi", ".jpg", ".jpeg", ".png")
+UNMANAGED_DIRS = (".segments",)     # the packet recorder's rolling buffer prunes itself
+
+
+def classify(root, path):
+    """(camera, kind) for a file under one of the managed roots, or None if it is not managed."""
+    rel = os.path.relpath(path, root)
+    parts = rel.split(os.sep)
+    name = parts[-1]
+    if not name.lower().endswith(MEDIA_EXTENSIONS) or any(p in UNMANAGED_DIRS for p in parts):
+        return None
+    if "continuous" in parts[:-1]:
+        kind = "continuous"
+    elif name.startswith("person_detect_"):
+        kind = "event"
+    elif name.startswith("video_"):
+        kind = "manual"
+    else:
+        kind = "image"
+    # videos/<camera_key>/... in the headless engine, flat directories for the interactive tester
+    camera = parts[0] if len(parts) > 1 and parts[0] != "continuous" else "default"
+    return camera, kind
+
+
+class RetentionManager:
+    """Keeps the images/ and videos/ trees within per-camera and global byte quotas and per-kind maximum ages.
+
+    Sizes come from an index that is built with a single scan at start() and then kept up to date by
+    record_file() calls from everything that writes footage, so the pruner never walks or stats the tree again.
+    Pruning runs on a low-priority background thread and deletes in small batches. Files deleted are reported to
+    on_delete callbacks (the ClipStore drops them from its time index). Protectors are callables returning paths
+    that must not be deleted right now (segments a pending event export still needs); they are asked again
+    before every batch."""
+
+    def __init__(self, roots=("images", "videos"), global_quota=RETENTION_GLOBAL_QUOTA, camera_quota=RETENTION_CAMERA_QUOTA,
+                 camera_quotas=None, max_age=None, interval=RETENTION_INTERVAL, batch=RETENTION_BATCH):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.global_quota = global_quota
+        self.camera_quota = camera_quota
+        self.camera_quotas = camera_quotas or {}    # camera -> bytes, overrides camera_quota
+        self.max_age = {**RETENTION_MAX_AGE, **(max_age or {})}    # kind -> seconds, None keeps forever
+        self.interval = interval
+        self.batch = batch
+        self.lock = threading.Lock()
+        self.files = {}                         # path -> (camera, kind, size, mtime)
+        self.camera_bytes = defaultdict(int)
+        self.total_bytes = 0
+        self.on_delete = []
+        self.protectors = []
+        self.stop_event = threading.Event()
+        self.thread = None
+        # Disk-write throughput per camera
+        self.written = defaultdict(int)
+        self.window_written = defaultdict(int)
+        self.window_start = time.time()
+        self.deleted_files = 0
+        self.deleted_bytes = 0
+
+    def start(self):
+        self.scan()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="retention", daemon=True)
+        self.thread.start()
+        print(f"[RETENTION] Indexed {len(self.files)} files ({self.total_bytes / 1e9:.2f} GB), pruning every {self.interval}s.")
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(5)
+            self.thread = None
+
+    def scan(self):
+        """The one full walk, at startup. Everything after that is incremental."""
+        for root in self.roots:
+            for dirpath, _, filenames in os.walk(root):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    self.add(path, st.st_size, st.st_mtime, count_write=False)
+
+    def root_of(self, path):
+        for root in self.roots:
+            if path == root or path.startswith(root + os.sep):
+                return root
+        return None
+
+    def add(self, path, size, mtime, count_write=True):
+        path = os.path.abspath(path)
+        root = self.root_of(path)
+        info = classify(root, path) if root else None
+        if info is None:
+            return
+        camera, kind = info
+        with self.lock:
+            previous = self.files.get(path)
+            if previous:
+                self.camera_bytes[previous[0]] -= previous[2]
+                self.total_bytes -= previous[2]
+            self.files[path] = (camera, kind, size, mtime)
+            self.camera_bytes[camera] += size
+            self.total_bytes += size
+            if count_write:
+                grown = size - (previous[2] if previous else 0)
+                self.written[camera] += grown
+                self.window_written[camera] += grown
+
+    def record(self, path, size=None):
+        """Registers a file that was just written (or grew)."""
+        try:
+            if size is None:
+                size = os.path.getsize(path)
+        except OSError:
+            return
+        self.add(path, size, time.time())
+
+    def forget(self, path):
+        path = os.path.abspath(path)
+        with self.lock:
+            info = self.files.pop(path, None)
+            if info:
+                self.camera_bytes[info[0]] -= info[2]
+                self.total_bytes -= info[2]
+        return info
+
+    def protected(self):
+        paths = set()
+        for protector in self.protectors:
+            try:
+                paths.update(protector())
+            except Exception as e:
+                print(f"[RETENTION] Protector failed: {e}")
+        return paths
+
+    def quota_for(self, camera):
+        return self.camera_quotas.get(camera, self.camera_quota)
+
+    def candidates(self, now):
+        """Files to delete, in order: expired by age first, then whatever brings cameras and the host under quota."""
+        with self.lock:
+            files = list(self.files.items())
+            camera_bytes = dict(self.camera_bytes)
+            total = self.total_bytes
+        protected = self.protected()
+        files = [(path, info) for path, info in files if path not in protected]
+
+        doomed = []
+        for path, (camera, kind, size, mtime) in files:
+            max_age = self.max_age.get(kind)
+            if max_age is not None and now - mtime > max_age:
+                doomed.append(path)
+                camera_bytes[camera] -= size
+                total -= size
+        expired = set(doomed)
+
+        over_camera = {c for c, b in camera_bytes.items() if self.quota_for(c) and b > self.quota_for(c)}
+        if not over_camera and not (self.global_quota and total > self.global_quota):
+            return doomed
+
+        # Lowest-priority kind first, oldest first within a kind
+        heap = [(KIND_PRIORITY.get(kind, 0), mtime, path, camera, size) for path, (camera, kind, size, mtime) in files if path not in expired]
+        heapq.heapify(heap)
+        while heap and (over_camera or (self.global_quota and total > self.global_quota)):
+            _, _, path, camera, size = heapq.heappop(heap)
+            global_over = self.global_quota and total > self.global_quota
+            if camera not in over_camera and not global_over:
+                continue
+            doomed.append(path)
+            camera_bytes[camera] -= size
+            total -= size
+            if camera in over_camera and camera_bytes[camera] <= self.quota_for(camera):
+                over_camera.discard(camera)
+        return doomed
+
+    def prune(self):
+        doomed = self.candidates(time.time())
+        for i in range(0, len(doomed), self.batch):
+            if self.stop_event.is_set():
+                break
+            deleted = []
+            protected = self.protected()    # an event may have pinned segments since candidates() ran
+            for path in doomed[i:i + self.batch]:
+                if path in protected:
+                    continue
+                info = self.forget(path)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"[RETENTION] Could not delete {path}: {e}")
+                    continue
+                deleted.append(path)
+                if info:
+                    self.deleted_files += 1
+                    self.deleted_bytes += info[2]
+            for callback in self.on_delete:
+                try:
+                    callback(deleted)
+                except Exception as e:
+                    print(f"[RETENTION] on_delete callback failed: {e}")
+            self.stop_event.wait(RETENTION_BATCH_PAUSE)   # keep deletes from saturating the disk
+        if doomed:
+            print(f"[RETENTION] Pruned {len(doomed)} files, {self.total_bytes / 1e9:.2f} GB in use.")
+
+    def run(self):
+        try:
+            # Linux: per-thread nice value, the pruner only runs when the cameras leave CPU/disk time over
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.prune()
+            except Exception as e:
+                print(f"[RETENTION] Prune failed: {e}")
+
+    def counters(self):
+        with self.lock:
+            now = time.time()
+            elapsed = max(now - self.window_start, 1e-6)
+            throughput = {camera: written / elapsed for camera, written in self.window_written.items()}
+            self.window_written = defaultdict(int)
+            self.window_start = now
+            return {
+                "total_bytes": self.total_bytes,
+                "files": len(self.files),
+                "camera_bytes": dict(self.camera_bytes),
+                "write_bytes_per_sec": throughput,
+                "deleted_files": self.deleted_files,
+                "deleted_bytes": self.deleted_bytes,
+            }
+
+
+retention_manager = None
+
+
+def set_retention_manager(manager):
+    global retention_manager
+    retention_manager = manager
+
+
+def record_file(path, size=None):
+    """Called by everything that writes footage; keeps the active RetentionManager's size index current (no-op without one)."""
+    if retention_manager is not None and path:
+        retention_manager.record(path, size)
@@ -0,0 +1,126 @@
+import os,time
+from camera_supervisor_constants import *
+
+
+class AdaptiveFrameScheduler:
+    """Decides per frame whether a camera runs person inference (replaces the fixed FRAME_SKIP = 3).
+
+    idle   - no person/motion recently: infer at most every idle_interval seconds
+    active - person present or motion seen within active_hold seconds: infer every active_interval (0 = every frame)
+
+    On top of that the interval never drops below avg_inference_time / budget, so a camera spends at most
+    `budget` seconds of inference per second, and it is multiplied by a backoff factor (doubling up to
+    max_backoff) while the host load average per core is above load_threshold.
+    """
+
+    def __init__(self, name="DETECT", idle_interval=SCHEDULER_IDLE_INTERVAL, active_interval=SCHEDULER_ACTIVE_INTERVAL,
+                 active_hold=SCHEDULER_ACTIVE_HOLD, budget=SCHEDULER_INFERENCE_BUDGET, load_threshold=SCHEDULER_LOAD_THRESHOLD,
+                 max_backoff=SCHEDULER_MAX_BACKOFF, log_interval=SCHEDULER_LOG_INTERVAL):
+        self.name = name
+        self.idle_interval = idle_interval
+        self.active_interval = active_interval
+        self.active_hold = active_hold
+        self.budget = budget
+        self.load_threshold = load_threshold
+        self.max_backoff = max_backoff
+        self.log_interval = log_interval
+        self.mode = "idle"
+        self.backoff = 1.0
+        self.avg_duration = 0.0     # EWMA of inference time, seconds
+        self.last_inference = 0.0
+        self.last_activity = 0.0
+        self.last_pressure_check = 0.0
+        self.started = self.last_log = time.time()
+        # Counters
+        self.frames = 0
+        self.inferences = 0
+        self.transitions = 0
+        self.window_frames = 0
+        self.window_inferences = 0
+
+    def interval(self):
+        interval = self.active_interval if self.mode == "active" else self.idle_interval
+        if self.budget and self.avg_duration:
+            interval = max(interval, self.avg_duration / self.budget)
+        return interval * self.backoff
+
+    def should_infer(self, now=None, gated=False):
+        """Call once per processed frame. True means run inference on this frame.
+        gated: an earlier cascade stage already ruled the frame out, it is only counted."""
+        now = now or time.time()
+        self.frames += 1
+        self.window_frames += 1
+        if gated or now - self.last_inference < self.interval():
+            return False
+        self.last_inference = now
+        self.inferences += 1
+        self.window_inferences += 1
+        return True
+
+    def record(self, person=None, motion=None, duration=None, now=None):
+        """Feed back what the frame showed. person is None on frames that were not inferred."""
+        now = now or time.time()
+        if duration is not None:
+            self.avg_duration = duration if not self.avg_duration else 0.8 * self.avg_duration + 0.2 * duration
+
+        if person or motion:
+            self.last_activity = now
+            if self.mode != "active":
+                self.set_mode("active", "person" if person else "motion")
+        elif self.mode == "active" and now - self.last_activity > self.active_hold:
+            self.set_mode("idle", f"quiet for {self.active_hold}s")
+
+        if now - self.last_pressure_check >= SCHEDULER_PRESSURE_CHECK:
+            self.last_pressure_check = now
+            self.check_pressure()
+        if self.log_interval and now - self.last_log >= self.log_interval:
+            self.log(now)
+
+    def set_mode(self, mode, reason):
+        print(f"[{self.name}][SCHED] {self.mode} -> {mode} ({reason}), interval={self.interval_for(mode) * 1000:.0f}ms")
+        self.mode = mode
+        self.transitions += 1
+
+    def interval_for(self, mode):
+        current, self.mode = self.mode, mode
+        try:
+            return self.interval()
+        finally:
+            self.mode = current
+
+    def check_pressure(self):
+        try:
+            load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        except (AttributeError, OSError):
+            return  # no load average on this platform, budget still applies
+        if load > self.load_threshold and self.backoff < self.max_backoff:
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+            print(f"[{self.name}][SCHED] CPU pressure (load/core={load:.2f}), backing off x{self.backoff:g}")
+        elif load < self.load_threshold * 0.7 and self.backoff > 1:
+            self.backoff = max(self.backoff / 2, 1.0)
+            print(f"[{self.name}][SCHED] CPU pressure eased (load/core={load:.2f}), backoff x{self.backoff:g}")
+
+    def counters(self):
+        # The fixed scheduler inferred on every 3rd processed frame
+        baseline = self.frames / 3
+        return {
+            "mode": self.mode,
+            "frames": self.frames,
+            "inferences": self.inferences,
+            "transitions": self.transitions,
+            "backoff": self.backoff,
+            "avg_inference_ms": self.avg_duration * 1000,
+            "effective_rate": self.inferences / max(time.time() - self.started, 1e-6),
+            "saved_vs_fixed_pct": (1 - self.inferences / baseline) * 100 if baseline else 0.0,
+        }
+
+    def log(self, now=None):
+        now = now or time.time()
+        elapsed = max(now - self.last_log, 1e-6)
+        c = self.counters()
+        print(f"[{self.name}][SCHED] mode={c['mode']} inference_rate={self.window_inferences / elapsed:.2f}/s "
+              f"({self.window_inferences}/{self.window_frames} frames) backoff=x{c['backoff']:g} "
+              f"avg_inference={c['avg_inference_ms']:.0f}ms saved_vs_fixed={c['saved_vs_fixed_pct']:.0f}%")
+        self.last_log = now
+        self.window_frames = 0
+        self.window_inferences = 0
@@ -0,0 +1,187 @@
+import time,threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+import cv2
+import numpy as np
+from camera_supervisor_constants import *
+
+
+class FrameBoard:
+    """Latest processed frame per camera, for viewers only. Detection loops check `active` first and post
+    nothing (no copy, no drawing, no encoding) while no viewer is attached."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frames = {}        # camera -> (frame, timestamp, info)
+        self.viewers = 0
+
+    @property
+    def active(self):
+        return self.viewers > 0
+
+    def attach(self):
+        with self.lock:
+            self.viewers += 1
+
+    def detach(self):
+        with self.lock:
+            self.viewers -= 1
+            if not self.viewers:
+                self.frames.clear()     # do not hold on to frames nobody will look at
+
+    def post(self, camera, frame, info=None):
+        """frame must not be modified by the caller afterwards (the detection loop hands over its resized copy)."""
+        with self.lock:
+            self.frames[camera] = (frame, time.time(), info or {})
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.frames)
+
+
+# Process-wide board the engine workers post to
+frame_board = FrameBoard()
+
+
+class MosaicViewer:
+    """Renders every camera on a FrameBoard into one downscaled grid, at most max_fps times a second. All the
+    drawing (labels, REC marker, person boxes) happens here on the small cells, in the viewer's thread."""
+
+    def __init__(self, board, cell_width=VIEWER_CELL_WIDTH, max_fps=VIEWER_MAX_FPS, columns=None):
+        self.board = board
+        self.cell_width = cell_width
+        self.cell_height = cell_width * 9 // 16
+        self.max_fps = max_fps
+        self.columns = columns
+        self.canvas = None
+        self.jpeg = None
+        self.jpeg_time = 0.0
+        self.lock = threading.Lock()
+
+    def render(self):
+        frames = self.board.snapshot()
+        names = sorted(frames)
+        count = max(len(names), 1)
+        columns = self.columns or int(np.ceil(np.sqrt(count)))
+        rows = int(np.ceil(count / columns))
+        shape = (rows * self.cell_height, columns * self.cell_width, 3)
+        if self.canvas is None or self.canvas.shape != shape:
+            self.canvas = np.zeros(shape, dtype=np.uint8)
+        else:
+            self.canvas[:] = 0
+        now = time.time()
+        for i, name in enumerate(names):
+            frame, timestamp, info = frames[name]
+            y, x = (i // columns) * self.cell_height, (i % columns) * self.cell_width
+            cell = self.canvas[y:y + self.cell_height, x:x + self.cell_width]
+            frame_h, frame_w = frame.shape[:2]
+            scale = min(self.cell_width / frame_w, self.cell_height / frame_h)
+            w, h = int(frame_w * scale), int(frame_h * scale)
+            cv2.resize(frame, (w, h), dst=cell[:h, :w], interpolation=cv2.INTER_AREA)
+            for x1, y1, x2, y2, _ in info.get("persons") or ():
+                cv2.rectangle(cell, (int(x1 * scale), int(y1 * scale)), (int(x2 * scale), int(y2 * scale)), (0, 255, 0), 1)
+            label = name if now - timestamp < VIEWER_STALE_AFTER else f"{name} (no signal)"
+            cv2.putText(cell, label, (5, 18), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+            if info.get("recording"):
+                cv2.circle(cell, (self.cell_width - 40, 14), 6, (0, 0, 255), -1)
+                cv2.putText(cell, "REC", (self.cell_width - 30, 19), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 0, 255), 1)
+        return self.canvas
+
+    def latest_jpeg(self):
+        """The mosaic as JPEG, rendered at most max_fps times a second however many clients ask for it."""
+        with self.lock:
+            if self.jpeg is None or time.time() - self.jpeg_time >= 1.0 / self.max_fps:
+                ok, encoded = cv2.imencode(".jpg", self.render(), [cv2.IMWRITE_JPEG_QUALITY, VIEWER_JPEG_QUALITY])
+                if ok:
+                    self.jpeg = encoded.tobytes()
+                    self.jpeg_time = time.time()
+            return self.jpeg
+
+    def show(self, stop_event=None, window="Cameras"):
+        """Shows the mosaic in a cv2 window in the calling thread until 'q' is pressed or stop_event is set.
+        Returns True if the user pressed 'q'."""
+        self.board.attach()
+        quit_pressed = False
+        try:
+            while not (stop_event and stop_event.is_set()):
+                started = time.time()
+                cv2.imshow(window, self.render())
+                delay = max(int((1.0 / self.max_fps - (time.time() - started)) * 1000), 1)
+                if cv2.waitKey(delay) & 0xFF == ord('q'):
+                    quit_pressed = True
+                    break
+        finally:
+            self.board.detach()
+            cv2.destroyWindow(window)
+        return quit_pressed
+
+
+class MjpegServer:
+    """Serves the mosaic on a local HTTP port: / (page), /stream (multipart MJPEG), /snapshot.jpg.
+    Each connected /stream client counts as an attached viewer; with none connected the cameras post nothing."""
+
+    def __init__(self, board, host=VIEWER_HOST, port=VIEWER_MJPEG_PORT, cell_width=VIEWER_CELL_WIDTH, max_fps=VIEWER_MAX_FPS):
+        self.board = board
+        self.viewer = MosaicViewer(board, cell_width=cell_width, max_fps=max_fps)
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        viewer, board = self.viewer, self.board
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path == "/":
+                    body = b'<html><body style="margin:0;background:#000"><img src="/stream" style="width:100%"></body></html>'
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                elif path == "/snapshot.jpg":
+                    board.attach()
+                    try:
+                        time.sleep(VIEWER_SNAPSHOT_WAIT)    # give the cameras a moment to post a frame
+                        body = viewer.latest_jpeg() or b""
+                    finally:
+                        board.detach()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "image/jpeg")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                elif path == "/stream":
+                    self.send_response(200)
+                    self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+                    self.end_headers()
+                    board.attach()
+                    try:
+                        while True:
+                            jpeg = viewer.latest_jpeg() or b""
+                            self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: " + str(len(jpeg)).encode() + b"\r\n\r\n" + jpeg + b"\r\n")
+                            time.sleep(1.0 / viewer.max_fps)
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+                    finally:
+                        board.detach()
+                else:
+                    self.send_error(404)
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="mjpeg", daemon=True)
+        self.thread.start()
+        print(f"[VIEWER] Mosaic at http://{self.host}:{self.port}/ (MJPEG /stream, {self.viewer.max_fps} fps)")
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
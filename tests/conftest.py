@@ -0,0 +1,5 @@
+import os,sys
+
+# The modules live flat in the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
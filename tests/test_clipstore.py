@@ -0,0 +1,80 @@
+import struct
+import pytest
+
+pytest.importorskip("cv2")
+from camera_supervisor_recording import Segment
+from camera_supervisor_clipstore import ClipStore, fragment_offsets
+
+VIDEO_TIMESCALE, AUDIO_TIMESCALE = 90000, 48000
+
+
+def box(kind, *payload):
+    body = b"".join(payload)
+    return struct.pack(">I4s", 8 + len(body), kind) + body
+
+
+def full_box(kind, version, *payload):
+    return box(kind, struct.pack(">I", version << 24), *payload)
+
+
+def trak(track_id, handler, timescale):
+    tkhd = full_box(b"tkhd", 0, struct.pack(">III", 0, 0, track_id), bytes(68))
+    mdhd = full_box(b"mdhd", 1, struct.pack(">QQIQ", 0, 0, timescale, 0), bytes(4))
+    hdlr = full_box(b"hdlr", 0, bytes(4), handler, bytes(12), b"\0")
+    return box(b"trak", tkhd, box(b"mdia", mdhd, hdlr))
+
+
+def moof(sequence, track_id, decode_time):
+    traf = box(b"traf", full_box(b"tfhd", 0, struct.pack(">I", track_id)), full_box(b"tfdt", 1, struct.pack(">Q", decode_time)))
+    return box(b"moof", full_box(b"mfhd", 0, struct.pack(">I", sequence)), traf)
+
+
+def write_fragmented_mp4(path, video_times, audio_times):
+    """Layout ffmpeg writes with movflags=+frag_keyframe+empty_moov: ftyp, an empty moov, then moof/mdat pairs.
+    Returns the byte offsets of the video moof boxes."""
+    data = box(b"ftyp", b"isom", bytes(4)) + box(b"moov", trak(1, b"vide", VIDEO_TIMESCALE), trak(2, b"soun", AUDIO_TIMESCALE))
+    offsets, sequence = [], 1
+    for kind, t in sorted([("v", t) for t in video_times] + [("a", t) for t in audio_times], key=lambda e: e[1]):
+        if kind == "v":
+            offsets.append(len(data))
+            data += moof(sequence, 1, int(t * VIDEO_TIMESCALE))
+        else:
+            data += moof(sequence, 2, int(t * AUDIO_TIMESCALE))
+        data += box(b"mdat", bytes(100 * sequence))
+        sequence += 1
+    with open(path, "wb") as f:
+        f.write(data)
+    return offsets
+
+
+def test_fragment_offsets_follow_the_video_track(tmp_path):
+    path = str(tmp_path / "seg.mp4")
+    offsets = write_fragmented_mp4(path, [0.5, 2.5, 4.5], [0.6, 3.0])
+    # times are relative to the first video fragment, audio fragments are ignored
+    assert fragment_offsets(path) == [(0.0, offsets[0]), (2.0, offsets[1]), (4.0, offsets[2])]
+
+
+def test_locate_returns_the_keyframe_fragment_holding_the_timestamp(tmp_path):
+    store = ClipStore(str(tmp_path))
+    path = str(tmp_path / "seg.mp4")
+    offsets = write_fragmented_mp4(path, [0.0, 2.0, 4.0], [1.0])
+    segment = Segment(path, 1000.0, 1006.0)
+    store.add(segment)
+    assert store.locate(1000.0) == (segment, offsets[0])
+    assert store.locate(1001.9) == (segment, offsets[0])
+    assert store.locate(1002.0) == (segment, offsets[1])
+    assert store.locate(1005.5) == (segment, offsets[2])
+    assert store.locate(999.0) == (None, 0)
+    assert store.locate(1006.0) == (None, 0)
+    store.remove([path])
+    assert store.fragments == {} and store.locate(1002.0) == (None, 0)
+
+
+def test_locate_falls_back_to_the_segment_start_when_unfragmented(tmp_path):
+    store = ClipStore(str(tmp_path))
+    path = str(tmp_path / "plain.mp4")
+    with open(path, "wb") as f:
+        f.write(box(b"ftyp", b"isom", bytes(4)) + box(b"moov", trak(1, b"vide", VIDEO_TIMESCALE)) + box(b"mdat", bytes(5000)))
+    segment = Segment(path, 0.0, 10.0)
+    store.add(segment)
+    assert store.locate(9.0) == (segment, 0)
@@ -0,0 +1,105 @@
+import os,json,time
+from camera_supervisor_events import EventBus, MqttSink, make_event
+
+
+class InMemoryMqttClient:
+    """The part of the paho-mqtt client MqttSink uses, recording publishes instead of sending them."""
+
+    def __init__(self):
+        self.published = []     # (topic, payload dict, qos)
+        self.connected = None
+        self.running = False
+
+    def username_pw_set(self, username, password):
+        self.credentials = (username, password)
+
+    def connect_async(self, host, port):
+        self.connected = (host, port)
+
+    def loop_start(self):
+        self.running = True
+
+    def loop_stop(self):
+        self.running = False
+
+    def disconnect(self):
+        self.connected = None
+
+    def publish(self, topic, payload, qos=0):
+        self.published.append((topic, json.loads(payload), qos))
+
+
+class BatchRecorder:
+    """Sink that only records the size of each batch the bus hands out."""
+
+    def __init__(self):
+        self.sizes = []
+
+    def publish(self, batch):
+        self.sizes.append(len(batch))
+
+    def close(self):
+        pass
+
+
+def mqtt_bus(**kwargs):
+    client = InMemoryMqttClient()
+    sink = MqttSink("broker", 1884, "cams", 1, "user", "pw", client_factory=lambda: client)
+    batches = BatchRecorder()
+    return EventBus([sink, batches], **kwargs), client, batches
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_events_are_published_in_batches(tmp_path):
+    bus, client, batches = mqtt_bus(batch_size=3, max_wait=0.05, spill_path=str(tmp_path / "spill.jsonl"))
+    assert client.connected == ("broker", 1884) and client.credentials == ("user", "pw") and client.running
+    # Queued before the bus thread starts, so the batches are deterministic
+    for i in range(7):
+        bus.publish(make_event("person", f"cam{i}", boxes=[(0, 0, 10, 10, 0.5)]))
+    bus.start()
+    bus.stop()
+    assert batches.sizes == [3, 3, 1]
+    assert [topic for topic, _, _ in client.published] == [f"cams/cam{i}/person" for i in range(7)]
+    assert all(qos == 1 for _, _, qos in client.published)
+    assert bus.counters()["published"] == 7
+    assert client.connected is None and not client.running
+
+
+def test_repeated_events_are_coalesced(tmp_path):
+    bus, client, _ = mqtt_bus(coalesce=2.0, spill_path=str(tmp_path / "spill.jsonl"))
+    now = time.time()
+    bus.publish(make_event("person", "cam1", now, boxes=[(0, 0, 10, 10, 0.4)]))
+    bus.publish(make_event("person", "cam1", now + 0.5, boxes=[(5, 5, 20, 20, 0.9)]))
+    bus.publish(make_event("person", "cam1", now + 1.0, boxes=[(6, 6, 21, 21, 0.6)]))
+    bus.publish(make_event("person", "cam1", now + 5.0))     # past the window: a new event
+    bus.publish(make_event("motion", "cam1", now + 0.2))     # other type: not merged
+    bus.start()
+    bus.stop()
+    events = [(topic, event) for topic, event, _ in client.published]
+    assert [topic for topic, _ in events] == ["cams/cam1/person", "cams/cam1/person", "cams/cam1/motion"]
+    merged = events[0][1]
+    assert merged["count"] == 3 and merged["timestamp"] == now and merged["last_timestamp"] == now + 1.0
+    assert merged["boxes"] == [[6, 6, 21, 21, 0.6]] and merged["confidence"] == 0.9
+    assert bus.counters()["coalesced"] == 2
+
+
+def test_overflow_spills_and_replays_in_order_counting_each_event_once(tmp_path):
+    spill_path = str(tmp_path / "spill.jsonl")
+    bus, client, _ = mqtt_bus(queue_size=2, drop_policy="spill", max_wait=0.05, spill_path=spill_path)
+    for i in range(5):
+        bus.publish(make_event("person", f"cam{i}"))
+    assert bus.counters()["spilled"] == 3 and bus.counters()["queue_depth"] == 2
+    # Replay takes 2 of the 3 spilled events back into the queue and re-spills the last one
+    bus.start()
+    assert wait_for(lambda: bus.counters()["published"] == 5)
+    bus.stop()
+    assert [topic for topic, _, _ in client.published] == [f"cams/cam{i}/person" for i in range(5)]
+    counters = bus.counters()
+    assert counters["spilled"] == 3 and counters["dropped"] == 0
+    assert not os.path.exists(spill_path)
@@ -0,0 +1,24 @@
+import os,sys,json,socket,subprocess
+import pytest
+from conftest import ROOT
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_fleet_stdout_is_only_the_json_report(tmp_path):
+    # camera_supervisor.py imports the components (cv2) and reads the YAML config
+    pytest.importorskip("cv2")
+    pytest.importorskip("yaml")
+    config = tmp_path / "cameras.yml"
+    config.write_text(f"camera_details:\n  cam1:\n    camera_ip: 127.0.0.1\n    camera_port: {free_port()}\n    onvif_port: {free_port()}\n"
+                      "    camera_username: user\n    camera_password: pass\n")
+    result = subprocess.run([sys.executable, os.path.join(ROOT, "camera_supervisor.py"), "ping", "--cameras", "cam1", "--config", str(config)],
+                            cwd=tmp_path, capture_output=True, text=True, timeout=60)
+    report = json.loads(result.stdout)      # nothing but the report on stdout, warnings and logs included
+    assert report["command"] == "ping"
+    assert report["results"]["cam1"]["status"] == "offline"
+    assert result.returncode == 1
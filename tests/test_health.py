@@ -0,0 +1,136 @@
+import re,socket,asyncio,hashlib
+from types import SimpleNamespace
+from camera_supervisor_health import check_camera
+
+REALM, NONCE = "IP Camera", "4f1b2c3d"
+SDP = "v=0\r\no=- 0 0 IN IP4 127.0.0.1\r\ns=stub\r\nt=0 0\r\nm=video 0 RTP/AVP 96\r\na=rtpmap:96 H264/90000\r\n"
+
+
+def md5(text):
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+class StubRtspServer:
+    """Answers OPTIONS, and DESCRIBE with a 401 Digest challenge until the request carries the right Digest
+    response (RFC 2069, no qop), then with `sdp`. Records (method, headers) of every request."""
+
+    def __init__(self, username="admin", password="secret", sdp=SDP):
+        self.username = username
+        self.password = password
+        self.sdp = sdp
+        self.requests = []
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def authorized(self, method, header):
+        fields = dict(re.findall(r'(\w+)="([^"]*)"', header or ""))
+        if not header or not header.startswith("Digest ") or fields.get("username") != self.username:
+            return False
+        ha1 = md5(f"{self.username}:{REALM}:{self.password}")
+        return fields.get("response") == md5(f"{ha1}:{NONCE}:{md5(method + ':' + fields.get('uri', ''))}")
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                lines = (await reader.readuntil(b"\r\n\r\n")).decode().split("\r\n")
+                method = lines[0].split()[0]
+                headers = {key.strip().lower(): value.strip() for key, _, value in (line.partition(":") for line in lines[1:] if ":" in line)}
+                self.requests.append((method, headers))
+                reply, body = {"CSeq": headers["cseq"]}, ""
+                if method == "OPTIONS":
+                    status, reply["Public"] = "200 OK", "OPTIONS, DESCRIBE"
+                elif self.authorized(method, headers.get("authorization")):
+                    status, body, reply["Content-Type"] = "200 OK", self.sdp, "application/sdp"
+                else:
+                    status, reply["WWW-Authenticate"] = "401 Unauthorized", f'Digest realm="{REALM}", nonce="{NONCE}"'
+                reply["Content-Length"] = len(body.encode())
+                head = "".join(f"{key}: {value}\r\n" for key, value in reply.items())
+                writer.write(f"RTSP/1.0 {status}\r\n{head}\r\n{body}".encode())
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+class FakeGrabber:
+    def __init__(self, fresh):
+        self.fresh = fresh
+
+    def is_running(self):
+        return True
+
+    def is_fresh(self):
+        return self.fresh
+
+
+def closed_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def camera(port, onvif_port=None, password="secret", grabber=None):
+    return SimpleNamespace(ip="127.0.0.1", camera_port=port, onvif_port=onvif_port or closed_port(), stream_path="stream1",
+                           username="admin", password=password, grabber=grabber, rtsp_url=f"rtsp://127.0.0.1:{port}/stream1")
+
+
+def check(stub_kwargs=None, decode=False, **camera_kwargs):
+    async def run():
+        stub = await StubRtspServer(**(stub_kwargs or {})).start()
+        try:
+            return await check_camera(camera(stub.port, **camera_kwargs), decode=decode, tcp_timeout=2, rtsp_timeout=2), stub
+        finally:
+            await stub.close()
+    return asyncio.run(run())
+
+
+def test_digest_challenge_is_answered_and_camera_is_online():
+    result, stub = check()
+    assert result["status"] == "online" and result["tier"] is None and result["error"] is None
+    assert result["tcp_ms"] is not None and result["rtsp_ms"] is not None
+    assert [method for method, _ in stub.requests] == ["OPTIONS", "DESCRIBE", "DESCRIBE"]
+    assert "authorization" not in stub.requests[1][1] and stub.requests[2][1]["authorization"].startswith("Digest ")
+    assert result["decoded"] is None and result["onvif"] is False
+
+
+def test_wrong_password_fails_the_rtsp_tier():
+    result, stub = check(password="wrong")
+    assert result["status"] == "degraded" and result["tier"] == "rtsp"
+    assert "401" in result["error"] and result["tcp_ms"] is not None and result["rtsp_ms"] is None
+
+
+def test_sdp_without_video_fails_the_rtsp_tier():
+    result, _ = check({"sdp": "v=0\r\nm=audio 0 RTP/AVP 0\r\n"})
+    assert result["status"] == "degraded" and result["tier"] == "rtsp" and "video" in result["error"]
+
+
+def test_closed_port_fails_the_tcp_tier():
+    result = asyncio.run(check_camera(camera(closed_port()), tcp_timeout=2, rtsp_timeout=2))
+    assert result["status"] == "offline" and result["tier"] == "tcp"
+    assert result["error"].startswith("tcp:") and result["tcp_ms"] is None
+
+
+def test_onvif_port_is_reported_separately():
+    async def run():
+        stub = await StubRtspServer().start()
+        try:
+            return await check_camera(camera(stub.port, onvif_port=stub.port), tcp_timeout=2, rtsp_timeout=2)
+        finally:
+            await stub.close()
+    assert asyncio.run(run())["onvif"] is True
+
+
+def test_decode_tier_uses_the_running_grabber():
+    result, _ = check(decode=True, grabber=FakeGrabber(fresh=True))
+    assert result["status"] == "online" and result["decoded"] is True
+    result, _ = check(decode=True, grabber=FakeGrabber(fresh=False))
+    assert result["status"] == "degraded" and result["tier"] == "decode" and result["decoded"] is False
+    assert result["rtsp_ms"] is not None
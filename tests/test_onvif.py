@@ -0,0 +1,116 @@
+import re,time,threading,urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+from camera_supervisor_onvif import OnvifClient, OnvifControlPlane
+
+ENVELOPE = '<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope"><s:Body>{}</s:Body></s:Envelope>'
+
+
+class StubSoapServer:
+    """Local SOAP endpoint that answers every operation with an empty <Operation>Response and records
+    (time received, service path, operation). `delay` keeps each request on the wire for a while."""
+
+    def __init__(self, delay=0.0):
+        self.calls = []
+        self.delay = delay
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"])).decode()
+                operation = re.search(r"<(?:\w+:)?Body[^>]*>\s*<(?:\w+:)?(\w+)", body).group(1)
+                stub.calls.append((time.time(), self.path, operation))
+                time.sleep(stub.delay)
+                response = ENVELOPE.format(f"<{operation}Response/>").encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/soap+xml")
+                self.send_header("Content-Length", str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def operations(self, name=None):
+        return [operation for _, _, operation in self.calls if name is None or operation == name]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SoapService:
+    """Just enough of a zeep service proxy for the control plane: create_type() and operations posted as SOAP."""
+
+    def __init__(self, url):
+        self.url = url
+
+    def create_type(self, name):
+        return type(name, (), {})()
+
+    def __getattr__(self, operation):
+        def call(*args):
+            body = ENVELOPE.format(f"<tns:{operation} xmlns:tns=\"http://www.onvif.org/ver20/ptz/wsdl\"/>").encode()
+            request = urllib.request.Request(self.url, body, {"Content-Type": "application/soap+xml"})
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return response.status == 200
+        return call
+
+
+@pytest.fixture
+def stub():
+    server = StubSoapServer(delay=0.2)
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def plane(stub):
+    connects = []
+
+    def client_factory(host, port, username, password):
+        connects.append((host, port, username, password))
+        return OnvifClient(None, SoapService(stub.url + "/media"), SoapService(stub.url + "/ptz"), SoapService(stub.url + "/device"), "profile_1")
+    plane = OnvifControlPlane(client_factory, max_workers=2)
+    plane.connects = connects
+    yield plane
+    plane.shutdown()
+
+
+def test_register_and_warm_up_connect_once(plane):
+    key = plane.register("10.0.0.5", "2020", "admin", "secret")
+    assert key == ("10.0.0.5", 2020, "admin")
+    assert plane.register("10.0.0.5", 2020, "admin", "secret") == key
+    assert plane.warm_up(key).result(5) is True
+    assert plane.profiles(key).result(5) is True
+    assert plane.connects == [("10.0.0.5", 2020, "admin", "secret")]
+
+
+def test_move_burst_merges_and_stops_once_after_the_last_move(plane, stub):
+    key = plane.register("10.0.0.5", 2020, "admin", "secret")
+    plane.warm_up(key).result(5)
+    # The first move is on the wire (stub delay) while the rest queue up and collapse into the newest one
+    futures = [plane.move(key, 0.1, 0.0, 0.5)]
+    while not stub.calls:
+        time.sleep(0.01)
+    futures += [plane.move(key, 0.1 * i, 0.0, 0.5) for i in range(2, 6)]
+    assert all(future.result(5) for future in futures)
+    assert stub.operations("ContinuousMove") == ["ContinuousMove"] * 2
+    assert plane.queues[key].counters()["merged"] == 3
+    last_move = max(t for t, _, operation in stub.calls if operation == "ContinuousMove")
+    time.sleep(1.5)
+    stops = [t for t, _, operation in stub.calls if operation == "Stop"]
+    assert len(stops) == 1      # the first move's timer found the deadline extended and skipped
+    assert stops[0] >= last_move + 0.5 - 0.05
+    assert plane.queues[key].counters()["moving"] is False
+
+
+def test_reboot_goes_to_the_device_service(plane, stub):
+    key = plane.register("10.0.0.5", 2020, "admin", "secret")
+    assert plane.reboot(key).result(5) is True
+    assert [(path, operation) for _, path, operation in stub.calls] == [("/device", "SystemReboot")]
@@ -0,0 +1,62 @@
+import os
+import pytest
+
+pytest.importorskip("cv2")
+from camera_supervisor_constants import RECORDING_SEGMENT_LIST_SIZE
+from camera_supervisor_recording import Segment, SegmentRecorder
+
+
+def write_list(recorder, entries, partial=""):
+    """Writes segments.csv the way ffmpeg does with -segment_list_size: the whole (trimmed) list each time."""
+    with open(recorder.list_path, "w") as f:
+        f.write("".join(f"{name},{start:.6f},{end:.6f}\n" for name, start, end in entries) + partial)
+
+
+def touch(recorder, name, mtime):
+    path = os.path.join(recorder.segment_dir, name)
+    open(path, "wb").close()
+    os.utime(path, (mtime, mtime))
+
+
+def test_segments_are_numbered_per_launch(tmp_path):
+    recorder = SegmentRecorder("rtsp://cam/stream1", str(tmp_path))
+    recorder.launch_id = "20261018_120000_123"
+    command = recorder.command()
+    assert command[-1] == os.path.join(str(tmp_path), "seg_20261018_120000_123_%05d.mp4")
+    assert "-strftime" not in command
+    assert command[command.index("-segment_list_size") + 1] == str(RECORDING_SEGMENT_LIST_SIZE)
+    assert len(os.path.basename(command[-1]) % 99999) <= 48    # fits the ClipStore index
+
+
+def test_poll_collects_each_segment_once_from_a_trimmed_list(tmp_path):
+    recorder = SegmentRecorder("rtsp://cam/stream1", str(tmp_path), segment_time=1)
+    collected = []
+    recorder.on_segment.append(collected.append)
+    recorder.launch_id = "20261018_120000_123"
+    prefix = "seg_20261018_120000_123_"
+    touch(recorder, prefix + "00000.mp4", 1000.0)
+    # A previous launch's entries are still in the list until the new ffmpeg rewrites it
+    write_list(recorder, [("seg_20261018_115959_001_00007.mp4", 7.0, 8.0), (prefix + "00000.mp4", 0.5, 1.0)],
+               partial=prefix + "00001.mp4,1.0")
+    recorder.poll()
+    assert [(os.path.basename(s.path), s.start, s.end) for s in collected] == [(prefix + "00000.mp4", 999.5, 1000.0)]
+    # Sub-second segments get distinct names; the list only keeps the newest entries
+    write_list(recorder, [(prefix + "00001.mp4", 1.0, 1.4), (prefix + "00002.mp4", 1.4, 1.8)])
+    recorder.poll()
+    write_list(recorder, [(prefix + "00002.mp4", 1.4, 1.8), (prefix + "00003.mp4", 1.8, 2.2)])
+    recorder.poll()
+    recorder.poll()
+    assert [os.path.basename(s.path)[len(prefix):] for s in collected] == ["00000.mp4", "00001.mp4", "00002.mp4", "00003.mp4"]
+    assert [round(s.start, 6) for s in collected] == [999.5, 1000.0, 1000.4, 1000.8]
+    assert recorder.completed_until() == pytest.approx(1001.2)
+
+
+def test_pinned_paths_cover_the_segments_an_event_still_needs(tmp_path):
+    recorder = SegmentRecorder("rtsp://cam/stream1", str(tmp_path), keep=None)
+    recorder.segments.extend(Segment(str(tmp_path / f"seg_x_{i:05d}.mp4"), 100.0 + 10 * i, 110.0 + 10 * i) for i in range(4))
+    assert recorder.pinned_paths() == set()
+    recorder.pin(1, 125.0)
+    recorder.pin(2, 131.0)
+    assert recorder.pinned_paths() == {os.path.abspath(str(tmp_path / f"seg_x_{i:05d}.mp4")) for i in (2, 3)}
+    recorder.unpin(1)
+    assert recorder.pinned_paths() == {os.path.abspath(str(tmp_path / "seg_x_00003.mp4"))}
@@ -0,0 +1,58 @@
+import os,time
+from camera_supervisor_retention import RetentionManager
+
+
+def write(path, size, age):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(bytes(size))
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return os.path.abspath(path)
+
+
+def manager(tmp_path, **kwargs):
+    retention = RetentionManager(roots=[str(tmp_path / "videos")], **kwargs)
+    retention.scan()
+    return retention
+
+
+def test_expired_segments_pinned_by_an_event_are_kept(tmp_path):
+    continuous = tmp_path / "videos" / "cam1" / "continuous"
+    old = write(str(continuous / "seg_a_00000.mp4"), 100, 7200)
+    pinned = write(str(continuous / "seg_a_00001.mp4"), 100, 7100)
+    retention = manager(tmp_path, max_age={"continuous": 3600})
+    retention.protectors.append(lambda: {pinned})
+    deleted = []
+    retention.on_delete.append(deleted.extend)
+    retention.prune()
+    assert deleted == [old] and not os.path.exists(old)
+    assert os.path.exists(pinned) and pinned in retention.files
+
+
+def test_quota_skips_pinned_segments_and_takes_the_next_oldest(tmp_path):
+    continuous = tmp_path / "videos" / "cam1" / "continuous"
+    pinned = write(str(continuous / "seg_a_00000.mp4"), 100, 300)
+    older = write(str(continuous / "seg_a_00001.mp4"), 100, 200)
+    newest = write(str(continuous / "seg_a_00002.mp4"), 100, 100)
+    retention = manager(tmp_path, camera_quota=250)
+    retention.protectors.append(lambda: {pinned})
+    retention.prune()
+    assert os.path.exists(pinned) and not os.path.exists(older) and os.path.exists(newest)
+    assert retention.total_bytes == 200
+
+
+def test_paths_pinned_after_candidates_are_rechecked_before_deleting(tmp_path):
+    path = write(str(tmp_path / "videos" / "cam1" / "continuous" / "seg_a_00000.mp4"), 100, 7200)
+    retention = manager(tmp_path, max_age={"continuous": 3600})
+    pins = set()
+    retention.protectors.append(lambda: set(pins))
+    candidates = retention.candidates
+
+    def pin_meanwhile(now):
+        doomed = candidates(now)
+        pins.add(path)      # an event starts between selection and deletion
+        return doomed
+    retention.candidates = pin_meanwhile
+    retention.prune()
+    assert os.path.exists(path)